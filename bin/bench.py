@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+""" The jpamb benchmarks
+"""
+
+import click
+import os
+from pathlib import Path
+from time import perf_counter_ns
+
+from utils import *
+
+WORKFOLDER = Path(os.path.abspath(__file__)).parent.parent
+
+# The working directory the command was started in, before moving to the
+# WORKFOLDER.
+CWD = Path.cwd()
+
+
+@click.group()
+def bench():
+    """Benchmark parts of the jpamb tooling."""
+    os.chdir(WORKFOLDER)
+
+
+@bench.command()
+@click.option(
+    "--filter-methods",
+    help="only take methods that matches the regex.",
+    default=r"jpamb\.cases\.Loops",
+    show_default=True,
+    callback=re_parser,
+)
+@click.option(
+    "--limit",
+    show_default=True,
+    default=1_000_000,
+    help="the maximal number of steps per case.",
+)
+@click.option(
+    "--detect-cycles/--no-detect-cycles",
+    show_default=True,
+    default=False,
+    help="stop infinite loops when a state repeats, instead of at the limit.",
+)
+@click.option("-v", "--verbose", count=True)
+def interpreter(filter_methods, limit, detect_cycles, verbose):
+    """Measure the steps per second of the interpreter in jpamb_utils."""
+    from jpamb_utils.interpreter import Code, Interpreter
+
+    logger = setup_logger(verbose)
+    suite = Suite(WORKFOLDER, QUERIES, logger)
+
+    total_steps, total_ns = 0, 0
+    for case in suite.cases():
+        if not filter_methods.search(str(case.methodid)):
+            continue
+        code = Code.load(case.methodid)
+        interpreter = Interpreter(limit=limit, detect_cycles=detect_cycles)
+        start = perf_counter_ns()
+        result = interpreter.run(code, list(case.input.val))
+        time_ns = perf_counter_ns() - start
+        total_steps += interpreter.steps
+        total_ns += time_ns
+        logger.success(
+            f"{case!s:<74}: {result!r:<17} {interpreter.steps:>9} steps"
+            f" in {time_ns / 1_000_000:7.1f}ms"
+            f" ({interpreter.steps / time_ns * 1_000:0.2f}M steps/s)"
+        )
+
+    if total_ns:
+        logger.success(
+            f"Total: {total_steps} steps in {total_ns / 1_000_000:0.1f}ms"
+            f" ({total_steps / total_ns * 1_000:0.2f}M steps/s)"
+        )
+
+
+@bench.command("input-parser")
+@click.option(
+    "--sizes",
+    show_default=True,
+    default="10,100,1000,10000,100000,1000000",
+    help="the comma separated numbers of array elements to parse.",
+)
+@click.option("--seed", show_default=True, default=0)
+@click.option("-v", "--verbose", count=True)
+def input_parser(sizes, seed, verbose):
+    """Measure the time it takes to parse inputs with large arrays."""
+    import random
+
+    logger = setup_logger(verbose)
+    rng = random.Random(seed)
+
+    for size in map(int, sizes.split(",")):
+        ints = ", ".join(str(rng.randint(-(2**31), 2**31 - 1)) for _ in range(size))
+        chars = ", ".join(f"'{rng.choice('abcdefghij')}'" for _ in range(size))
+        for kind, string in [("int", f"([I:{ints}])"), ("char", f"([C:{chars}])")]:
+            for validate in [False, True]:
+                start = perf_counter_ns()
+                Input.parse(string, validate=validate)
+                time_ns = perf_counter_ns() - start
+                logger.success(
+                    f"{kind:>4}[{size:>7}] {'validated' if validate else 'parsed':>9}"
+                    f" in {time_ns / 1_000_000:9.2f}ms"
+                    f" ({size / time_ns * 1_000:0.2f}M elements/s)"
+                )
+
+
+@bench.command()
+@click.option(
+    "--filter-methods",
+    help="only take methods that matches the regex.",
+    default=r"jpamb\.cases\.(Simple|Loops)",
+    show_default=True,
+    callback=re_parser,
+)
+@click.option(
+    "--lanes",
+    show_default=True,
+    default=10_000,
+    help="the number of random inputs run at once.",
+)
+@click.option(
+    "--sample",
+    show_default=True,
+    default=100,
+    help="the number of the inputs also run one at a time.",
+)
+@click.option(
+    "--limit",
+    show_default=True,
+    default=10_000,
+    help="the maximal number of steps per input.",
+)
+@click.option("--seed", show_default=True, default=0)
+@click.option("-v", "--verbose", count=True)
+def lanes(filter_methods, lanes, sample, limit, seed, verbose):
+    """Measure the inputs per second of the lane interpreter in jpamb_utils,
+    against running the inputs one at a time."""
+    import numpy as np
+    from jpamb_utils import BoolValue, CharValue, IntValue
+    from jpamb_utils.interpreter import Code, Interpreter, Unsupported
+    from jpamb_utils.lanes import LaneInterpreter, summarize as summarize_outcomes
+
+    logger = setup_logger(verbose)
+    suite = Suite(WORKFOLDER, QUERIES, logger)
+    rng = np.random.default_rng(seed)
+
+    # The random columns of each type, and how to make input values of them
+    generators = {
+        "int": (lambda n: rng.integers(-(2**31), 2**31, n), IntValue),
+        "boolean": (lambda n: rng.integers(0, 2, n), lambda v: BoolValue(v == 1)),
+        "char": (lambda n: rng.integers(32, 127, n), lambda v: CharValue(chr(v))),
+    }
+
+    for methodid, _ in Case.by_methodid(suite.cases()):
+        if not filter_methods.search(str(methodid)):
+            continue
+        if any(p not in generators for p in methodid.params):
+            logger.warning(f"Skipping {methodid}, it takes arrays")
+            continue
+        code = Code.load(methodid)
+        columns = [generators[p][0](lanes) for p in methodid.params]
+
+        interpreter = LaneInterpreter(limit=limit)
+        start = perf_counter_ns()
+        summary = summarize_outcomes(interpreter.run_columns(code, columns, lanes))
+        lanes_ns = perf_counter_ns() - start
+
+        inputs = [
+            [generators[p][1](int(c[i])) for p, c in zip(methodid.params, columns)]
+            for i in range(min(sample, lanes))
+        ]
+        interpreter = Interpreter(limit=limit)
+        start = perf_counter_ns()
+        for input in inputs:
+            try:
+                interpreter.run(code, input)
+            except Unsupported:
+                pass
+        single_ns = (perf_counter_ns() - start) / len(inputs) * lanes
+
+        logger.success(
+            f"{str(methodid):<50}: {lanes / lanes_ns * 1e9:>12,.0f} inputs/s"
+            f" ({single_ns / lanes_ns:7.1f}x one at a time) {summary}"
+        )
+
+
+def harness_benchmarks(suite: Suite) -> dict[str, tuple[Callable, list]]:
+    """The benchmarks of the harness, by name, with the items they work on.
+
+    Each benchmark is a function called once per item, and the time is
+    reported per call.
+    """
+    import shutil
+    import subprocess
+    import jpamb_utils
+    from jpamb_utils.cases import parse_case
+    from jpamb_utils.features import FeatureTable
+
+    with open(suite.stats_folder() / "cases.txt") as f:
+        lines = [line.rstrip("\n") for line in f]
+    specs = [parse_case(line) for line in lines]
+    methods = sorted({m for m, _, _ in specs})
+    methodids = [MethodId.parse(m) for m in methods]
+    inputs = [i for _, i, _ in specs]
+    wagers = ["0%", "5%", "50%", "95%", "100%", "-3", "0.5", "inf", "-inf"]
+    predictions = [Prediction.parse(w) for w in wagers]
+    probabilities = [i / 20 for i in range(21)]
+    noop = [shutil.which("true") or sys.executable]
+
+    def load_from_disk(methodid):
+        # Forget the classes loaded in memory, so they are read from the cache
+        jpamb_utils._CACHE.clear()
+        methodid.load()
+
+    def run_cmd_noop(_):
+        run_cmd(noop, timeout=10, logger=suite.logger)
+
+    def subprocess_noop(_):
+        subprocess.run(noop, check=True, capture_output=True, timeout=10)
+
+    return {
+        "MethodId.parse": (MethodId.parse, methods),
+        "MethodId.__str__": (str, methodids),
+        "InputParser.parse": (lambda i: list(InputParser.parse(i)), inputs),
+        "Case.from_spec": (Case.from_spec, lines),
+        "Suite.cases": (lambda _: list(suite.cases()), [None]),
+        "Prediction.parse": (Prediction.parse, wagers),
+        "Prediction.score": (lambda p: (p.score(True), p.score(False)), predictions),
+        "Prediction.from_probability": (Prediction.from_probability, probabilities),
+        "MethodId.load": (MethodId.load, methodids),
+        "MethodId.load (disk)": (load_from_disk, methodids),
+        "MethodId.source": (MethodId.source, methodids),
+        "FeatureTable.load": (lambda _: FeatureTable.load(), [None]),
+        # What the tools call, which also checks the table is up to date
+        "FeatureTable.load_or_build": (lambda _: FeatureTable.load_or_build(), [None]),
+        "subprocess.run (noop)": (subprocess_noop, [None]),
+        "run_cmd (noop)": (run_cmd_noop, [None]),
+    }
+
+
+def measure(function, items, warmup, repetitions, min_time_ns) -> list[float]:
+    """The nanoseconds per call of the function, in each repetition.
+
+    Like `timeit`, the number of rounds over the items in a repetition is
+    chosen so that it takes at least `min_time_ns`, and the garbage
+    collector is disabled while measuring.
+    """
+    import gc
+
+    def run(rounds):
+        gc.collect()
+        gc.disable()
+        try:
+            start = perf_counter_ns()
+            for _ in range(rounds):
+                for item in items:
+                    function(item)
+            return perf_counter_ns() - start
+        finally:
+            gc.enable()
+
+    rounds = 1
+    while run(rounds) < min_time_ns:
+        rounds *= 2
+    for _ in range(warmup):
+        run(rounds)
+    return [run(rounds) / (rounds * len(items)) for _ in range(repetitions)]
+
+
+def summarize(times: list[float]) -> dict:
+    import statistics
+
+    q1, median, q3 = statistics.quantiles(times, n=4) if len(times) > 1 else times * 3
+    return {
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "min": min(times),
+        "max": max(times),
+        "iqr": q3 - q1,
+        "times": times,
+    }
+
+
+def format_ns(ns: float) -> str:
+    for unit, scale in [("s", 1e9), ("ms", 1e6), ("us", 1e3)]:
+        if ns >= scale:
+            return f"{ns / scale:0.2f}{unit}"
+    return f"{ns:0.1f}ns"
+
+
+@bench.command()
+@click.option(
+    "--filter",
+    "filter_names",
+    help="only run the benchmarks with a name that matches the regex.",
+    default=".*",
+    callback=re_parser,
+)
+@click.option("--warmup", show_default=True, default=1, help="untimed repetitions.")
+@click.option("--repetitions", show_default=True, default=10)
+@click.option(
+    "--min-time",
+    show_default=True,
+    default=0.05,
+    help="the minimal time of a repetition in seconds.",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="save the results as json.",
+)
+@click.option(
+    "--compare",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="compare the results with a saved baseline.",
+)
+@click.option(
+    "--threshold",
+    show_default=True,
+    default=0.2,
+    help="the relative slowdown which is reported as a regression.",
+)
+@click.option("-v", "--verbose", count=True)
+def harness(
+    filter_names,
+    warmup,
+    repetitions,
+    min_time,
+    output,
+    compare,
+    threshold,
+    verbose,
+):
+    """Measure the overhead of the hot paths of the harness.
+
+    With `--compare`, the command fails if the fastest repetition of a
+    benchmark got slower than the one of the baseline by more than the
+    threshold. Compare with a baseline from the same, otherwise idle, machine.
+    """
+    import json
+    import platform
+    from datetime import datetime
+
+    logger = setup_logger(verbose)
+    suite = Suite(WORKFOLDER, QUERIES, logger)
+
+    baseline = {}
+    if compare:
+        with open(CWD / compare) as f:
+            baseline = json.load(f)["benchmarks"]
+
+    results = {}
+    regressions = []
+    for name, (function, items) in harness_benchmarks(suite).items():
+        if not filter_names.search(name):
+            continue
+        times = measure(function, items, warmup, repetitions, min_time * 1e9)
+        results[name] = summary = summarize(times)
+
+        line = (
+            f"{name:<28} {format_ns(summary['median']):>9}/call"
+            f" ± {format_ns(summary['iqr'] / 2):>9}"
+            f" (min {format_ns(summary['min'])})"
+        )
+        if name in baseline:
+            # The minimum is the least affected by noise from other processes
+            ratio = summary["min"] / baseline[name]["min"]
+            line += f" {ratio:6.2f}x baseline"
+            if ratio > 1 + threshold:
+                regressions.append(name)
+                logger.warning(line)
+                continue
+        logger.success(line)
+
+    if output:
+        with open(CWD / output, "w") as f:
+            json.dump(
+                {
+                    "timestamp": int(datetime.now().timestamp() * 1000),
+                    "machine": {
+                        "platform": platform.platform(),
+                        "processor": platform.processor(),
+                        "python": platform.python_version(),
+                    },
+                    "settings": {
+                        "warmup": warmup,
+                        "repetitions": repetitions,
+                        "min_time": min_time,
+                    },
+                    "benchmarks": results,
+                },
+                f,
+                indent=2,
+            )
+        logger.success(f"Written results to {str(output)!r}")
+
+    if regressions:
+        logger.error(
+            f"{len(regressions)} benchmarks are more than {threshold:0.0%} slower"
+            f" than the baseline: {', '.join(regressions)}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    bench()
@@ -11,22 +11,49 @@ WORKFOLDER = Path(os.path.abspath(__file__)).parent.parent
 
 @click.command()
 @click.option("--check/--no-check", default=True)
+@click.option(
+    "--batch/--no-batch",
+    default=True,
+    help="check all cases in a single jvm, instead of one jvm per case.",
+)
+@click.option(
+    "--timeout",
+    show_default=True,
+    default=0.5,
+    help="timeout in seconds, for checking each case.",
+)
+@click.option(
+    "--incremental/--full",
+    default=True,
+    help="only extract and check the cases of the case classes that changed.",
+)
 @click.option("--decompile/--no-decompile", default=True)
+@click.option(
+    "--force/--no-force",
+    default=False,
+    help="decompile all classfiles, even if they did not change.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    help="number of classfiles to decompile in parallel [default: one per cpu]",
+)
 @click.option("-v", "--verbose", count=True)
-def build(check, decompile, verbose):
+def build(check, batch, timeout, incremental, decompile, force, jobs, verbose):
     """Rebuild the benchmark-suite."""
 
     logger = setup_logger(verbose)
     suite = Suite(WORKFOLDER, QUERIES, logger)
 
     suite.build()
-    suite.update_cases()
+    cases = suite.update_cases(incremental=incremental)
 
     if check:
-        suite.check()
+        suite.check(cases=cases, batch=batch, timeout=timeout)
 
     if decompile:
-        suite.decompile()
+        suite.decompile(jobs=jobs, force=force)
 
 
 if __name__ == "__main__":
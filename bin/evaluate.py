@@ -3,13 +3,14 @@
 """
 
 from collections import defaultdict
+from dataclasses import asdict, fields
 from datetime import datetime
 from pathlib import Path
 import click
 import math
 import os
 import subprocess
-from time import perf_counter_ns
+from time import perf_counter_ns, time_ns as timestamp_ns
 
 from utils import *
 
@@ -20,6 +21,8 @@ def add_timeout(m):
 
 WORKFOLDER = Path(os.path.abspath(__file__)).parent.parent
 
+USAGE_FIELDS = [f.name for f in fields(Usage)]
+
 
 def tool_parser(ctx_, parms_, tools):
     resulting_tools = []
@@ -67,6 +70,21 @@ def experiment_parser(ctx_, parms_, experiment):
         elif isinstance(t["executable"], str):
             t["executable"] = [t["executable"]]
 
+        t.setdefault("protocol", "process")
+        if t["protocol"] not in ("process", "batch"):
+            raise click.UsageError(
+                context + f"'tools.{tn}.protocol' should be 'process' or 'batch'"
+            )
+
+        if not isinstance(t.setdefault("limits", {}), dict):
+            raise click.UsageError(
+                context + f"'tools.{tn}.limits' should be a dictionary"
+            )
+        try:
+            Limits.parse(t["limits"])
+        except ValueError as e:
+            raise click.UsageError(context + f"'tools.{tn}.limits': {e}")
+
     if not "machine" in experiment:
         raise click.UsageError(context + "no 'machine'")
 
@@ -83,19 +101,236 @@ def experiment_parser(ctx_, parms_, experiment):
     return experiment
 
 
-def calibrate(sieve_exe, log_calibration):
-    calibrators = [100_000, 100_000]
-    calibration = 0
-    for count in calibrators:
+def interpolate(samples, timestamp):
+    """The calibration at the timestamp, interpolated between the samples
+    taken before and after it, ignoring outliers.
+
+    Returns the calibration and the samples it is interpolated from, as the
+    `calibrations` of a result: a list of their `count` and `time`.
+    """
+    import bisect
+
+    samples = [s for s in samples if not s.get("outlier")]
+    i = bisect.bisect(samples, timestamp, key=lambda s: s["timestamp"])
+    around = samples[max(i - 1, 0) : i + 1]
+    calibrations = [{"count": s["count"], "time": s["time"]} for s in around]
+    if len(around) == 1:
+        return around[0]["time"], calibrations
+    before, after = around
+    fraction = (timestamp - before["timestamp"]) / (
+        after["timestamp"] - before["timestamp"]
+    )
+    calibration = before["time"] + fraction * (after["time"] - before["time"])
+    return calibration, calibrations
+
+
+class Calibrator:
+    """Calibrates the speed of the machine by timing the sieve.
+
+    Instead of calibrating after each run, the sieve is timed every `every`
+    runs or `interval` seconds. A sample which is more than `tolerance` from
+    the baseline, the median of the samples since the last drift, is checked
+    by another sample. If that also drifted, a new baseline is started and
+    the sieve is timed after the next run, backing off to every `every` runs
+    while the machine is stable.
+    """
+
+    def __init__(self, sieve_exe, every, interval, tolerance, log, logger):
+        import threading
+
+        self.sieve_exe = sieve_exe
+        self.every = every
+        self.interval = interval * 1_000_000_000
+        self.tolerance = tolerance
+        self.log = log
+        self.logger = logger
+        self.samples = []
+        self.baseline_samples = []
+        self.cadence = 1
+        self.runs = 0
+        self.last = 0
+        self.lock = threading.Lock()
+
+    def sample(self, count=100_000):
+        timestamp = timestamp_ns()
         start = perf_counter_ns()
-        subprocess.check_output([sieve_exe, str(count)])
-        end = perf_counter_ns()
-        diff = end - start
-        calibration += diff
-        log_calibration(count=count, time=diff)
+        subprocess.check_output([self.sieve_exe, str(count)])
+        diff = perf_counter_ns() - start
+        sample = {"timestamp": timestamp + diff // 2, "count": count, "time": diff}
+        self.samples.append(sample)
+        return sample
+
+    def drifted(self, sample):
+        baseline = self.baseline()
+        return abs(sample["time"] / baseline - 1) > self.tolerance
+
+    def baseline(self):
+        import statistics
+
+        return statistics.median(s["time"] for s in self.baseline_samples)
+
+    def calibrate(self):
+        """Sample the sieve, and check if the machine has drifted.
+
+        The samples are only logged once it is decided whether they are
+        outliers, so the flag ends up in the log.
+        """
+        with self.lock:
+            self.runs = 0
+            self.last = timestamp_ns()
+            sample = self.sample()
+            if self.baseline_samples and self.drifted(sample):
+                confirm = self.sample()
+                if self.drifted(confirm):
+                    self.logger.info(
+                        f"Calibration drifted from {self.baseline()/1_000_000:0.0f}ms"
+                        f" to {confirm['time']/1_000_000:0.0f}ms"
+                    )
+                    self.baseline_samples = [sample, confirm]
+                    self.cadence = 1
+                    self.log(sample)
+                    self.log(confirm)
+                    return
+                sample["outlier"] = True
+                self.log(sample)
+                sample = confirm
+            self.log(sample)
+            self.baseline_samples.append(sample)
+            self.cadence = min(self.cadence * 2, self.every)
+
+    def after_run(self):
+        """Calibrate, if it's time to do it."""
+        with self.lock:
+            self.runs += 1
+            due = (
+                self.runs >= self.cadence
+                or timestamp_ns() - self.last >= self.interval
+            )
+            if due:
+                # Make sure that the other jobs do not calibrate as well
+                self.runs, self.last = 0, timestamp_ns()
+        if due:
+            self.calibrate()
+
+    def at(self, timestamp):
+        with self.lock:
+            return interpolate(self.samples, timestamp)
+
+
+def run_tool(tool_name, tool, m, timeout, batch_tools, logger, log_usage):
+    """Run the tool on the method, either as a process or as a batch request.
+
+    The usage of batch tools is not known, as they are not a process per run.
+    """
+    import queue
+
+    limits = Limits.parse(tool["limits"])
+    if tool["protocol"] != "batch":
+        return run_cmd(
+            tool["executable"] + [str(m)],
+            timeout=timeout,
+            logger=logger,
+            log_usage=log_usage,
+            limits=limits,
+        )
 
-    calibration /= len(calibrators)
-    return calibration
+    idle = batch_tools[tool_name]
+    try:
+        batch = idle.get_nowait()
+    except queue.Empty:
+        batch = BatchTool(tool["executable"], logger=logger, limits=limits)
+    try:
+        return batch.request(str(m), timeout=timeout)
+    finally:
+        idle.put(batch)
+
+
+def run_experiment(
+    m, cases, n, tool_name, tool, timeout, calibrator, batch_tools, logger
+):
+    """Run a single tool on a single method, and score the result."""
+    logger.debug(f"Testing {tool_name!r}")
+    timestamp = timestamp_ns()
+    usage = []
+    try:
+        fpred, time_ns = run_tool(
+            tool_name, tool, m, timeout, batch_tools, logger, usage.append
+        )
+        outcome = "ok"
+    except ResourceLimitExceeded as e:
+        logger.warning(f"Tool {tool_name!r} exceeded its {e.limit} limit")
+        fpred, time_ns = "", float("NaN")
+        outcome = f"{e.limit} limit"
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"Tool {tool_name!r} failed with {e}")
+        fpred, time_ns = "", float("NaN")
+        outcome = "failed"
+    except subprocess.TimeoutExpired:
+        logger.warning(f"Tool {tool_name!r} timed out")
+        fpred, time_ns = "", float("NaN")
+        outcome = "timeout"
+
+    total = 0
+    time = time_ns / 1_000_000_000
+    if not math.isnan(time_ns):
+        timestamp += time_ns // 2
+    calibrator.after_run()
+    calibration, calibrations = calibrator.at(timestamp)
+    relative = time_ns / calibration
+
+    predictions = {}
+    results = {c.result for c in cases}
+    for line in fpred.splitlines():
+        try:
+            query, pred = line.split(";")
+            logger.debug(f"response: {line}")
+        except ValueError:
+            logger.warning(f"Tool {tool_name!r} produced bad output")
+            logger.warning(line)
+            continue
+        if not query in QUERIES:
+            logger.warning(f"{query!r} not a known query")
+            continue
+        prediction = Prediction.parse(pred)
+        predictions[query] = prediction
+        sometimes = query in results
+        score = prediction.score(sometimes)
+        logger.debug(
+            f"Check query {query!r} ({sometimes}): waged {prediction.wager:0.3f}"
+            f" and predicted {prediction.to_probability():0.3%}, got {score:0.3f}"
+        )
+        total += score
+
+    pretty = ", ".join(f"{k} ({str(p)})" for k, p in sorted(predictions.items()))
+    logger.info(
+        f"{tool_name!r} scored {total:0.2f} in {time:0.3}s/{relative:0.3}x with {pretty}"
+    )
+
+    return {
+        "method": str(m),
+        "iteration": n,
+        "outcome": outcome,
+        "wagers": {k: p.wager for k, p in predictions.items()},
+        "time": time_ns,
+        "relative": relative,
+        "score": total,
+        "timestamp": timestamp,
+        "calibration": calibration,
+        "calibrations": calibrations,
+        **(asdict(usage[0]) if usage else dict.fromkeys(USAGE_FIELDS)),
+    }
+
+
+def read_stream(stream, logger):
+    """Read the results streamed to a JSON Lines file, if it exists."""
+    if not stream.exists():
+        return
+    with open(stream, encoding="utf-8") as fp:
+        for line in fp:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping broken result in {stream}: {line!r}")
 
 
 @click.command()
@@ -122,16 +357,61 @@ def calibrate(sieve_exe, log_calibration):
     default=1,
     help="number of iterations.",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    show_default=True,
+    default=1,
+    help="number of experiments to run in parallel, 0 means one per cpu.",
+)
+@click.option(
+    "--calibrate-every",
+    show_default=True,
+    default=16,
+    help="the maximal number of runs between calibrations.",
+)
+@click.option(
+    "--calibrate-interval",
+    show_default=True,
+    default=30.0,
+    help="the maximal number of seconds between calibrations.",
+)
+@click.option(
+    "--calibrate-tolerance",
+    show_default=True,
+    default=0.1,
+    help="the relative change in calibration, which counts as a drift.",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    show_default=True,
+    help="skip the experiments already in the results stream of the output.",
+)
 @click.option("-v", "--verbose", count=True)
 @click.option("-o", "--output", show_default=True, default=WORKFOLDER / "result.json")
 @click.argument("EXPERIMENT", callback=experiment_parser)
 def evaluate(
-    experiment, timeout, iterations, verbose, filter_methods, filter_tools, output
+    experiment,
+    timeout,
+    iterations,
+    jobs,
+    calibrate_every,
+    calibrate_interval,
+    calibrate_tolerance,
+    resume,
+    verbose,
+    filter_methods,
+    filter_tools,
+    output,
 ):
     """Given an command check if it can predict the results."""
-    import random, itertools
+    import random, itertools, queue, threading
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor, as_completed
 
     logger = setup_logger(verbose)
+    jobs = jobs or os.cpu_count() or 1
     suite = Suite(WORKFOLDER, QUERIES, logger)
     tools = experiment["tools"]
     by_tool = defaultdict(list)
@@ -148,10 +428,7 @@ def evaluate(
     logger.info(f"Building timer from {sieve}")
     sieve_exe = build_c(sieve, logger)
 
-    for i in range(iterations):
-        calibration = calibrate(sieve_exe, lambda **kwargs: ())
-        logger.info(f"Base calibrated {i}: {calibration/1_000_000:0.0f}ms")
-
+    units = []
     for m, cases in Case.by_methodid(suite.cases()):
         if filter_methods and not filter_methods.search(str(m)):
             logger.trace(f"{m} did not match {filter_methods}")
@@ -163,78 +440,107 @@ def evaluate(
             if filter_tools and not filter_tools.search(tool_name):
                 logger.trace(f"{tool_name} did not match {filter_tools}")
                 continue
-
-            logger.debug(f"Testing {tool_name!r}")
-            try:
-                fpred, time_ns = run_cmd(
-                    tool["executable"] + [str(m)],
-                    timeout=timeout,
-                    logger=logger,
-                )
-            except subprocess.CalledProcessError as e:
-                logger.warning(f"Tool {tool_name!r} failed with {e}")
-                fpred, time_ns = "", float("NaN")
-            except subprocess.TimeoutExpired:
-                logger.warning(f"Tool {tool_name!r} timed out")
-                fpred, time_ns = "", float("NaN")
-
-            total = 0
-            time = time_ns / 1_000_000_000
-            calibrations = []
-            calibration = calibrate(
+            units.append((m, cases, n, tool_name, tool))
+
+    stream = Path(output).with_suffix(".jsonl")
+    if resume:
+        done = {
+            (r["tool"], r["method"], r["iteration"])
+            for r in read_stream(stream, logger)
+            if "tool" in r
+        }
+        units = [u for u in units if (u[3], str(u[0]), u[2]) not in done]
+        logger.info(f"Resuming from {stream}, {len(done)} experiments already done")
+    elif stream.exists():
+        logger.warning(f"Overwriting {stream}, use --resume to continue it")
+        stream.unlink()
+
+    logger.info(f"Running {len(units)} experiments using {jobs} job(s)")
+
+    # The idle batch tools per tool, there is at most one per job.
+    batch_tools = defaultdict(queue.SimpleQueue)
+    remaining = Counter(str(m) for (m, *_) in units)
+
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    lock = threading.Lock()
+    try:
+        with open(stream, "a", encoding="utf-8") as fp:
+            if fp.tell() and not stream.read_bytes().endswith(b"\n"):
+                # The last record was cut off, don't append to it.
+                fp.write("\n")
+
+            def write(entry):
+                with lock:
+                    fp.write(json.dumps(entry) + "\n")
+                    fp.flush()
+
+            calibrator = Calibrator(
                 sieve_exe,
-                lambda **kwarg: calibrations.append(kwarg),
-            )
-            relative = time_ns / calibration
-
-            predictions = {}
-            for line in fpred.splitlines():
-                try:
-                    query, pred = line.split(";")
-                    logger.debug(f"response: {line}")
-                except ValueError:
-                    logger.warning(f"Tool {tool_name!r} produced bad output")
-                    logger.warning(line)
-                    continue
-                if not query in QUERIES:
-                    logger.warning(f"{query!r} not a known query")
-                    continue
-                prediction = Prediction.parse(pred)
-                predictions[query] = prediction
-                sometimes = any(query == c.result for c in cases)
-                score = prediction.score(sometimes)
-                logger.debug(
-                    f"Check query {query!r} ({sometimes}): waged {prediction.wager:0.3f}"
-                    f" and predicted {prediction.to_probability():0.3%}, got {score:0.3f}"
-                )
-                total += score
-
-            pretty = ", ".join(
-                f"{k} ({str(p)})" for k, p in sorted(predictions.items())
-            )
-            logger.info(
-                f"{tool_name!r} scored {total:0.2f} in {time:0.3}s/{relative:0.3}x with {pretty}"
-            )
-
-            by_tool[tool_name].append(
-                {
-                    "method": str(m),
-                    "iteration": n,
-                    "wagers": {k: p.wager for k, p in predictions.items()},
-                    "time": time_ns,
-                    "relative": relative,
-                    "score": total,
-                    "calibration": calibration,
-                    "calibrations": calibrations,
-                }
+                every=calibrate_every,
+                interval=calibrate_interval,
+                tolerance=calibrate_tolerance,
+                log=lambda sample: write({"calibration": sample}),
+                logger=logger,
             )
-
-        logger.success(f"Ran {m}")
+            for i in range(3):
+                calibrator.calibrate()
+                baseline = calibrator.baseline()
+                logger.info(f"Base calibrated {i}: {baseline/1_000_000:0.0f}ms")
+
+            futures = {
+                pool.submit(
+                    run_experiment,
+                    m,
+                    cases,
+                    n,
+                    tool_name,
+                    tool,
+                    timeout=timeout,
+                    calibrator=calibrator,
+                    batch_tools=batch_tools,
+                    logger=logger,
+                ): tool_name
+                for (m, cases, n, tool_name, tool) in units
+            }
+
+            # Each result is written as soon as it is done, so that a crash
+            # only loses the experiments that where running.
+            for future in as_completed(futures):
+                result = {"tool": futures.pop(future), **future.result()}
+                write(result)
+                remaining[result["method"]] -= 1
+                if not remaining[result["method"]]:
+                    logger.success(f"Ran {result['method']}")
+    finally:
+        pool.shutdown(cancel_futures=True)
+        for idle in batch_tools.values():
+            while not idle.empty():
+                idle.get().stop()
+
+    # The results are sorted like the suite, so that the output does not
+    # depend on the order in which the jobs finished.
+    order = {str(m): i for i, (m, _) in enumerate(Case.by_methodid(suite.cases()))}
+    samples = []
+    for r in read_stream(stream, logger):
+        if "calibration" in r and "tool" not in r:
+            samples.append(r["calibration"])
+        elif r["tool"] in tools:
+            by_tool[r.pop("tool")].append(r)
+        else:
+            logger.warning(f"Ignoring result of unknown tool {r['tool']!r}")
 
     for k, t in sorted(by_tool.items()):
         if not t:
             logger.warning(f"No experiments for {k}")
             continue
+        t.sort(key=lambda r: (order.get(r["method"], len(order)), r["iteration"]))
+        for r in t:
+            # Use the calibrations taken after the run, which the
+            # calibration in the stream could not.
+            r["calibration"], r["calibrations"] = interpolate(
+                samples, r["timestamp"]
+            )
+            r["relative"] = r["time"] / r["calibration"]
         score = sum(r["score"] for r in t) / iterations
         time = sum(r["time"] for r in t) / len(t)
         relative = math.exp(sum(math.log(r["relative"]) for r in t) / len(t))
@@ -242,6 +548,11 @@ def evaluate(
         tools[k]["score"] = score
         tools[k]["time"] = time
         tools[k]["relative"] = relative
+        for name in ["user_time", "system_time"]:
+            known = [r[name] for r in t if r.get(name) is not None]
+            tools[k][name] = sum(known) / len(known) if known else None
+        known = [r["max_rss"] for r in t if r.get("max_rss") is not None]
+        tools[k]["max_rss"] = max(known, default=None)
 
         logger.success(
             f"Tested {k}: score {score:0.2f} in avg {time/1_000_000:0.0f}ms/{relative:0.3f}x"
@@ -0,0 +1,146 @@
+""" A small process which spawns the tools for the `Runner` in utils.
+
+The peak memory in the rusage of a process is the largest of the memory of
+the program it runs, and the memory it had before the exec. A tool forked
+from the harness is a copy of the harness until it executes, so its peak
+memory would be at least that of the harness. Forked from this process
+instead, it is at least the few megabytes of this process, no matter how
+large the harness grows.
+
+The server is started with one end of a unix socket, and only imports the
+standard library. Each request and reply is a line of JSON, and the stdin,
+stdout and stderr of a tool are passed along with its request:
+
+    > {"id": 1, "cmd": ["true"], "cwd": "/tmp", "env": null, "limits": [], ...}
+    < {"id": 1, "pid": 4242}
+    < {"id": 1, "status": 0, "usage": [...]}
+
+The server sets the resource limits and the cpu affinity of the request
+in the child before the exec, which the harness can't do safely while it
+runs threads. The usage is the `struct_rusage` of the tool. A tool which
+can't be executed gets `{"id": 1, "error": [errno, message, filename]}`
+instead.
+"""
+
+import json
+import os
+import resource
+import select
+import signal
+import socket
+import sys
+
+
+def which(executable: str, env: dict | None) -> str:
+    """The path of the executable, like `execvp` would find it."""
+    if os.sep in executable:
+        return executable
+    for folder in os.get_exec_path(env):
+        path = os.path.join(folder, executable)
+        if os.access(path, os.X_OK) and not os.path.isdir(path):
+            return path
+    return executable
+
+
+def spawn(request: dict, stdio: list[int]) -> dict:
+    cmd, env = request["cmd"], request.get("env")
+    # Everything the child does is slowed down by copying the pages it
+    # touches, so the executable is found before the fork.
+    executable = which(cmd[0], env)
+    # The child reports why it failed over a pipe, which closes on exec
+    errors, error = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(errors)
+            os.setsid()
+            for i, fd in enumerate(stdio):
+                os.dup2(fd, i)
+            if request.get("cwd"):
+                os.chdir(request["cwd"])
+            for name, soft, hard in request.get("limits", []):
+                resource.setrlimit(getattr(resource, name), (soft, hard))
+            if request.get("affinity") is not None:
+                os.sched_setaffinity(0, request["affinity"])
+            try:
+                if env is None:
+                    os.execv(executable, cmd)
+                else:
+                    os.execve(executable, cmd, env)
+            except OSError as e:
+                e.filename = cmd[0]
+                raise
+        except OSError as e:
+            reason = [e.errno, e.strerror, e.filename]
+            os.write(error, json.dumps(reason).encode())
+        except BaseException as e:
+            os.write(error, json.dumps([None, str(e), None]).encode())
+        finally:
+            os._exit(127)
+
+    os.close(error)
+    for fd in stdio:
+        os.close(fd)
+    reason = b""
+    while chunk := os.read(errors, 4096):
+        reason += chunk
+    os.close(errors)
+    if reason:
+        os.waitpid(pid, 0)
+        return {"id": request["id"], "error": json.loads(reason)}
+    return {"id": request["id"], "pid": pid}
+
+
+def serve(sock: socket.socket):
+    sock.set_inheritable(False)
+    wakeup, notify = os.pipe()
+    os.set_blocking(notify, False)
+    signal.set_wakeup_fd(notify)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    # Python ignores these, and the tools should not inherit that
+    for sig in (signal.SIGPIPE, signal.SIGXFSZ):
+        signal.signal(sig, signal.SIG_DFL)
+
+    def reply(message: dict):
+        sock.sendall(json.dumps(message).encode() + b"\n")
+
+    children: dict[int, int] = {}
+    buffer = b""
+    fds: list[int] = []
+    while True:
+        readable, _, _ = select.select([sock, wakeup], [], [])
+        if sock in readable:
+            data, received, _, _ = socket.recv_fds(sock, 65536, 16)
+            if not data:
+                # The harness is gone
+                return
+            buffer += data
+            for fd in received:
+                # Only the tool of the request should inherit its stdio
+                os.set_inheritable(fd, False)
+            fds += received
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                request = json.loads(line)
+                stdio, fds = fds[:3], fds[3:]
+                message = spawn(request, stdio)
+                if "pid" in message:
+                    children[message["pid"]] = request["id"]
+                reply(message)
+        if wakeup in readable:
+            os.read(wakeup, 1024)
+        while children:
+            pid, status, rusage = os.wait4(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            reply(
+                {
+                    "id": children.pop(pid),
+                    "status": os.waitstatus_to_exitcode(status),
+                    "usage": list(rusage),
+                }
+            )
+
+
+if __name__ == "__main__":
+    serve(socket.socket(fileno=int(sys.argv[1])))
@@ -11,13 +11,14 @@ import sys
 import pandas as pd
 from pathlib import Path
 
+from jpamb_utils import CACHE_FOLDER
+
 
 def get_maxpoints():
-    import csv
+    from jpamb_utils.cases import CaseDB
 
-    with open("stats/distribution.csv") as fp:
-        reader = list(csv.DictReader(fp))
-        return (len(reader) - 1) * (len(reader[0]) - 1)
+    db = CaseDB.load_or_build(Path("stats"))
+    return len(db.methods) * len(db.queries)
 
 
 def get_kind(technologies):
@@ -49,120 +50,404 @@ def get_kind(technologies):
     return kind
 
 
-def analyse(experiment, logger):
-    tools = []
-    all_results = []
-    version = (datetime.fromtimestamp(experiment["timestamp"] / 1000),)
-    group = experiment["group_name"]
-    for tool, ctx in experiment["tools"].items():
-        results = []
-        for r in ctx["results"]:
-            fid = f"{group}/{tool}/{r['method']}"
-            if r["time"] == "NaN":
-                logger.warning(f"Found NaN in time, skipping {fid}")
-                continue
-            absolute = r["time"] / 1_000_000
-            relative = math.log10(r["relative"])
-            score = r["score"]
-            if r["score"] > 6:
-                logger.debug(r)
-                logger.warning(
-                    f"Found score {r['score']} is higher than 6, skipping {fid}"
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE files (
+    hash TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE contents (
+    file TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    PRIMARY KEY (file, position)
+);
+CREATE TABLE sources (
+    hash TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE TABLE results (
+    source TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    technologies TEXT NOT NULL,
+    method TEXT NOT NULL,
+    iteration INTEGER,
+    score REAL NOT NULL,
+    time REAL,
+    relative REAL,
+    user_time REAL,
+    system_time REAL,
+    max_rss REAL
+);
+CREATE INDEX results_by_group ON results (group_name, tool, method);
+CREATE INDEX results_by_tool ON results (tool, method);
+CREATE INDEX results_by_method ON results (method);
+CREATE INDEX results_by_source ON results (source);
+"""
+
+RESULT_COLUMNS = [
+    "group_name",
+    "tool",
+    "version",
+    "kind",
+    "technologies",
+    "method",
+    "iteration",
+    "score",
+    "time",
+    "relative",
+    "user_time",
+    "system_time",
+    "max_rss",
+]
+
+
+def open_store(file: Path, logger):
+    """Open the experiment store, and (re)create it if the schema changed."""
+    import sqlite3
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(file)
+    (version,) = conn.execute("PRAGMA user_version").fetchone()
+    if version != SCHEMA_VERSION:
+        logger.info(f"Creating the experiment store {str(file)!r}")
+        tables = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        for (table,) in tables.fetchall():
+            conn.execute(f"DROP TABLE {table}")
+        conn.executescript(SCHEMA)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return conn
+
+
+def experiment_rows(name, content):
+    """The status, result rows and warnings of an experiment file.
+
+    This runs in a worker process, so the warnings are logged by the caller.
+    """
+    import json
+
+    try:
+        try:
+            txt = content.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            txt = content.decode("utf-16")
+        experiment = json.loads(txt)
+    except (UnicodeDecodeError, JSONDecodeError) as e:
+        return "unreadable", [], [f"Could not read {name!r}: {e}"]
+
+    rows = []
+    warnings = []
+    try:
+        group = experiment["group_name"]
+        version = experiment["timestamp"]
+        for tool, ctx in experiment["tools"].items():
+            kind = get_kind(ctx["technologies"])
+            technologies = json.dumps(ctx["technologies"])
+            for r in ctx["results"]:
+                fid = f"{group}/{tool}/{r['method']}"
+                if r["time"] == "NaN":
+                    warnings.append(f"Found NaN in time, skipping {fid}")
+                    continue
+                if r["score"] > 6:
+                    warnings.append(
+                        f"Found score {r['score']} is higher than 6, skipping {fid}"
+                    )
+                    continue
+                rows.append(
+                    (
+                        group,
+                        tool,
+                        version,
+                        kind,
+                        technologies,
+                        r["method"],
+                        r.get("iteration"),
+                        r["score"],
+                        r["time"],
+                        r["relative"],
+                        # The resource usage is only known for newer process tools
+                        r.get("user_time"),
+                        r.get("system_time"),
+                        r.get("max_rss"),
+                    )
                 )
+    except KeyError as e:
+        return "invalid", [], [*warnings, f"Key error {e} in {name!r}, skipping."]
+
+    return "ok", rows, warnings
+
+
+def read_files(files, known, logger):
+    """Read the experiment files, and the json files in zip archives.
+
+    Yields the name and content hash of each file, with the name, hash and
+    content of each experiment in it. Known files are not unpacked.
+    """
+    import hashlib
+    import zipfile
+
+    for file in files:
+        content = file.read_bytes()
+        digest = hashlib.sha256(content).hexdigest()
+        if digest in known:
+            logger.debug(f"Already ingested {str(file)!r}")
+            yield str(file), digest, []
+        elif file.suffix != ".zip":
+            yield str(file), digest, [(str(file), digest, content)]
+        else:
+            sources = []
+            with zipfile.ZipFile(file) as zf:
+                for entry in zf.infolist():
+                    if not entry.filename.endswith(".json"):
+                        logger.trace(f"Ignoreing {entry.filename!r}")
+                        continue
+                    content = zf.read(entry)
+                    source = hashlib.sha256(content).hexdigest()
+                    sources.append((f"{file}/{entry.filename}", source, content))
+            yield str(file), digest, sources
+
+
+def ingest(conn, files, jobs, logger) -> list[str]:
+    """Ingest the experiment files into the store, and return their hashes.
+
+    Experiments are keyed by their content hash, so each experiment is only
+    parsed once, even if it is in several files or archives. They are
+    parsed in parallel, and written to the store as they are done.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    known_files = {h for (h,) in conn.execute("SELECT hash FROM files")}
+    known_sources = {h for (h,) in conn.execute("SELECT hash FROM sources")}
+
+    hashes = []
+    new_files = []
+    futures = {}
+    with ProcessPoolExecutor(jobs) as pool:
+        for file, digest, sources in read_files(files, known_files, logger):
+            hashes.append(digest)
+            if digest in known_files:
                 continue
-            results.append(
-                {
-                    "group": group,
-                    "tool": tool,
-                    "version": version,
-                    "method": r["method"],
-                    "score": max(score, 1),
-                    "kind": get_kind(ctx["technologies"]),
-                    "absolute": absolute,
-                    "relative": relative,
-                }
+            for name, source, content in sources:
+                if source in known_sources:
+                    logger.debug(f"Already ingested {name!r}")
+                    continue
+                logger.info(f"Ingesting {name!r}")
+                futures[pool.submit(experiment_rows, name, content)] = (name, source)
+                known_sources.add(source)
+            new_files.append((file, digest, [source for _, source, _ in sources]))
+            known_files.add(digest)
+
+        for future in as_completed(futures):
+            name, source = futures[future]
+            status, rows, warnings = future.result()
+            for warning in warnings:
+                logger.warning(warning)
+            with conn:
+                conn.execute(
+                    "INSERT INTO sources VALUES (?, ?, ?)", (source, name, status)
+                )
+                conn.executemany(
+                    f"INSERT INTO results VALUES ({', '.join('?' * 14)})",
+                    ((source, *row) for row in rows),
+                )
+
+    # Files are added last, so that an interrupted ingestion is picked up
+    # again the next time.
+    with conn:
+        for file, digest, sources in new_files:
+            conn.executemany(
+                "INSERT INTO contents VALUES (?, ?, ?)",
+                ((digest, i, source) for i, source in enumerate(sources)),
             )
+            conn.execute("INSERT INTO files VALUES (?, ?)", (digest, file))
+
+    return hashes
+
+
+def query_results(conn, hashes=None) -> pd.DataFrame:
+    """The results of the experiments in the files, in the order of the
+    files, or of all the files in the store.
+    """
+    if hashes is None:
+        hashes = [h for (h,) in conn.execute("SELECT hash FROM files ORDER BY rowid")]
 
-        df = pd.DataFrame(results)
-        all_results.extend(results)
-        # todo pick best here?
-        first = df.groupby(["method"]).first()
-
-        tools.append(
-            {
-                "group": group,
-                "tool": tool,
-                "version": version,
-                "kind": get_kind(ctx["technologies"]),
-                "technologies": ctx["technologies"],
-                "score": first.score.sum(),
-                "absolute": first.absolute.mean(),
-                "relative": np.pow(10, first.relative.mean()),
-            }
+    order = {}
+    for digest in hashes:
+        contents = conn.execute(
+            "SELECT source FROM contents WHERE file = ? ORDER BY position", (digest,)
         )
+        for (source,) in contents:
+            order.setdefault(source, len(order))
 
-    return (tools, all_results)
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS selected (source TEXT PRIMARY KEY, position INTEGER)"
+    )
+    conn.execute("DELETE FROM selected")
+    conn.executemany("INSERT INTO selected VALUES (?, ?)", order.items())
+    return pd.read_sql_query(
+        f"SELECT {', '.join(f'r.{c}' for c in RESULT_COLUMNS)} FROM results r"
+        " JOIN selected s ON s.source = r.source ORDER BY s.position, r.rowid",
+        conn,
+        dtype={c: float for c in RESULT_COLUMNS[7:]},
+    )
+
+
+def bootstrap(values, groups, n, samples=1000, confidence=0.95, seed=None):
+    """Bootstrap confidence intervals of the mean of the values in each of
+    the n groups, where `groups` is the group number of each value.
+
+    All the groups are resampled at once: each gets as many draws as the
+    largest group, and the draws past its own size are masked out.
+    """
+    groups = np.asarray(groups)
+    if len(groups) == 0:
+        return np.full(n, np.nan), np.full(n, np.nan)
+
+    rng = np.random.default_rng(seed)
+    order = np.argsort(groups, kind="stable")
+    values = np.asarray(values, dtype=float)[order]
+    counts = np.bincount(groups, minlength=n)
+    starts = np.cumsum(counts) - counts
+
+    draws = rng.random((n, samples, counts.max())) * counts[:, None, None]
+    index = np.minimum(draws.astype(int) + starts[:, None, None], len(values) - 1)
+    used = np.arange(counts.max()) < counts[:, None, None]
+    with np.errstate(invalid="ignore"):
+        means = np.where(used, values[index], 0).sum(axis=2) / counts[:, None]
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha], axis=1)
+    return low, high
+
+
+def analyse(results, logger, samples=1000, seed=None):
+    """Add the derived columns to the results, and aggregate them by tool.
+
+    The score and relative time of a tool are computed from the first result
+    of each method, and their confidence intervals by bootstrapping the
+    totals of the iterations.
+    """
+    import json
+
+    versions = {t: datetime.fromtimestamp(t / 1000) for t in results["version"].unique()}
+    results = results.rename(columns={"group_name": "group"}).assign(
+        version=results["version"].map(versions),
+        iteration=results["iteration"].fillna(0),
+        score=results["score"].clip(lower=1),
+        absolute=results["time"] / 1_000_000,
+        relative=np.log10(results["relative"]),
+        cpu=(results["user_time"] + results["system_time"]) / 1_000_000,
+        max_rss=results["max_rss"] / 1_000_000,
+    )
+    keys = ["group", "tool", "version"]
+    results["id"] = results.groupby(keys, sort=False).ngroup()
+
+    # todo pick best here?
+    by_tool = results.groupby(["id", "method"], sort=False).first().groupby("id")
+    tools = pd.DataFrame(
+        {
+            **{k: by_tool[k].first() for k in [*keys, "kind"]},
+            "technologies": by_tool["technologies"].first().map(json.loads),
+            "score": by_tool["score"].sum(),
+            "absolute": by_tool["absolute"].mean(),
+            "relative": np.pow(10, by_tool["relative"].mean()),
+            "cpu": by_tool["cpu"].mean(),
+            "max_rss": by_tool["max_rss"].max(),
+        }
+    )
+
+    iterations = (
+        results.groupby(["id", "iteration"])
+        .agg(score=("score", "sum"), relative=("relative", "mean"))
+        .reset_index()
+    )
+    low, high = bootstrap(
+        iterations["score"], iterations["id"], len(tools), samples, seed=seed
+    )
+    tools["score_low"], tools["score_high"] = low, high
+    timed = iterations.dropna(subset=["relative"])
+    low, high = bootstrap(
+        timed["relative"], timed["id"], len(tools), samples, seed=seed
+    )
+    tools["relative_low"], tools["relative_high"] = np.pow(10, low), np.pow(10, high)
+
+    logger.debug(f"Analysed {len(results)} results of {len(tools)} tools")
+    return (tools.reset_index(drop=True), results)
+
+
+def analyse_kinds(tools):
+    """Aggregate the tools by their kind."""
+    kinds = (
+        tools.assign(relative=np.log10(tools["relative"]))
+        .groupby("kind")
+        .agg(
+            tools=("tool", "size"),
+            score=("score", "mean"),
+            best=("score", "max"),
+            relative=("relative", "mean"),
+            cpu=("cpu", "mean"),
+            max_rss=("max_rss", "max"),
+        )
+    )
+    kinds["relative"] = np.pow(10, kinds["relative"])
+    return kinds
 
 
 @click.command()
 @click.option("-v", "--verbose", count=True)
 @click.option("-o", "--report", type=click.Path(path_type=Path), default="report")
+@click.option(
+    "--store",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=CACHE_FOLDER / "experiments.sqlite",
+    show_default=True,
+    help="The experiment store, which the files are ingested into.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    default=None,
+    help="The number of processes ingesting the files (defaults to the cpu count).",
+)
+@click.option(
+    "--bootstrap",
+    type=int,
+    default=1000,
+    show_default=True,
+    help="The number of resamples of the bootstrap confidence intervals.",
+)
+@click.option("--seed", type=int, default=None, help="The seed of the bootstrap.")
 @click.argument(
     "FILES", nargs=-1, type=click.Path(exists=True, readable=True, path_type=Path)
 )
-def stats(files, report, verbose):
+def stats(files, report, store, jobs, bootstrap, seed, verbose):
     """A program for calculating and presenting the stats of
     a collection of experiments.
-    """
 
-    import json
+    The experiments in the FILES (json files or zip archives of them) are
+    ingested into the store once, and the stats are computed from the
+    store. Without FILES, the stats of all the ingested experiments are
+    computed.
+    """
 
     logger = utils.setup_logger(verbose)
 
-    results = []
-    tools = []
-
-    def handle_result(result):
-        try:
-            _tools, tool_results = analyse(result, logger)
-            results.extend(tool_results)
-            tools.extend(_tools)
-        except KeyError as e:
-            logger.debug(sorted(result))
-            logger.warning(f"Key error {e}, skipping.")
-
-    for file in files:
-        logger.info(f"Analysing {file!r}")
-
-        if file.suffix == ".zip":
-            import zipfile
-
-            with zipfile.ZipFile(file) as zf:
-                for entry in zf.infolist():
-                    if not entry.filename.endswith(".json"):
-                        logger.trace(f"Ignoreing {entry.filename!r}")
-                        continue
-                    logger.info(f"Unpacking {entry.filename!r}")
-                    content = zf.read(entry)
-                    try:
-                        txt = content.decode("utf-8-sig")
-                    except UnicodeDecodeError:
-                        txt = content.decode("utf-16")
-                    handle_result(json.loads(txt))
-            continue
-
-        try:
-            with open(file, encoding="utf-8-sig") as fp:
-                handle_result(json.load(fp))
-        except UnicodeDecodeError:
-            with open(file, encoding="utf-16") as fp:
-                handle_result(json.load(fp))
+    conn = open_store(store, logger)
+    hashes = ingest(conn, files, jobs, logger) if files else None
+    tools_df, results_df = analyse(
+        query_results(conn, hashes), logger, samples=bootstrap, seed=seed
+    )
+    conn.close()
 
     logger.success(f"Analysed {len(files)} file")
 
     report.mkdir(exist_ok=True)
 
-    results_df = pd.DataFrame(results)
     score_per_method = (
         results_df[results_df["score"] > 0]
         .groupby("method")[["score"]]
@@ -170,8 +455,6 @@ def stats(files, report, verbose):
         .sort_values()
     )
 
-    tools_df = pd.DataFrame(tools)
-
     import plotly.graph_objects as go
     import plotly.express as px
     from plotly.subplots import make_subplots
@@ -202,13 +485,14 @@ def stats(files, report, verbose):
             name="?",
             mode="markers",
             marker=dict(
-                color=[colors[k] for k in tools_df["kind"]],
-                symbol=[symbols[k] for k in tools_df["kind"]],
+                color=tools_df["kind"].map(colors),
+                symbol=tools_df["kind"].map(symbols),
             ),
-            text=[
-                f"{tools_df.iloc[i].group}/{tools_df.iloc[i].tool}<br>{tools_df.iloc[i].technologies}"
-                for i in tools_df.index
-            ],
+            text=tools_df["group"]
+            + "/"
+            + tools_df["tool"]
+            + "<br>"
+            + tools_df["technologies"].astype(str),
         )
     )
     fig.update_xaxes(type="log")
@@ -235,9 +519,37 @@ def stats(files, report, verbose):
     )
     fig.write_html(report / "score-per-method.html")
 
+    max_rss_per_method = results_df.groupby("method")["max_rss"].max().sort_values()
+    fig = go.Figure()
+    fig.add_trace(
+        go.Bar(
+            y=max_rss_per_method.index,
+            x=max_rss_per_method,
+            orientation="h",
+        )
+    )
+    fig.update_layout(
+        title="Peak Memory (MB) per Method",
+        template="seaborn",
+    )
+    fig.write_html(report / "memory-per-method.html")
+
     print(
-        tools_df.set_index(["group", "tool", "version"])[["kind", "score", "relative"]]
+        tools_df.set_index(["group", "tool", "version"])[
+            [
+                "kind",
+                "score",
+                "score_low",
+                "score_high",
+                "relative",
+                "relative_low",
+                "relative_high",
+                "cpu",
+                "max_rss",
+            ]
+        ]
     )
+    print(analyse_kinds(tools_df))
 
 
 if __name__ == "__main__":
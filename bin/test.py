@@ -34,6 +34,13 @@ WORKFOLDER = Path(os.path.abspath(__file__)).parent.parent
     help="only take methods that matches the regex.",
     callback=re_parser,
 )
+@click.option(
+    "--protocol",
+    type=click.Choice(["process", "batch"]),
+    default="process",
+    show_default=True,
+    help="start the command once per case, or once and send it the cases as batch requests.",
+)
 @click.argument("cmd", nargs=-1, type=click.Path())
 def test(
     filter_methods,
@@ -42,9 +49,11 @@ def test(
     timeout,
     report,
     fail_fast,
+    protocol,
 ):
     logger = setup_logger(verbose)
     suite = Suite(WORKFOLDER, QUERIES, logger)
+    batch = BatchTool(list(cmd), logger=logger) if protocol == "batch" else None
 
     if report:
         fp: TextIO = click.open_file(report, "w")  # type: ignore
@@ -63,11 +72,17 @@ def test(
 
         result: str
         try:
-            (result, _) = run_cmd(
-                cmd + (str(case.methodid), str(case.input)),
-                logger=logger,
-                timeout=timeout,
-            )
+            if batch:
+                (result, _) = batch.request(
+                    f"{case.methodid} {case.input}",
+                    timeout=timeout,
+                )
+            else:
+                (result, _) = run_cmd(
+                    cmd + (str(case.methodid), str(case.input)),
+                    logger=logger,
+                    timeout=timeout,
+                )
         except subprocess.CalledProcessError as e:
             logger.error(e)
             result = e.stdout
@@ -86,6 +101,9 @@ def test(
         else:
             logger.error(f"Failed {case}: {test!r} != {case.result!r}")
 
+    if batch:
+        batch.stop()
+
 
 if __name__ == "__main__":
     test()
@@ -1,15 +1,20 @@
 import collections
-from dataclasses import dataclass
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 from io import StringIO
 from pathlib import Path
-from typing import TextIO, TypeVar
+from typing import Callable, TextIO, TypeVar
+import os
 import re
 import subprocess
 import sys
 import csv
+import threading
 import json
 
 from jpamb_utils import InputParser, JvmType, JvmValue, MethodId
+from jpamb_utils.cases import CaseDB, parse_case, stamp
+from jpamb_utils.features import FeatureTable
 
 import loguru
 
@@ -82,10 +87,13 @@ class Input:
     val: tuple[JvmType, ...]
 
     @staticmethod
-    def parse(string: str) -> "Input":
-        parsed_args = InputParser(string).parse_inputs()
-        input = Input(tuple(parsed_args))
-        assert string == str(input), f"{input} should formatted as {string}"
+    def parse(string: str, validate: bool = True) -> "Input":
+        """Parse the input, and check that it is formatted like `str` would,
+        unless `validate` is False.
+        """
+        input = Input(tuple(InputParser.parse(string)))
+        if validate:
+            assert string == str(input), f"{input} should formatted as {string}"
         return input
 
     def __str__(self) -> str:
@@ -106,7 +114,567 @@ def summary64(cmd):
     return base64.b64encode(hashlib.sha256(str(cmd).encode()).digest()).decode()[:8]
 
 
-def run_cmd(cmd: list[str], /, timeout, logger, **kwargs):
+@dataclass(frozen=True)
+class Usage:
+    """The resources used by a process, as reported by its rusage."""
+
+    user_time: int
+    """The user CPU time in nanoseconds."""
+    system_time: int
+    """The system CPU time in nanoseconds."""
+    max_rss: int
+    """The peak resident set size in bytes. It is at least the size of the
+    fork server which spawned the process, about 9MB."""
+    voluntary_switches: int
+    involuntary_switches: int
+
+    @staticmethod
+    def from_rusage(rusage) -> "Usage":
+        # Linux reports the peak resident set size in kilobytes
+        rss_unit = 1 if sys.platform == "darwin" else 1024
+        return Usage(
+            round(rusage.ru_utime * 1_000_000_000),
+            round(rusage.ru_stime * 1_000_000_000),
+            rusage.ru_maxrss * rss_unit,
+            rusage.ru_nvcsw,
+            rusage.ru_nivcsw,
+        )
+
+
+@dataclass
+class _Process:
+    id: int
+    cmd: list[str]
+    future: "Future[tuple[str, int]]"
+    logger: "loguru.Logger"
+    timeout: float | None
+    start_ns: int
+    deadline: float | None
+    fds: list[int]
+    """The ends of the stdout and stderr pipes, which are still open."""
+    on_stdout: Callable[[bytes], None] | None = None
+    """Called with the output instead of collecting it, see `Runner.submit`."""
+    pid: int | None = None
+    returncode: int | None = None
+    stdout: bytearray = field(default_factory=bytearray)
+    stderr: list[str] = field(default_factory=list)
+    partial: bytearray = field(default_factory=bytearray)
+    end_ns: int | None = None
+    timed_out: bool = False
+    log_usage: Callable[[Usage], None] | None = None
+    usage: Usage | None = None
+
+
+FORKSERVER = Path(__file__).parent / "forkserver.py"
+
+
+class Runner:
+    """Supervises many processes from a single thread.
+
+    The processes are spawned by a small fork server (see `forkserver.py`),
+    which reports when they exit and their rusage, so that their peak
+    memory does not include the memory of the harness. The output of the
+    processes is read using a selector, and each process is started in its
+    own session, so it can be killed together with its children when it
+    exceeds its deadline.
+
+    Use `run_cmd` to run a process on the shared runner.
+    """
+
+    def __init__(self):
+        import itertools
+        import selectors
+
+        self.selector = selectors.DefaultSelector()
+        self.wakeup, self.notify = os.pipe()
+        os.set_blocking(self.wakeup, False)
+        os.set_blocking(self.notify, False)
+        self.selector.register(self.wakeup, selectors.EVENT_READ, None)
+        try:
+            os.fstat(0)
+            self.stdin = 0
+        except OSError:
+            self.stdin = os.open(os.devnull, os.O_RDONLY)
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.incoming: list[_Process] = []
+        self.killing: list[Future] = []
+        self.processes: dict[int, _Process] = {}
+        self._start_server()
+        threading.Thread(target=self._loop, daemon=True, name="runner").start()
+
+    def _start_server(self):
+        import selectors
+        import socket
+
+        ours, theirs = socket.socketpair()
+        with theirs:
+            server = subprocess.Popen(
+                [sys.executable, "-I", "-S", FORKSERVER, str(theirs.fileno())],
+                stdin=subprocess.DEVNULL,
+                pass_fds=[theirs.fileno()],
+            )
+        with self.lock:
+            self.server, self.socket, self.received = server, ours, b""
+        self.selector.register(ours, selectors.EVENT_READ, "server")
+
+    def submit(
+        self,
+        cmd: list[str],
+        /,
+        timeout,
+        logger,
+        log_usage=None,
+        limits=None,
+        cwd=None,
+        env=None,
+        stdin: int | None = None,
+        on_stdout: Callable[[bytes], None] | None = None,
+    ) -> "Future[tuple[str, int]]":
+        """Start the command, and return a future of `(stdout, elapsed_ns)`.
+
+        The future fails with the same exceptions as `run_cmd`, but the
+        failures are not checked against the `Limits`. Before it is done,
+        `log_usage` is called with the `Usage` of the process.
+
+        The process reads from the file descriptor `stdin` if given, which
+        the caller should close afterwards. If `on_stdout` is given, it is
+        called from the runner thread with the output as it is read, and the
+        stdout of the future is empty.
+        """
+        import shlex
+        import socket
+        from concurrent.futures import Future
+        from time import monotonic, perf_counter_ns
+
+        logger = logger.bind(process=summary64(cmd))
+        logger.debug(f"starting: {shlex.join(map(str, cmd))}")
+        stdout, child_stdout = os.pipe()
+        stderr, child_stderr = os.pipe()
+        request = {
+            "cmd": [str(c) for c in cmd],
+            "cwd": os.fspath(cwd or os.getcwd()),
+            # The server has the environment of when it started
+            "env": dict(os.environ if env is None else env),
+            "limits": limits.rlimits() if limits else [],
+            "affinity": limits.affinity if limits else None,
+        }
+        start = monotonic()
+        start_ns = perf_counter_ns()
+        with self.lock:
+            process = _Process(
+                next(self.ids),
+                cmd,
+                Future(),
+                logger,
+                timeout,
+                start_ns,
+                start + timeout if timeout else None,
+                [stdout, stderr],
+                on_stdout=on_stdout,
+                log_usage=log_usage,
+            )
+            message = json.dumps({"id": process.id, **request}).encode() + b"\n"
+            fds = [self.stdin if stdin is None else stdin, child_stdout, child_stderr]
+            try:
+                sent = socket.send_fds(self.socket, [message], fds)
+                self.socket.sendall(message[sent:])
+            except OSError as e:
+                for fd in (stdout, stderr, child_stdout, child_stderr):
+                    os.close(fd)
+                raise ChildProcessError("the fork server exited") from e
+            self.incoming.append(process)
+        os.close(child_stdout)
+        os.close(child_stderr)
+        self._notify()
+        return process.future
+
+    def kill(self, future: Future):
+        """Kill the process of a future from `submit`, like at its deadline."""
+        with self.lock:
+            self.killing.append(future)
+        self._notify()
+
+    def _notify(self):
+        try:
+            os.write(self.notify, b"\0")
+        except BlockingIOError:
+            # The runner has not yet read the previous notifications
+            pass
+
+    def run(
+        self, cmd: list[str], /, timeout, logger, log_usage=None, limits=None, **kwargs
+    ) -> tuple[str, int]:
+        return self.submit(
+            cmd,
+            timeout=timeout,
+            logger=logger,
+            log_usage=log_usage,
+            limits=limits,
+            **kwargs,
+        ).result()
+
+    def _loop(self):
+        while True:
+            try:
+                self._step()
+            except Exception as e:
+                # Fail the running processes, instead of letting them hang
+                for process in list(self.processes.values()):
+                    self._kill(process)
+                    self._finish(process, e)
+
+    def _step(self):
+        from time import monotonic
+
+        deadlines = [p.deadline for p in self.processes.values() if p.deadline]
+        wait = max(min(deadlines) - monotonic(), 0) if deadlines else None
+
+        for key, _ in self.selector.select(wait):
+            if key.data is None:
+                self._adopt()
+            elif key.data == "server":
+                self._receive()
+            else:
+                process, kind = key.data
+                self._read(process, key.fd, kind)
+
+        now = monotonic()
+        for process in list(self.processes.values()):
+            if process.deadline and now >= process.deadline:
+                self._kill(process)
+            if process.end_ns is not None and (not process.fds or process.timed_out):
+                self._finish(process)
+
+    def _adopt(self):
+        import selectors
+
+        try:
+            while os.read(self.wakeup, 1024):
+                pass
+        except BlockingIOError:
+            pass
+        with self.lock:
+            incoming, self.incoming = self.incoming, []
+            killing, self.killing = self.killing, []
+        for process in incoming:
+            for fd, kind in zip(process.fds, ("stdout", "stderr")):
+                os.set_blocking(fd, False)
+                self.selector.register(fd, selectors.EVENT_READ, (process, kind))
+            self.processes[process.id] = process
+        for process in list(self.processes.values()):
+            if process.future in killing:
+                self._kill(process)
+
+    def _receive(self):
+        """Handle the replies of the fork server."""
+        import resource
+        from time import perf_counter_ns
+
+        data = self.socket.recv(65536)
+        # The replies might be about processes which are not adopted yet
+        self._adopt()
+        if not data:
+            self._restart_server()
+            return
+        self.received += data
+        *lines, self.received = self.received.split(b"\n")
+        for line in lines:
+            message = json.loads(line)
+            if (process := self.processes.get(message["id"])) is None:
+                # It has already failed
+                continue
+            if "error" in message:
+                errno, strerror, filename = message["error"]
+                if errno is None:
+                    self._finish(process, subprocess.SubprocessError(strerror))
+                else:
+                    self._finish(process, OSError(errno, strerror, filename))
+            elif "pid" in message:
+                process.pid = message["pid"]
+                if process.timed_out:
+                    # It timed out before it was spawned
+                    self._killpg(process)
+            else:
+                process.end_ns = perf_counter_ns()
+                process.returncode = message["status"]
+                process.usage = Usage.from_rusage(
+                    resource.struct_rusage(message["usage"])
+                )
+
+    def _restart_server(self):
+        """Fail the processes of a fork server which exited, and start a new one."""
+        self.selector.unregister(self.socket)
+        self.socket.close()
+        returncode = self.server.wait()
+        error = ChildProcessError(f"the fork server exited with {returncode}")
+        for process in list(self.processes.values()):
+            self._kill(process)
+            self._finish(process, error)
+        self._start_server()
+
+    def _read(self, process: _Process, fd: int, kind: str):
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        if not data:
+            self._close(process, fd)
+        elif kind == "stdout" and process.on_stdout:
+            process.on_stdout(data)
+        elif kind == "stdout":
+            process.stdout += data
+        else:
+            process.partial += data
+            *lines, process.partial = process.partial.split(b"\n")
+            for line in lines:
+                self._log(process, line + b"\n")
+
+    def _log(self, process: _Process, line: bytes):
+        text = line.decode(errors="replace").replace("\r\n", "\n")
+        process.stderr.append(text)
+        process.logger.debug(text.rstrip("\n"))
+
+    def _close(self, process: _Process, fd: int):
+        self.selector.unregister(fd)
+        os.close(fd)
+        process.fds.remove(fd)
+
+    def _kill(self, process: _Process):
+        if process.timed_out:
+            return
+        process.logger.debug("killing the process")
+        process.timed_out = True
+        # The exit is noticed like any other, so the loop should not keep
+        # waking up for a deadline which has been handled.
+        process.deadline = None
+        if process.pid is not None:
+            self._killpg(process)
+
+    def _killpg(self, process: _Process):
+        import signal
+
+        try:
+            os.killpg(process.pid, signal.SIGKILL)  # type: ignore
+        except ProcessLookupError:
+            pass
+
+    def _finish(self, process: _Process, error: Exception | None = None):
+        del self.processes[process.id]
+        for fd in list(process.fds):
+            # Children of a killed process might still hold the pipes open
+            self._close(process, fd)
+        if process.partial:
+            self._log(process, bytes(process.partial))
+
+        if process.log_usage and process.usage:
+            process.log_usage(process.usage)
+
+        stdout = process.stdout.decode(errors="replace").replace("\r\n", "\n").strip()
+        if error:
+            process.future.set_exception(error)
+        elif process.timed_out:
+            process.future.set_exception(
+                subprocess.TimeoutExpired(cmd=process.cmd, timeout=process.timeout)  # type: ignore
+            )
+        elif process.returncode != 0:
+            process.future.set_exception(
+                subprocess.CalledProcessError(
+                    cmd=process.cmd,
+                    returncode=process.returncode,  # type: ignore
+                    stderr="\n".join(process.stderr),
+                    output=stdout,
+                )
+            )
+        else:
+            process.logger.debug("done")
+            assert process.end_ns is not None
+            process.future.set_result((stdout, process.end_ns - process.start_ns))
+
+
+class ResourceLimitExceeded(subprocess.CalledProcessError):
+    """A process failed, because it exceeded one of its `Limits`."""
+
+    def __init__(self, limit: str, error: subprocess.CalledProcessError):
+        super().__init__(error.returncode, error.cmd, error.output, error.stderr)
+        self.limit = limit
+
+    def __str__(self):
+        return f"Command '{self.cmd}' exceeded its {self.limit} limit."
+
+
+@dataclass(frozen=True)
+class Limits:
+    """The resource limits of a tool.
+
+    The fork server (see `forkserver.py`) sets the limits between the fork
+    and the exec of the tool, so they apply from its first instruction,
+    without a `preexec_fn`, which is not safe while other threads run.
+    Like with `setrlimit`, `processes` counts all the processes and threads
+    of the user, and `memory` limits the address space, which includes
+    memory that is reserved but never used.
+    """
+
+    memory: int | None = None
+    """The maximal address space in bytes."""
+    cpu: int | None = None
+    """The maximal CPU time in seconds."""
+    processes: int | None = None
+    files: int | None = None
+    """The maximal number of open files."""
+    affinity: tuple[int, ...] | None = None
+    """The CPUs the tool may run on."""
+
+    # How the failures due to each limit appear in the output of the tool.
+    SYMPTOMS = {
+        "memory": r"MemoryError|OutOfMemoryError|[Cc]annot allocate memory|bad_alloc",
+        "processes": r"Resource temporarily unavailable|can't start new thread"
+        r"|unable to create (new )?native thread",
+        "files": r"Too many open files",
+    }
+
+    @staticmethod
+    def parse(limits: dict) -> "Limits":
+        """Parse the limits of a tool, where the memory can have a K, M or G suffix."""
+        unknown = set(limits) - {"memory", "cpu", "processes", "files", "affinity"}
+        if unknown:
+            raise ValueError(f"unknown limits {', '.join(sorted(unknown))}")
+
+        memory = limits.get("memory")
+        if isinstance(memory, str):
+            if not (m := re.fullmatch(r"\s*(\d+)\s*([KMG]?)B?\s*", memory, re.I)):
+                raise ValueError(f"memory should be a size like '2G', got {memory!r}")
+            unit = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30}[m.group(2).upper()]
+            memory = int(m.group(1)) * unit
+
+        for name, value in [("memory", memory)] + [
+            (k, limits.get(k)) for k in ("cpu", "processes", "files")
+        ]:
+            if value is not None and not (isinstance(value, int) and value > 0):
+                raise ValueError(f"{name} should be a positive integer, got {value!r}")
+
+        affinity = limits.get("affinity")
+        if affinity is not None:
+            if not hasattr(os, "sched_setaffinity"):
+                raise ValueError("affinity is not supported on this system")
+            if not (
+                isinstance(affinity, list)
+                and affinity
+                and all(isinstance(c, int) and c >= 0 for c in affinity)
+            ):
+                raise ValueError(f"affinity should be a list of CPUs, got {affinity!r}")
+            affinity = tuple(affinity)
+
+        return Limits(
+            memory,
+            limits.get("cpu"),
+            limits.get("processes"),
+            limits.get("files"),
+            affinity,
+        )
+
+    def rlimits(self) -> list[tuple[str, int, int]]:
+        """The names of the resources, with their soft and hard limits."""
+        rlimits = [
+            (name, value, value)
+            for name, value in [
+                ("RLIMIT_AS", self.memory),
+                ("RLIMIT_NPROC", self.processes),
+                ("RLIMIT_NOFILE", self.files),
+            ]
+            if value is not None
+        ]
+        if self.cpu is not None:
+            # SIGXCPU is sent at the soft limit, and SIGKILL at the hard limit
+            rlimits.append(("RLIMIT_CPU", self.cpu, self.cpu + 1))
+        return rlimits
+
+    def exceeded(
+        self, error: subprocess.CalledProcessError, usage: "Usage | None" = None
+    ) -> str | None:
+        """The limit that the failed process exceeded, if any.
+
+        A process killed with SIGKILL only exceeded the cpu limit, if its
+        `usage` shows that it used that much CPU time, as it might as well
+        have been killed for running out of memory or time.
+        """
+        import signal
+
+        if self.cpu is not None and (
+            error.returncode == -signal.SIGXCPU
+            or error.returncode == -signal.SIGKILL
+            and usage is not None
+            and usage.user_time + usage.system_time >= self.cpu * 1_000_000_000
+        ):
+            return "cpu"
+        for limit, symptom in self.SYMPTOMS.items():
+            if getattr(self, limit) is not None and re.search(
+                symptom, error.stderr or ""
+            ):
+                return limit
+        return None
+
+    def check(
+        self, error: subprocess.CalledProcessError, usage: "Usage | None" = None
+    ):
+        """Raise `ResourceLimitExceeded`, if the error is due to a limit."""
+        if limit := self.exceeded(error, usage):
+            raise ResourceLimitExceeded(limit, error) from error
+
+
+_RUNNER: Runner | None = None
+_RUNNER_LOCK = threading.Lock()
+
+
+def shared_runner() -> Runner:
+    """The runner of `run_cmd` and `BatchTool`, which is started when needed."""
+    global _RUNNER
+
+    with _RUNNER_LOCK:
+        if _RUNNER is None:
+            _RUNNER = Runner()
+    return _RUNNER
+
+
+def run_cmd(
+    cmd: list[str], /, timeout, logger, log_usage=None, limits=None, **kwargs
+) -> tuple[str, int]:
+    """Run the command, and return its stripped stdout and the time it took.
+
+    Raises `subprocess.CalledProcessError` if it fails and
+    `subprocess.TimeoutExpired` if it does not finish within the timeout.
+    If given, `log_usage` is called with the `Usage` of the process, also
+    when it fails. It is never called on systems without rusage.
+
+    If the process is started with `Limits`, and fails because of one of
+    them, `ResourceLimitExceeded` is raised instead.
+    """
+    if os.name != "posix":
+        return run_cmd_threaded(cmd, timeout=timeout, logger=logger, **kwargs)
+    usage: list[Usage] = []
+
+    def record_usage(u: Usage):
+        usage.append(u)
+        if log_usage:
+            log_usage(u)
+
+    try:
+        return shared_runner().run(
+            cmd,
+            timeout=timeout,
+            logger=logger,
+            log_usage=record_usage,
+            limits=limits,
+            **kwargs,
+        )
+    except subprocess.CalledProcessError as e:
+        if limits:
+            limits.check(e, usage[0] if usage else None)
+        raise
+
+
+def run_cmd_threaded(cmd: list[str], /, timeout, logger, **kwargs):
+    """Like `run_cmd`, but using two threads per process."""
     import shlex
     import threading
     from time import monotonic, perf_counter_ns
@@ -180,6 +748,143 @@ def run_cmd(cmd: list[str], /, timeout, logger, **kwargs):
         raise
 
 
+BATCH_DELIMITER = "---"
+
+
+class BatchTool:
+    """A tool which is started once and then answers requests over stdin.
+
+    Each request is written as a single line, and the tool answers with any
+    number of lines followed by a line containing only `BATCH_DELIMITER`.
+    If the tool fails or does not answer within the timeout, it is stopped
+    and restarted on the next request.
+
+    The tool runs on the shared `Runner` like any other process, which
+    reads its answers, so it needs no threads of its own. A BatchTool can
+    only handle one request at a time. The `Limits` apply to the process
+    as a whole, not to each request.
+    """
+
+    def __init__(self, cmd: list[str], /, logger, limits=None, **kwargs):
+        if os.name != "posix":
+            raise NotImplementedError("batch tools need a posix system")
+        self.cmd = cmd
+        self.limits = limits
+        self.kwargs = kwargs
+        self.logger = logger.bind(process=summary64(cmd))
+        self.process: Future | None = None
+        self.stdin: int
+        self.answers: "queue.SimpleQueue[tuple[str, int] | None]"
+        self.lines: list[str] = []
+        self.usage: list[Usage] = []
+
+    def start(self):
+        import queue
+
+        self.answers = answers = queue.SimpleQueue()
+        self.lines = lines = []
+        self.usage = []
+        partial = bytearray()
+
+        def read(data: bytes):
+            from time import perf_counter_ns
+
+            partial.extend(data)
+            *complete, partial[:] = partial.split(b"\n")
+            for line in complete:
+                text = line.decode(errors="replace").rstrip("\r")
+                if text == BATCH_DELIMITER:
+                    answers.put(("".join(lines).strip(), perf_counter_ns()))
+                    lines.clear()
+                else:
+                    lines.append(text + "\n")
+
+        stdin, self.stdin = os.pipe()
+        try:
+            self.process = shared_runner().submit(
+                self.cmd,
+                timeout=None,
+                logger=self.logger,
+                log_usage=self.usage.append,
+                limits=self.limits,
+                stdin=stdin,
+                on_stdout=read,
+                **self.kwargs,
+            )
+        except BaseException:
+            os.close(self.stdin)
+            raise
+        finally:
+            os.close(stdin)
+        # The answers end, when the tool does
+        self.process.add_done_callback(lambda _: answers.put(None))
+
+    def stop(self) -> Usage | None:
+        """Stop the tool, and return its `Usage`."""
+        from concurrent.futures import wait
+
+        if self.process is None:
+            return None
+        process, self.process = self.process, None
+        self.logger.debug("stopping")
+        os.close(self.stdin)
+        if not wait([process], timeout=0.1).done:
+            shared_runner().kill(process)
+        wait([process])
+        return self.usage[0] if self.usage else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def request(self, request: str, /, timeout) -> tuple[str, int]:
+        """Send a request, and return the answer and the time it took.
+
+        Raises the same exceptions as `run_cmd`.
+        """
+        import queue
+        from time import perf_counter_ns
+
+        if self.process is None:
+            self.start()
+        assert self.process
+
+        self.logger.debug(f"request: {request}")
+        start_ns = perf_counter_ns()
+        try:
+            os.write(self.stdin, (request + "\n").encode())
+            answer = self.answers.get(timeout=timeout or None)
+        except BrokenPipeError:
+            answer = None
+        except queue.Empty:
+            self.logger.debug("request timed out, restarting")
+            output = "".join(self.lines)
+            self.stop()
+            raise subprocess.TimeoutExpired(
+                cmd=self.cmd, timeout=timeout, output=output
+            )
+
+        if answer is None:
+            process, output = self.process, "".join(self.lines).strip()
+            usage = self.stop()
+            try:
+                process.result()
+                # It ended without answering, but did not fail
+                error = subprocess.CalledProcessError(0, self.cmd, output)
+            except subprocess.CalledProcessError as e:
+                error = e
+                error.output = output
+            if self.limits:
+                self.limits.check(error, usage)
+            raise error
+
+        self.logger.debug("done")
+        stdout, end_ns = answer
+        return (stdout, end_ns - start_ns)
+
+
 def runtime(*args, enable_assertions=False, **kwargs):
     pargs = ["java", "-cp", "target/classes/"]
 
@@ -200,9 +905,8 @@ class Case:
 
     @staticmethod
     def from_spec(line):
-        if not (m := re.match(r"([^ ]*) +(\([^)]*\)) -> (.*)", line)):
-            raise ValueError(f"Unexpected line: {line!r}")
-        return Case(MethodId.parse(m.group(1)), Input.parse(m.group(2)), m.group(3))
+        methodid, input, result = parse_case(line)
+        return Case(MethodId.parse(methodid), Input.parse(input), result)
 
     def __str__(self) -> str:
         return f"{self.methodid.class_name}.{self.methodid.method_name}:{self.input} -> {self.result}"
@@ -291,52 +995,164 @@ class Suite:
         subprocess.call(["mvn", "compile"], cwd=self.workfolder)
         self.logger.info("Done")
 
-    def update_cases(self):
+    def update_cases(self, incremental=True):
+        """Update the cases and the distribution from the compiled classes.
+
+        In incremental mode only the cases of the case classes, which changed
+        since the last update, are extracted again. Returns the updated cases,
+        or None if all cases where updated.
+        """
+        import hashlib
+
+        stats = self.stats_folder()
+        manifest_file = self.workfolder / "target" / "cases.json"
+
+        classes = {
+            clazz.relative_to(self.classfiles).as_posix(): hashlib.sha256(
+                clazz.read_bytes()
+            ).hexdigest()
+            for clazz in sorted(self.classfiles.glob("**/*.class"))
+        }
+
+        changed = None
+        if (
+            incremental
+            and manifest_file.exists()
+            and (stats / "cases.txt").exists()
+            and (stats / "distribution.csv").exists()
+        ):
+            with open(manifest_file) as f:
+                manifest = json.load(f)
+            changed = {
+                name
+                for name in classes.keys() | manifest.keys()
+                if classes.get(name) != manifest.get(name)
+            }
+            if any(not name.startswith("jpamb/cases/") for name in changed):
+                changed = None
+
+        if changed is None:
+            self.update_all_cases()
+            updated = None
+        else:
+            updated = self.update_changed_cases(
+                {name.removesuffix(".class").split("$")[0] for name in changed}
+            )
+
+        manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(manifest_file, "w") as f:
+            json.dump(classes, f, indent=2, sort_keys=True)
+
+        self.logger.info("Done")
+        return updated
+
+    def update_all_cases(self):
         stats = self.stats_folder()
         self.logger.info("Writing the cases to file")
         with open(stats / "cases.txt", "w") as f:
             lines = runtime(cwd=self.workfolder).splitlines(keepends=True)
             f.write("".join(sorted(lines)))
+        self.write_case_db()
 
         self.logger.info("Updating the distribution")
+        occurrences = {
+            mid: self.occurrences(cases) for mid, cases in Case.by_methodid(self.cases())
+        }
+        sums = collections.Counter()
+        for occ in occurrences.values():
+            sums.update(t for t, o in zip(self.queries, occ) if o)
+        self.write_distribution(occurrences, sums)
+
+    def update_changed_cases(self, classes: set[str]) -> list["Case"]:
+        stats = self.stats_folder()
+        classes = {c.replace("/", ".") for c in classes}
+        if not classes:
+            self.logger.info("No case classes changed")
+            return []
+
+        self.logger.info(f"Extracting the cases of {', '.join(sorted(classes))}")
+        existing = [
+            c
+            for c in classes
+            if (self.classfiles / c.replace(".", "/")).with_suffix(".class").exists()
+        ]
+        new_lines = []
+        if existing:
+            new_lines = runtime("--cases", *existing, cwd=self.workfolder).splitlines(
+                keepends=True
+            )
 
-        with open(stats / "distribution.csv", "w") as f:
+        with open(stats / "cases.txt") as f:
+            lines = [
+                line
+                for line in f.readlines()
+                if line.split(" ", 1)[0].rsplit(".", 1)[0] not in classes
+            ]
+        with open(stats / "cases.txt", "w") as f:
+            f.write("".join(sorted(lines + new_lines)))
+        self.write_case_db()
+
+        self.logger.info("Updating the distribution")
+        updated = [Case.from_spec(line.rstrip("\n")) for line in new_lines]
+
+        occurrences, sums = self.read_distribution()
+        for mid in list(occurrences):
+            if mid.class_name in classes:
+                occ = occurrences.pop(mid)
+                sums.subtract(t for t, o in zip(self.queries, occ) if o)
+        for mid, cases in Case.by_methodid(updated):
+            occurrences[mid] = occ = self.occurrences(cases)
+            sums.update(t for t, o in zip(self.queries, occ) if o)
+        self.write_distribution(occurrences, sums)
+
+        return updated
+
+    def occurrences(self, cases: list["Case"]) -> list[int]:
+        results = {c.result for c in cases}
+        return [1 if t in results else 0 for t in self.queries]
+
+    def read_distribution(self):
+        with open(self.stats_folder() / "distribution.csv") as f:
+            rows = list(csv.reader(f))
+        occurrences = {
+            MethodId.parse(row[0]): [int(o) for o in row[1:]] for row in rows[1:-1]
+        }
+        sums = collections.Counter()
+        for occ in occurrences.values():
+            sums.update(t for t, o in zip(self.queries, occ) if o)
+        return occurrences, sums
+
+    def write_distribution(self, occurrences: dict[MethodId, list[int]], sums):
+        with open(self.stats_folder() / "distribution.csv", "w") as f:
             w = csv.writer(f, dialect="unix")
             w.writerow(["method"] + self.queries)
 
-            sums = collections.Counter()
-            total = 0
-
-            for mid, cases in Case.by_methodid(self.cases()):
-                occ = []
-                total += 1
-                for t in self.queries:
-                    if any(c.result == t for c in cases):
-                        occ.append(1)
-                        sums[t] += 1
-                    else:
-                        occ.append(0)
-
+            for mid, occ in sorted(occurrences.items()):
                 w.writerow([mid] + occ)
 
+            total = len(occurrences)
             w.writerow(["-"] + [f"{sums[t] / total:0.4%}" for t in self.queries])
 
-        self.logger.info("Done")
-
     def cases(self):
-        with open(self.stats_folder() / "cases.txt", "r") as f:
-            for r in f.readlines():
-                yield Case.from_spec(r[:-1])
-
-    def check(self):
-        self.logger.info("Checking cases")
-        failed = []
+        db = CaseDB.load_or_build(self.stats_folder(), self.logger)
+        for methodid, cases in db.all_cases():
+            for _, values, result in cases:
+                yield Case(methodid, Input(values), result)
 
-        for case in self.cases():
+    def write_case_db(self):
+        """Build the case database from the cases, see `jpamb_utils.cases`."""
+        stats = self.stats_folder()
+        self.logger.info("Writing the case database")
+        source = stamp(stats / "cases.txt")
+        lines = (stats / "cases.txt").read_text().splitlines()
+        CaseDB.build(lines, self.queries, source).write(stats / "cases.db")
+
+    def run_cases(self, cases, timeout):
+        """Run each case in its own jvm, and yield the results."""
+        for case in cases:
             self.logger.debug(f"Testing {case!s:<74}")
             cmd = ["java", "-cp", self.classfiles, "-ea"]
             cmd += ["jpamb.Runtime", str(case.methodid), str(case.input)]
-            timeout = 0.5
             try:
                 result, time = run_cmd(
                     cmd,
@@ -350,7 +1166,101 @@ class Suite:
             except subprocess.TimeoutExpired:
                 result = "*"
                 self.logger.debug(f"Timed out after {timeout}.")
+            yield (case, result)
+
+    def run_cases_batch(self, cases, timeout):
+        """Run the cases in a single jvm, and yield the results.
+
+        The runtime exits after a case times out, or if it crashes, in which
+        case it is restarted with the remaining cases. It runs on the shared
+        `Runner`, which logs its stderr, and if the results are not consumed
+        to the end, the jvm is killed.
+        """
+        import queue
+        import threading
+        from concurrent.futures import wait
+
+        runner = shared_runner()
+        remaining = list(cases)
+        while remaining:
+            cmd = ["java", "-cp", self.classfiles, "-ea", "jpamb.Runtime"]
+            cmd += ["--batch", str(int(timeout * 1000))]
+            self.logger.debug(f"Starting a jvm for {len(remaining)} cases")
+            results: "queue.SimpleQueue[str | None]" = queue.SimpleQueue()
+            partial = bytearray()
+
+            def read(data, partial=partial, results=results):
+                partial.extend(data)
+                *lines, partial[:] = partial.split(b"\n")
+                for line in lines:
+                    results.put(line.decode(errors="replace").strip())
+
+            stdin, feed = os.pipe()
+            try:
+                process = runner.submit(
+                    cmd, timeout=None, logger=self.logger, stdin=stdin, on_stdout=read
+                )
+            except BaseException:
+                os.close(feed)
+                raise
+            finally:
+                os.close(stdin)
+            process.add_done_callback(lambda _, results=results: results.put(None))
+
+            def write_cases(feed, cases):
+                try:
+                    with open(feed, "w") as f:
+                        for case in cases:
+                            f.write(f"{case.methodid} {case.input}\n")
+                except BrokenPipeError:
+                    # The runtime exited before it read all the cases
+                    pass
+
+            threading.Thread(
+                target=write_cases, args=(feed, list(remaining)), daemon=True
+            ).start()
+
+            done = 0
+            try:
+                while (line := results.get()) is not None:
+                    yield (remaining[done], line)
+                    done += 1
+            finally:
+                if not process.done():
+                    runner.kill(process)
+                wait([process])
 
+            try:
+                process.result()
+                exitcode = 0
+            except subprocess.CalledProcessError as e:
+                exitcode = e.returncode
+                stderr = [line for line in e.stderr.splitlines() if line.strip()]
+                self.logger.warning(f"The runtime failed with {exitcode}:")
+                for line in stderr[-20:]:
+                    self.logger.warning(line)
+
+            if done < len(remaining) and (exitcode != 0 or done == 0):
+                self.logger.debug(f"Process failed with {exitcode}.")
+                yield (remaining[done], None)
+                done += 1
+
+            remaining = remaining[done:]
+
+    def check(self, cases=None, batch=True, timeout=0.5):
+        """Check the cases, or all cases if none are given."""
+        self.logger.info("Checking cases")
+        failed = []
+
+        if cases is None:
+            cases = self.cases()
+
+        if batch:
+            results = self.run_cases_batch(cases, timeout)
+        else:
+            results = self.run_cases(cases, timeout)
+
+        for case, result in results:
             outcome = "SUCCESS"
             if case.result != result:
                 outcome = "FAILED"
@@ -367,23 +1277,89 @@ class Suite:
             self.logger.success("Successfully verified all cases.")
             return True
 
-    def decompile(self):
+    def decompile(self, jobs=None, force=False):
+        """Decompile the classfiles, which changed since the last decompilation.
+
+        The content hash of each decompiled classfile is recorded in a manifest
+        in the target folder, so a clean build decompiles everything. The
+        decompiled files of classfiles which no longer exist are removed.
+
+        Like before, the output of jvm2json is normalized with sorted keys and
+        an indent, so the decompiled files are easy to diff. It is parsed from
+        memory and written once.
+        """
+        import hashlib
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
         self.logger.info("Decompiling classfiles")
         decompiled = self.decompiled()
-        for clazz in self.classfiles.glob("**/*.class"):
+        manifest_file = self.workfolder / "target" / "decompiled.json"
+
+        manifest = {}
+        if manifest_file.exists():
+            with open(manifest_file) as f:
+                manifest = json.load(f)
+
+        todo = []
+        classfiles = set()
+        for clazz in sorted(self.classfiles.glob("**/*.class")):
+            name = clazz.relative_to(self.classfiles).as_posix()
+            classfiles.add(name)
             jsonclazz = decompiled / clazz.relative_to(self.classfiles).with_suffix(
                 ".json"
             )
+            digest = hashlib.sha256(clazz.read_bytes()).hexdigest()
+            if not force and manifest.get(name) == digest and jsonclazz.exists():
+                self.logger.debug(f"Skipping unchanged {name}")
+                continue
+            todo.append((name, digest, clazz, jsonclazz))
+
+        for name in sorted(manifest.keys() - classfiles):
+            self.logger.info(f"Removing the decompiled {name}, it no longer exists")
+            (decompiled / name).with_suffix(".json").unlink(missing_ok=True)
+            del manifest[name]
+
+        def convert(clazz, jsonclazz):
             self.logger.info(
                 f"Converting {clazz.relative_to(self.workfolder)} to {jsonclazz.relative_to(self.workfolder)}"
             )
             jsonclazz.parent.mkdir(parents=True, exist_ok=True)
-            cmd = ["jvm2json", f"-s{clazz}"]
-            res, _ = run_cmd(cmd, timeout=None, logger=self.logger)
+            res = subprocess.run(
+                ["jvm2json", f"-s{clazz}"], stdout=subprocess.PIPE, check=True
+            ).stdout
             if not res:
-                self.logger.warning(f"jvm2json: {res}")
-            self.logger.trace(res)
+                self.logger.warning(f"jvm2json: no output for {clazz}")
             encoding = json.loads(res)
-            with open(jsonclazz, "w") as f:
-                json.dump(encoding, f, indent=2, sort_keys=True)
+            tmpfile = jsonclazz.with_suffix(".json.tmp")
+            try:
+                with open(tmpfile, "w") as f:
+                    json.dump(encoding, f, indent=2, sort_keys=True)
+                os.replace(tmpfile, jsonclazz)
+            finally:
+                tmpfile.unlink(missing_ok=True)
+
+        self.logger.info(f"Decompiling {len(todo)} changed classfiles")
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                futures = {
+                    pool.submit(convert, clazz, jsonclazz): (name, digest)
+                    for (name, digest, clazz, jsonclazz) in todo
+                }
+                for future in as_completed(futures):
+                    future.result()
+                    name, digest = futures[future]
+                    manifest[name] = digest
+        finally:
+            manifest_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(manifest_file, "w") as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+
+        self.write_feature_table()
         self.logger.success("Done decompiling classfiles")
+
+    def write_feature_table(self):
+        """Build the feature table of the decompiled methods, see
+        `jpamb_utils.features`."""
+        self.logger.info("Writing the feature table")
+        decompiled = self.decompiled()
+        FeatureTable.build(decompiled).write(decompiled / "features.db")
@@ -1,10 +1,16 @@
-from typing import NoReturn, TypeAlias, Literal, Optional
+from typing import Callable, NoReturn, TypeAlias, TypeVar, Literal, Optional
 from dataclasses import dataclass
+from array import array
 from collections import namedtuple
 from pathlib import Path
+import os
 import re
 import sys
 
+T = TypeVar("T")
+
+CACHE_FOLDER = Path(os.environ.get("JPAMB_CACHE", ".cache"))
+
 
 JvmType: TypeAlias = (
     Literal["boolean"]
@@ -74,30 +80,174 @@ def parse_type(input_type: str) -> tuple[JvmType, str]:
         raise ValueError(f"Unknown type {input_type}")
 
 
-def string_compare(cls):
+_CACHE: dict[tuple[str, Path], tuple[tuple[int, int], object]] = {}
+
+
+def load_cached(kind: str, source: Path, build: Callable[[bytes], T]) -> T:
+    """Compute `build(content)` of the source file once.
+
+    The result is kept in memory and pickled under `CACHE_FOLDER / kind`, so
+    later invocations can reuse it. An entry is invalidated when the mtime
+    of the source file changes and its content hash no longer matches.
+    """
+    import hashlib
+    import pickle
+
+    source = Path(source).absolute()
+    stat = source.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    if (hit := _CACHE.get((kind, source))) and hit[0] == stamp:
+        return hit[1]  # type: ignore
+
+    name = hashlib.sha256(str(source).encode()).hexdigest()[:32]
+    cachefile = CACHE_FOLDER / kind / f"{name}.pickle"
+
+    try:
+        with open(cachefile, "rb") as f:
+            (cstamp, cdigest, value) = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        cstamp, cdigest, value = None, None, None
+
+    if cstamp != stamp:
+        content = source.read_bytes()
+        digest = hashlib.sha256(content).hexdigest()
+        if cdigest != digest:
+            value = build(content)
+        try:
+            cachefile.parent.mkdir(parents=True, exist_ok=True)
+            tmpfile = cachefile.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmpfile, "wb") as f:
+                pickle.dump((stamp, digest, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpfile, cachefile)
+        except OSError:
+            # The cache is only an optimization, a read-only checkout is fine.
+            pass
+
+    _CACHE[(kind, source)] = (stamp, value)
+    return value  # type: ignore
+
+
+def print_descriptor(tpe: Optional[dict]) -> str:
+    """Print a decompiled (jvm2json) type as a method descriptor."""
+    BASE_LOOKUP = {
+        "boolean": "Z",
+        "byte": "B",
+        "char": "C",
+        "short": "S",
+        "int": "I",
+        "long": "J",
+        "float": "F",
+        "double": "D",
+    }
+    if tpe is None:
+        return "V"
+    if "base" in tpe:
+        return BASE_LOOKUP[tpe["base"]]
+    if tpe.get("kind") == "array":
+        return "[" + print_descriptor(tpe["type"])
+    if tpe.get("kind") == "class":
+        name = tpe["name"]
+        inner = tpe.get("inner")
+        while inner:
+            name += "$" + inner["name"]
+            inner = inner.get("inner")
+        return f"L{name};"
+    raise ValueError(f"Can't handle {tpe}")
+
+
+def invoke_target(method: dict) -> str:
+    """The full `MethodId` string of the method of an invoke instruction.
+
+    In the instructions base types are plain strings, like `"int"`, instead
+    of `{"base": "int"}` like in the methods.
+    """
+
+    def decompiled_type(tpe):
+        if isinstance(tpe, str):
+            return {"base": tpe}
+        if tpe is not None and tpe.get("kind") == "array":
+            return {"kind": "array", "type": decompiled_type(tpe["type"])}
+        return tpe
+
+    ref = method["ref"]
+    if ref.get("kind") == "array":
+        # Like `clone` of an array, which is named by its descriptor
+        class_name = print_descriptor(decompiled_type(ref))
+    else:
+        class_name = ref["name"].replace("/", ".")
+    params = "".join(print_descriptor(decompiled_type(a)) for a in method["args"])
+    returns = print_descriptor(decompiled_type(method["returns"]))
+    return f"{class_name}.{method['name']}:({params}){returns}"
+
+
+def method_index(classfile: Path) -> dict[str, dict]:
+    """Index the methods of a decompiled class by their full `MethodId` string."""
+
+    def build(content: bytes) -> dict[str, dict]:
+        import json
+
+        clazz = json.loads(content)
+        class_name = clazz["name"].replace("/", ".")
+        index = {}
+        for m in clazz["methods"]:
+            params = "".join(print_descriptor(p["type"]) for p in m["params"])
+            returns = print_descriptor(m["returns"]["type"])
+            index[f"{class_name}.{m['name']}:({params}){returns}"] = m
+        return index
+
+    return load_cached("methods", classfile, build)
+
+
+def key_compare(cls):
+    """Order values of the same type by their value, and otherwise by type.
+
+    The values are compared directly, and list values compare their arrays
+    element by element without boxing them.
+    """
     from functools import total_ordering
 
-    cls.__eq__ = lambda self, other: str(self) == str(other)
-    cls.__le__ = lambda self, other: str(self) < str(other)
+    def key(self):
+        return (cls.RANK, self.value)
+
+    def eq(self, other):
+        if not isinstance(other, VALUE_TYPES):
+            return NotImplemented
+        return type(self) is type(other) and self.value == other.value
+
+    def lt(self, other):
+        if not isinstance(other, VALUE_TYPES):
+            return NotImplemented
+        return key(self) < (other.RANK, other.value)
+
+    def hash_(self):
+        value = self.value
+        return hash((cls.RANK, value.tobytes() if isinstance(value, array) else value))
+
+    cls.__eq__ = eq
+    cls.__lt__ = lt
+    cls.__hash__ = hash_
     return total_ordering(cls)
 
 
-@dataclass(frozen=True)
-@string_compare
+@key_compare
+@dataclass(frozen=True, eq=False)
 class BoolValue:
     value: bool
+    RANK = 0
 
     def __str__(self):
         return "true" if self.value else "false"
 
     def tolocal(self):
-        return IntValue(1) if self.value else IntValue(0)
+        return 1 if self.value else 0
 
 
-@dataclass(frozen=True)
-@string_compare
+@key_compare
+@dataclass(frozen=True, eq=False)
 class IntValue:
     value: int
+    RANK = 1
 
     def __str__(self):
         return str(self.value)
@@ -106,44 +256,75 @@ class IntValue:
         return self.value
 
 
-@dataclass(frozen=True)
-@string_compare
+@key_compare
+@dataclass(frozen=True, eq=False)
 class CharValue:
     value: str
+    RANK = 2
 
     def __str__(self):
         return f"'{self.value}'"
 
     def tolocal(self):
-        return IntValue(ord(self.value[0]))
+        return ord(self.value)
+
+
+def _to_array(typecode: str, values) -> array:
+    """Convert values, or IntValues and CharValues, to an array."""
+    if isinstance(values, array) and values.typecode == typecode:
+        return values
+    if isinstance(values, str):
+        return array(typecode, map(ord, values))
+    return array(
+        typecode,
+        (v.tolocal() if isinstance(v, (IntValue, CharValue)) else v for v in values),
+    )
 
 
-@dataclass(frozen=True)
-@string_compare
+@key_compare
+@dataclass(frozen=True, eq=False)
 class IntListValue:
-    value: tuple[int]
+    """A list of ints, stored in an `array("i")`, which must not be changed."""
+
+    value: array
+    RANK = 3
+
+    def __post_init__(self):
+        object.__setattr__(self, "value", _to_array("i", self.value))
 
     def __str__(self) -> str:
-        val = ", ".join(str(a) for a in self.value)
+        val = ", ".join(map(str, self.value))
         return f"[I:{val}]"
 
-    def tolocal(self):
-        return self.value
+    def tolocal(self) -> array:
+        """A copy of the array, which the interpreter may change."""
+        return self.value[:]
 
 
-@dataclass(frozen=True)
-@string_compare
+@key_compare
+@dataclass(frozen=True, eq=False)
 class CharListValue:
-    value: tuple[str]
+    """A list of chars, stored as an `array("H")` of the char codes, which
+    must not be changed.
+    """
+
+    value: array
+    RANK = 4
+
+    def __post_init__(self):
+        object.__setattr__(self, "value", _to_array("H", self.value))
 
     def __str__(self) -> str:
-        val = ", ".join(str(a) for a in self.value)
+        val = ", ".join(f"'{chr(c)}'" for c in self.value)
         return f"[C:{val}]"
 
-    def tolocal(self):
-        return self.value
+    def tolocal(self) -> array:
+        """A copy of the array, which the interpreter may change."""
+        return self.value[:]
 
 
+VALUE_TYPES = (BoolValue, IntValue, CharValue, IntListValue, CharListValue)
+
 JvmValue: TypeAlias = BoolValue | IntValue | CharValue | IntListValue | CharListValue
 
 
@@ -187,47 +368,38 @@ class MethodId:
         return Path("src/main/java", *self.class_name.split(".")).with_suffix(".java")
 
     def load(self):
-        import json
+        """Load the decompiled method, see `method_index`.
 
-        classfile = self.classfile()
-        with open(classfile) as f:
-            classfile = json.load(f)
-        for m in classfile["methods"]:
-            if m["name"] != self.method_name:
-                continue
-            if len(self.params) != len(m["params"]):
-                continue
-            for p, t in zip(self.params, m["params"]):
-                if "base" in t["type"]:
-                    if t["type"]["base"] == p:
-                        continue
-                    break
-                elif "kind" in t["type"] and t["type"]["kind"] == "array":
-                    if t["type"]["type"]["base"] + "[]" == p:
-                        continue
-                    break
-                else:
-                    raise ValueError(f"Can't handle {t['type']}")
-            else:
-                return m
-        else:
+        The returned dictionary is shared between calls, so don't change it.
+        """
+        try:
+            return method_index(self.classfile())[str(self)]
+        except KeyError:
             raise ValueError(f"Could not find method {self.method_name}")
 
+    def cfg(self):
+        """Get the control flow graph of the method, see `jpamb_utils.cfg`."""
+        from jpamb_utils.cfg import control_flow_graphs
 
-@dataclass
-class InputParser:
-    Token = namedtuple("Token", "kind value")
+        try:
+            return control_flow_graphs(self.classfile())[str(self)]
+        except KeyError:
+            raise ValueError(f"Could not find code for method {self.method_name}")
 
-    tokens: list["InputParser.Token"]
-    input: str
+    def source(self):
+        """Get the declaration of the method in its source, see `jpamb_utils.source`."""
+        from jpamb_utils.source import source_index
 
-    def __init__(self, input) -> None:
-        self.input = input
-        self.tokens = list(InputParser.tokenize(input))
+        try:
+            return source_index(self.sourcefile())[str(self)]
+        except KeyError:
+            raise ValueError(f"Could not find the source of method {self.method_name}")
 
-    @staticmethod
-    def tokenize(string):
-        token_specification = [
+
+_TOKENS = re.compile(
+    "|".join(
+        f"(?P<{n}>{m})"
+        for n, m in [
             ("OPEN_ARRAY", r"\[[IC]:"),
             ("CLOSE_ARRAY", r"\]"),
             ("OPEN_INPUTS", r"\("),
@@ -238,9 +410,36 @@ class InputParser:
             ("COMMA", r","),
             ("SKIP", r"[ \t]+"),
         ]
-        tok_regex = "|".join(f"(?P<{n}>{m})" for n, m in token_specification)
+    )
+)
+
+# The content and end of well-formed arrays, which are parsed in one go
+_INT_ARRAY = re.compile(r"[ \t]*(-?\d+(?:[ \t]*,[ \t]*-?\d+)*)?[ \t]*\]")
+_CHAR_ARRAY = re.compile(r"[ \t]*('[^']'(?:[ \t]*,[ \t]*'[^']')*)?[ \t]*\]")
+_CHAR = re.compile(r"'([^'])'")
+
+
+@dataclass
+class InputParser:
+    """A parser of inputs, like `(1, [I:1, 2], 'a')`.
+
+    The parser scans one token ahead of its position in the input, so parsing
+    is linear in the size of the input.
+    """
+
+    Token = namedtuple("Token", "kind value")
+
+    input: str
+    pos: int
 
-        for m in re.finditer(tok_regex, string):
+    def __init__(self, input) -> None:
+        self.input = input
+        self.pos = 0
+        self._head: Optional["InputParser.Token"] = None
+
+    @staticmethod
+    def tokenize(string):
+        for m in _TOKENS.finditer(string):
             kind, value = m.lastgroup, m.group()
             if kind == "SKIP":
                 continue
@@ -248,19 +447,32 @@ class InputParser:
 
     @staticmethod
     def parse(string) -> list[JvmValue]:
-        return InputParser(string).parse_inputs()
+        parser = InputParser(string)
+        inputs = parser.parse_inputs()
+        if parser.head is not None:
+            parser.expected("end of input")
+        return inputs
 
     @property
-    def head(self):
-        if self.tokens:
-            return self.tokens[0]
+    def head(self) -> Optional["InputParser.Token"]:
+        if self._head is None:
+            while m := _TOKENS.match(self.input, self.pos):
+                self.pos = m.end()
+                if m.lastgroup != "SKIP":
+                    self._head = InputParser.Token(m.lastgroup, m.group())
+                    break
+            else:
+                if self.pos < len(self.input):
+                    self.expected("token")
+        return self._head
 
     def next(self):
-        self.tokens = self.tokens[1:]
+        self._head = None
 
     def expected(self, expected) -> NoReturn:
+        got = self._head or self.input[self.pos : self.pos + 10] or "end of input"
         raise ValueError(
-            f"Expected {expected} but got {self.tokens[:3]} in {self.input}"
+            f"Expected {expected} but got {got!r} at {self.pos} in {self.input}"
         )
 
     def expect(self, expect) -> Token:
@@ -299,12 +511,29 @@ class InputParser:
         if key.value == "[I:":  # ]
             listtype = IntListValue
             parser = self.parse_int
+            if m := _INT_ARRAY.match(self.input, self.pos):
+                content = m.group(1)
+                try:
+                    value = array("i", map(int, content.split(",")) if content else ())
+                except OverflowError:
+                    self.expected("ints in the int range")
+                self.pos = m.end()
+                return IntListValue(value)
         elif key.value == "[C:":  # ]
             listtype = CharListValue
             parser = self.parse_char
+            if m := _CHAR_ARRAY.match(self.input, self.pos):
+                content = m.group(1) or ""
+                try:
+                    value = array("H", map(ord, _CHAR.findall(content)))
+                except OverflowError:
+                    self.expected("chars in the char range")
+                self.pos = m.end()
+                return CharListValue(value)
         else:
             self.expected("int or char array")
 
+        # The array is malformed, so parse it token by token to report it
         inputs = []
 
         if self.head is None:
@@ -332,6 +561,7 @@ class InputParser:
             self.expected("input or )")
 
         if self.head.kind == "CLOSE_INPUTS":
+            self.next()
             return inputs
 
         inputs.append(self.parse_input())
@@ -0,0 +1,629 @@
+""" A worklist based abstract interpreter for the decompiled bytecode.
+
+The `fixpoint` engine iterates an `Analysis` over the basic blocks of a
+method. The worklist is ordered by reverse postorder, abstract states are
+only stored for the entry of reached blocks, and at loop heads the states
+are widened, so loops are not unrolled.
+
+An `Analysis` is the pluggable abstract domain, it defines the initial
+state, join, widening, the ordering and the transfer function of a block.
+The `IntervalAnalysis` tracks integers as intervals, references by their
+nullness and allocation site, and arrays by their length and a summary of
+their elements. It is used by `verdicts` to compute which queries might
+happen:
+
+    >>> verdicts(MethodId.parse("jpamb.cases.Simple.divideByN:(I)I"))
+    {'*': False, 'assertion error': False, 'divide by zero': True, ...}
+
+The exceptions the analysis knows about are passed to the exception
+handlers of the method, which catch them, and other exceptions, like those
+of a called method, might go to any handler. A query that might not happen
+is never reachable, if the method only uses instructions the analysis knows
+about, and the handlers only catch the exceptions of the queries.
+"""
+
+from dataclasses import dataclass, field
+from typing import Generic, Iterable, NamedTuple, Protocol, TypeVar
+import heapq
+
+from jpamb_utils import MethodId
+from jpamb_utils.cfg import BasicBlock, ControlFlowGraph
+from jpamb_utils.interpreter import BINARY_OPERATIONS, EXCEPTIONS
+
+S = TypeVar("S")
+
+QUERIES = [
+    "*",
+    "assertion error",
+    "divide by zero",
+    "null pointer",
+    "ok",
+    "out of bounds",
+]
+
+ERRORS = ["assertion error", "divide by zero", "null pointer", "out of bounds"]
+
+# The exception of each error, with its superclasses, which handlers catch
+RAISES = {
+    "assertion error": (
+        "java/lang/AssertionError",
+        "java/lang/Error",
+        "java/lang/Throwable",
+    ),
+    "divide by zero": (
+        "java/lang/ArithmeticException",
+        "java/lang/RuntimeException",
+        "java/lang/Exception",
+        "java/lang/Throwable",
+    ),
+    "null pointer": (
+        "java/lang/NullPointerException",
+        "java/lang/RuntimeException",
+        "java/lang/Exception",
+        "java/lang/Throwable",
+    ),
+    "out of bounds": (
+        "java/lang/ArrayIndexOutOfBoundsException",
+        "java/lang/IndexOutOfBoundsException",
+        "java/lang/RuntimeException",
+        "java/lang/Exception",
+        "java/lang/Throwable",
+    ),
+}
+
+
+class Analysis(Protocol[S]):
+    def initial(self) -> S: ...
+
+    def join(self, a: S, b: S) -> S: ...
+
+    def widen(self, old: S, new: S) -> S: ...
+
+    def leq(self, a: S, b: S) -> bool: ...
+
+    def transfer(self, block: BasicBlock, state: S) -> Iterable[tuple[int, S]]:
+        """The states at the instructions the block continues to."""
+        ...
+
+
+@dataclass
+class Fixpoint(Generic[S]):
+    states: dict[int, S]
+    iterations: int
+    loops: set[tuple[int, int]] = field(default_factory=set)
+    """The back edges, which the analysis found might be taken."""
+
+
+def fixpoint(
+    cfg: ControlFlowGraph,
+    analysis: Analysis[S],
+    max_iterations: int = 100_000,
+    widen_delay: int = 2,
+) -> Fixpoint[S]:
+    """Compute the states at the entry of each reachable block.
+
+    States at loop heads are joined `widen_delay` times, before they are
+    widened.
+    """
+    order = {b: i for i, b in enumerate(cfg.order)}
+    states: dict[int, S] = {0: analysis.initial()}
+    visits: dict[int, int] = {}
+    result = Fixpoint(states, 0)
+
+    worklist = [(order[0], 0)]
+    pending = {0}
+    while worklist:
+        if result.iterations >= max_iterations:
+            raise RuntimeError(f"no fixpoint after {max_iterations} iterations")
+        result.iterations += 1
+
+        _, b = heapq.heappop(worklist)
+        pending.discard(b)
+        for target, out in analysis.transfer(cfg.blocks[b], states[b]):
+            succ = cfg.block_of[target]
+            is_back_edge = order[succ] <= order[b]
+            if is_back_edge:
+                result.loops.add((b, succ))
+
+            if (old := states.get(succ)) is None:
+                new = out
+            elif analysis.leq(out, old):
+                continue
+            elif is_back_edge and visits.get(succ, 0) >= widen_delay:
+                new = analysis.widen(old, analysis.join(old, out))
+            else:
+                visits[succ] = visits.get(succ, 0) + 1
+                new = analysis.join(old, out)
+
+            states[succ] = new
+            if succ not in pending:
+                pending.add(succ)
+                heapq.heappush(worklist, (order[succ], succ))
+
+    return result
+
+
+INT_MIN, INT_MAX = -(2**31), 2**31 - 1
+
+
+class Interval(NamedTuple):
+    lo: int
+    hi: int
+
+    def __contains__(self, value) -> bool:
+        return self.lo <= value <= self.hi
+
+    def meet(self, other: "Interval") -> "Interval | None":
+        lo, hi = max(self.lo, other.lo), min(self.hi, other.hi)
+        return Interval(lo, hi) if lo <= hi else None
+
+    @staticmethod
+    def of(lo, hi) -> "Interval":
+        """The interval, or top if it does not fit in an int."""
+        if lo < INT_MIN or hi > INT_MAX:
+            return TOP_INT
+        return Interval(lo, hi)
+
+
+TOP_INT = Interval(INT_MIN, INT_MAX)
+
+
+class Ref(NamedTuple):
+    """A reference, which might be null or point to one of the allocation sites."""
+
+    null: bool
+    sites: frozenset
+
+
+class Array(NamedTuple):
+    length: Interval
+    elements: object
+
+
+class _Top:
+    def __repr__(self):
+        return "TOP"
+
+
+TOP = _Top()
+"""An unknown value, of any type."""
+
+
+def join_value(a, b):
+    if a == b:
+        return a
+    if isinstance(a, Interval) and isinstance(b, Interval):
+        return Interval(min(a.lo, b.lo), max(a.hi, b.hi))
+    if isinstance(a, Ref) and isinstance(b, Ref):
+        return Ref(a.null or b.null, a.sites | b.sites)
+    if isinstance(a, Array) and isinstance(b, Array):
+        return Array(join_value(a.length, b.length), join_value(a.elements, b.elements))
+    return TOP
+
+
+def widen_value(old, new):
+    if isinstance(old, Interval) and isinstance(new, Interval):
+        return Interval(
+            old.lo if new.lo >= old.lo else INT_MIN,
+            old.hi if new.hi <= old.hi else INT_MAX,
+        )
+    if isinstance(old, Array) and isinstance(new, Array):
+        return Array(
+            widen_value(old.length, new.length),
+            widen_value(old.elements, new.elements),
+        )
+    return join_value(old, new)
+
+
+def leq_value(a, b) -> bool:
+    if a == b or b is TOP:
+        return True
+    if isinstance(a, Interval) and isinstance(b, Interval):
+        return b.lo <= a.lo and a.hi <= b.hi
+    if isinstance(a, Ref) and isinstance(b, Ref):
+        return (b.null or not a.null) and a.sites <= b.sites
+    if isinstance(a, Array) and isinstance(b, Array):
+        return leq_value(a.length, b.length) and leq_value(a.elements, b.elements)
+    return False
+
+
+class State(NamedTuple):
+    locals: tuple
+    stack: tuple
+    heap: dict
+    """The arrays by allocation site, updated weakly."""
+
+
+NEGATED = {
+    "eq": "ne",
+    "ne": "eq",
+    "lt": "ge",
+    "ge": "lt",
+    "gt": "le",
+    "le": "gt",
+    "is": "isnot",
+    "isnot": "is",
+}
+
+FLIPPED = {"eq": "eq", "ne": "ne", "lt": "gt", "ge": "le", "gt": "lt", "le": "ge"}
+
+
+def refine(x: Interval, cond: str, y: Interval) -> Interval | None:
+    """The values of x for which `x cond y` might hold, or None if it can't."""
+    match cond:
+        case "eq":
+            return x.meet(y)
+        case "ne":
+            if y.lo != y.hi:
+                return x
+            if x.lo == x.hi == y.lo:
+                return None
+            if x.lo == y.lo:
+                return Interval(x.lo + 1, x.hi)
+            if x.hi == y.lo:
+                return Interval(x.lo, x.hi - 1)
+            return x
+        case "lt":
+            return x.meet(Interval(INT_MIN, y.hi - 1))
+        case "le":
+            return x.meet(Interval(INT_MIN, y.hi))
+        case "gt":
+            return x.meet(Interval(y.lo + 1, INT_MAX))
+        case "ge":
+            return x.meet(Interval(y.lo, INT_MAX))
+    return x
+
+
+def arithmetic(operant: str, a: Interval, b: Interval) -> Interval:
+    if a.lo == a.hi and b.lo == b.hi and not (operant in ("div", "rem") and b.lo == 0):
+        value = BINARY_OPERATIONS[operant](a.lo, b.lo)
+        return Interval(value, value)
+    match operant:
+        case "add":
+            return Interval.of(a.lo + b.lo, a.hi + b.hi)
+        case "sub":
+            return Interval.of(a.lo - b.hi, a.hi - b.lo)
+        case "mul":
+            corners = [a.lo * b.lo, a.lo * b.hi, a.hi * b.lo, a.hi * b.hi]
+            return Interval.of(min(corners), max(corners))
+        case "rem" if b.lo > 0 and a.lo >= 0:
+            return Interval(0, min(a.hi, b.hi - 1))
+    return TOP_INT
+
+
+CASTS = {
+    "byte": Interval(-(2**7), 2**7 - 1),
+    "short": Interval(-(2**15), 2**15 - 1),
+    "char": Interval(0, 2**16 - 1),
+}
+
+PARAMS = {
+    "boolean": Interval(0, 1),
+    "int": TOP_INT,
+    "char": CASTS["char"],
+}
+
+
+class IntervalAnalysis:
+    """An interval analysis, which collects the queries that might happen.
+
+    The inputs are never null, as the input format can't express that.
+    """
+
+    def __init__(self, methodid: MethodId, method: dict, cfg: ControlFlowGraph):
+        self.methodid = methodid
+        self.cfg = cfg
+        self.bytecode = method["code"]["bytecode"]
+        self.max_locals = method["code"]["max_locals"]
+        self.queries: set[str] = set()
+
+    def initial(self) -> State:
+        locals, heap = [], {}
+        for i, param in enumerate(self.methodid.params):
+            if param.endswith("[]"):
+                site = ("param", i)
+                heap[site] = Array(
+                    Interval(0, INT_MAX), PARAMS.get(param[:-2], TOP_INT)
+                )
+                locals.append(Ref(False, frozenset([site])))
+            else:
+                locals.append(PARAMS.get(param, TOP_INT))
+        locals += [TOP] * (self.max_locals - len(locals))
+        return State(tuple(locals), (), heap)
+
+    def join(self, a: State, b: State) -> State:
+        return self._combine(a, b, join_value)
+
+    def widen(self, old: State, new: State) -> State:
+        return self._combine(old, new, widen_value)
+
+    def _combine(self, a: State, b: State, fn) -> State:
+        heap = dict(a.heap)
+        for site, array in b.heap.items():
+            heap[site] = fn(heap[site], array) if site in heap else array
+        return State(
+            tuple(map(fn, a.locals, b.locals)),
+            tuple(map(fn, a.stack, b.stack)),
+            heap,
+        )
+
+    def leq(self, a: State, b: State) -> bool:
+        return (
+            all(map(leq_value, a.locals, b.locals))
+            and all(map(leq_value, a.stack, b.stack))
+            and all(
+                site in b.heap and leq_value(array, b.heap[site])
+                for site, array in a.heap.items()
+            )
+        )
+
+    def transfer(self, block: BasicBlock, state: State):
+        caught: list[tuple[int, State]] = []
+        yield from self._transfer(block, state, caught)
+        # The states at the handlers, which the block threw to
+        yield from caught
+
+    def _transfer(self, block: BasicBlock, state: State, caught: list):
+        locals = list(state.locals)
+        # The stack holds pairs of values and the local they where loaded from
+        stack = [(v, None) for v in state.stack]
+        heap = dict(state.heap)
+
+        handlers = self.cfg.handlers[block.index]
+
+        def pop():
+            return stack.pop()[0]
+
+        def catch(handler, exception):
+            """Continue at the handler with the exception on the stack."""
+            out = State(tuple(locals), (exception,), dict(heap))
+            caught.append((self.cfg.blocks[handler.block].start, out))
+
+        def throw(query):
+            """The error happens, unless a handler catches it."""
+            for handler in handlers:
+                if handler.catch_type is None or handler.catch_type in RAISES[query]:
+                    site = ("new", pc, RAISES[query][0])
+                    catch(handler, Ref(False, frozenset([site])))
+                    return
+            self.queries.add(query)
+
+        def throw_any():
+            """Any exception might happen, and might be caught by any handler."""
+            for handler in handlers:
+                catch(handler, TOP)
+
+        def push(value, origin=None):
+            stack.append((value, origin))
+
+        def forget(index):
+            for i, (value, origin) in enumerate(stack):
+                if origin == index:
+                    stack[i] = (value, None)
+
+        def deref(ref) -> Array | None:
+            """The array the reference points to, or None if it's always null."""
+            if not isinstance(ref, Ref):
+                throw("null pointer")
+                throw("out of bounds")
+                return Array(Interval(0, INT_MAX), TOP)
+            if ref.null:
+                throw("null pointer")
+            array = None
+            for site in ref.sites:
+                array = heap[site] if array is None else join_value(array, heap[site])
+            return array
+
+        def check_index(array: Array, index) -> bool:
+            """Check the index, and return if it might be in bounds."""
+            if not isinstance(index, Interval):
+                index = TOP_INT
+            length = array.length if isinstance(array.length, Interval) else TOP_INT
+            if index.lo < 0 or index.hi >= length.lo:
+                throw("out of bounds")
+            return index.hi >= 0 and index.lo < length.hi
+
+        def current():
+            return State(tuple(locals), tuple(v for v, _ in stack), heap)
+
+        def branch(cond, a, b, target, pc):
+            """Refine the two compared values on both branches."""
+            (va, oa), (vb, ob) = a, b
+            for taken, c in ((True, cond), (False, NEGATED[cond])):
+                refined = {}
+                if c in ("is", "isnot"):
+                    if isinstance(va, Ref) and vb == Ref(True, frozenset()):
+                        if c == "is":
+                            feasible = va.null
+                            ra = Ref(True, frozenset())
+                        else:
+                            feasible = bool(va.sites)
+                            ra = Ref(False, va.sites)
+                        if not feasible:
+                            continue
+                        refined[oa] = ra
+                elif isinstance(va, Interval) and isinstance(vb, Interval):
+                    ra = refine(va, c, vb)
+                    rb = refine(vb, FLIPPED[c], va)
+                    if ra is None or rb is None:
+                        continue
+                    refined[oa], refined[ob] = ra, rb
+                refined.pop(None, None)
+                out = list(locals)
+                for index, value in refined.items():
+                    out[index] = value
+                yield (
+                    target if taken else pc + 1,
+                    State(tuple(out), tuple(v for v, _ in stack), heap),
+                )
+
+        for pc in block:
+            inst = self.bytecode[pc]
+            match inst["opr"]:
+                case "push":
+                    value = inst["value"]
+                    if value is None:
+                        push(Ref(True, frozenset()))
+                    elif value["type"] == "integer":
+                        push(Interval(value["value"], value["value"]))
+                    else:
+                        push(TOP)
+                case "load":
+                    push(locals[inst["index"]], inst["index"])
+                case "store":
+                    forget(inst["index"])
+                    locals[inst["index"]] = pop()
+                case "dup":
+                    stack.append(stack[-1])
+                case "pop":
+                    pop()
+                case "incr":
+                    index = inst["index"]
+                    forget(index)
+                    value = locals[index]
+                    if isinstance(value, Interval):
+                        amount = Interval(inst["amount"], inst["amount"])
+                        locals[index] = arithmetic("add", value, amount)
+                    else:
+                        locals[index] = TOP_INT
+                case "binary":
+                    b, a = pop(), pop()
+                    a = a if isinstance(a, Interval) else TOP_INT
+                    b = b if isinstance(b, Interval) else TOP_INT
+                    operant = inst["operant"]
+                    if inst["type"] != "int" or operant not in BINARY_OPERATIONS:
+                        push(TOP)
+                        continue
+                    if operant in ("div", "rem"):
+                        if 0 in b:
+                            throw("divide by zero")
+                        if b.lo == b.hi == 0:
+                            return
+                    push(arithmetic(operant, a, b))
+                case "negate":
+                    a = pop()
+                    if isinstance(a, Interval) and a.lo > INT_MIN:
+                        push(Interval(-a.hi, -a.lo))
+                    else:
+                        push(TOP_INT)
+                case "cast":
+                    a = pop()
+                    if (bounds := CASTS.get(inst["to"])) is None:
+                        push(a)
+                    elif isinstance(a, Interval) and a.meet(bounds) == a:
+                        push(a)
+                    else:
+                        push(bounds)
+                case "if":
+                    b, a = stack.pop(), stack.pop()
+                    yield from branch(inst["condition"], a, b, inst["target"], pc)
+                    return
+                case "ifz":
+                    a = stack.pop()
+                    cond = inst["condition"]
+                    zero = Ref(True, frozenset()) if cond in ("is", "isnot") else None
+                    b = (zero or Interval(0, 0), None)
+                    yield from branch(cond, a, b, inst["target"], pc)
+                    return
+                case "goto":
+                    yield (inst["target"], current())
+                    return
+                case "tableswitch" | "lookupswitch":
+                    pop()
+                    out = current()
+                    targets = [t["target"] for t in inst["targets"]]
+                    if inst["opr"] == "tableswitch":
+                        targets = inst["targets"]
+                    for target in dict.fromkeys([*targets, inst["default"]]):
+                        yield (target, out)
+                    return
+                case "return":
+                    self.queries.add("ok")
+                    return
+                case "get":
+                    if inst["field"]["name"] == "$assertionsDisabled":
+                        push(Interval(0, 0))
+                    else:
+                        push(TOP)
+                case "new":
+                    push(Ref(False, frozenset([("new", pc, inst["class"])])))
+                case "throw":
+                    ref = pop()
+                    if not isinstance(ref, Ref):
+                        self.queries.update(ERRORS)
+                        throw_any()
+                        return
+                    if ref.null:
+                        throw("null pointer")
+                    for site in ref.sites:
+                        if site[0] == "new" and site[2] in EXCEPTIONS:
+                            throw(EXCEPTIONS[site[2]])
+                            continue
+                        # We do not know the superclasses of other exceptions
+                        for handler in handlers:
+                            catch(handler, Ref(False, frozenset([site])))
+                            if handler.catch_type in (None, site[2]):
+                                break
+                    return
+                case "invoke":
+                    method = inst["method"]
+                    del stack[len(stack) - len(method["args"]) :]
+                    if inst["access"] == "special" and method["name"] == "<init>":
+                        pop()
+                        continue
+                    # We do not know what other methods do
+                    if inst["access"] != "static":
+                        pop()
+                    self.queries.update(ERRORS + ["*"])
+                    throw_any()
+                    if method["returns"] is not None:
+                        push(TOP)
+                case "newarray":
+                    length = pop()
+                    if not isinstance(length, Interval):
+                        length = TOP_INT
+                    if (length := length.meet(Interval(0, INT_MAX))) is None:
+                        return
+                    site = ("array", pc)
+                    default = (
+                        Interval(0, 0)
+                        if isinstance(inst["type"], str)
+                        else Ref(True, frozenset())
+                    )
+                    array = Array(length, default)
+                    heap[site] = join_value(heap[site], array) if site in heap else array
+                    push(Ref(False, frozenset([site])))
+                case "arraylength":
+                    if (array := deref(pop())) is None:
+                        return
+                    push(array.length)
+                case "array_load":
+                    index = pop()
+                    if (array := deref(pop())) is None or not check_index(array, index):
+                        return
+                    push(array.elements)
+                case "array_store":
+                    value, index, ref = pop(), pop(), pop()
+                    if (array := deref(ref)) is None or not check_index(array, index):
+                        return
+                    for site in ref.sites if isinstance(ref, Ref) else ():
+                        old = heap[site]
+                        heap[site] = Array(old.length, join_value(old.elements, value))
+                case _:
+                    # We do not know what the instruction does
+                    self.queries.update(ERRORS + ["*", "ok"])
+                    throw_any()
+                    return
+
+        yield (block.end, current())
+
+
+def verdicts(methodid: MethodId) -> dict[str, bool]:
+    """For each query, whether it might happen when running the method."""
+    method = methodid.load()
+    cfg = methodid.cfg()
+    analysis = IntervalAnalysis(methodid, method, cfg)
+    result = fixpoint(cfg, analysis)
+    if result.loops:
+        analysis.queries.add("*")
+    return {q: q in analysis.queries for q in QUERIES}
@@ -0,0 +1,220 @@
+""" A database of the cases, which is built from `stats/cases.txt`.
+
+The database in `stats/cases.db` is written by `bin/build.py`, and holds the
+method ids, which queries occur in each method as a bitmask, and the cases
+of each method. Loading it only reads the index, the inputs of the cases of
+a method are parsed the first time they are asked for:
+
+    >>> db = CaseDB.load()
+    >>> sorted(db.queries_of("jpamb.cases.Simple.divideByN:(I)I"))
+    ['divide by zero', 'ok']
+    >>> db.cases("jpamb.cases.Simple.divideByN:(I)I")[0]
+    ('(0)', (IntValue(value=0),), 'divide by zero')
+
+The file is a line with `MAGIC`, a line with the index as JSON, and then
+the cases of each method as a JSON list of `[input, result]` pairs, where
+the input is as written in `stats/cases.txt`. The index has the offsets of
+the cases of each method after the index line.
+
+The database records the size and modification time of the `cases.txt` it
+was built from. If it is missing or does not match, use
+`CaseDB.load_or_build`, which falls back to parsing the text file, and
+writes the database again.
+"""
+
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+import json
+import os
+import re
+
+from jpamb_utils import InputParser, JvmValue, MethodId
+
+MAGIC = b"JPAMBDB2"
+
+CASE_RE = re.compile(r"([^ ]*) +(\([^)]*\)) -> (.*)")
+
+QUERIES = (
+    "*",
+    "assertion error",
+    "divide by zero",
+    "null pointer",
+    "ok",
+    "out of bounds",
+)
+
+# A case in the database is its input as a string, the parsed input, and
+# the query it results in.
+CaseEntry = tuple[str, tuple[JvmValue, ...], str]
+
+
+def stamp(source: Path) -> tuple[int, int]:
+    """The size and modification time of a `stats/cases.txt`, which a
+    database is built from."""
+    stat = Path(source).stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def parse_case(line: str) -> tuple[str, str, str]:
+    """Split a line of `stats/cases.txt` into the method id, input and result."""
+    if not (m := CASE_RE.match(line)):
+        raise ValueError(f"Unexpected line: {line!r}")
+    return m.group(1), m.group(2), m.group(3)
+
+
+@dataclass
+class CaseDB:
+    queries: tuple[str, ...]
+    methods: tuple[str, ...]
+    """The method ids, sorted."""
+    index: dict[str, int]
+    masks: array
+    """The queries that occur in each method, bit i is set if queries[i] occurs."""
+    frequencies: dict[str, float]
+    """The fraction of methods in which each query occurs."""
+    source: tuple[int, int]
+    """The `stamp` of the cases.txt, the database was built from."""
+    offsets: array
+    payload: bytes
+    _cases: dict[int, list[CaseEntry]] = field(default_factory=dict, repr=False)
+    _methodids: dict[int, MethodId] = field(default_factory=dict, repr=False)
+
+    @staticmethod
+    def build(lines: list[str], queries=QUERIES, source=(0, 0)) -> "CaseDB":
+        """Build the database from the lines of `stats/cases.txt`."""
+        by_method: dict[str, list[CaseEntry]] = {}
+        for line in lines:
+            if not line.strip():
+                continue
+            method, input, result = parse_case(line.rstrip("\n"))
+            values = tuple(InputParser.parse(input))
+            by_method.setdefault(method, []).append((input, values, result))
+
+        methods = tuple(sorted(by_method))
+        bits = {q: 1 << i for i, q in enumerate(queries)}
+        masks = array("I", [0] * len(methods))
+        payload = bytearray()
+        offsets = array("Q", [0])
+        for i, method in enumerate(methods):
+            for _, _, result in by_method[method]:
+                masks[i] |= bits[result]
+            cases = [[input, result] for input, _, result in by_method[method]]
+            payload += json.dumps(cases).encode() + b"\n"
+            offsets.append(len(payload))
+
+        frequencies = {
+            q: sum(1 for m in masks if m & bits[q]) / len(methods) if methods else 0.0
+            for q in queries
+        }
+        db = CaseDB(
+            tuple(queries),
+            methods,
+            {m: i for i, m in enumerate(methods)},
+            masks,
+            frequencies,
+            tuple(source),
+            offsets,
+            bytes(payload),
+        )
+        db._cases.update(enumerate(by_method[m] for m in methods))
+        return db
+
+    def write(self, file: Path):
+        index = {
+            "queries": self.queries,
+            "methods": self.methods,
+            "masks": self.masks.tolist(),
+            "frequencies": self.frequencies,
+            "source": self.source,
+            "offsets": self.offsets.tolist(),
+        }
+        tmpfile = file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmpfile, "wb") as f:
+            f.write(MAGIC + b"\n")
+            f.write(json.dumps(index).encode() + b"\n")
+            f.write(self.payload)
+        os.replace(tmpfile, file)
+
+    @staticmethod
+    def read(file: Path) -> "CaseDB":
+        """Read the database with a single read, the cases are parsed lazily."""
+        magic, index, payload = Path(file).read_bytes().split(b"\n", 2)
+        if magic != MAGIC:
+            raise ValueError(f"{file} is not a case database")
+        index = json.loads(index)
+        methods = tuple(index["methods"])
+        return CaseDB(
+            tuple(index["queries"]),
+            methods,
+            {m: i for i, m in enumerate(methods)},
+            array("I", index["masks"]),
+            index["frequencies"],
+            tuple(index["source"]),
+            array("Q", index["offsets"]),
+            payload,
+        )
+
+    @staticmethod
+    def load(stats: Path = Path("stats")) -> "CaseDB":
+        """Load the database from the stats folder."""
+        return CaseDB.read(stats / "cases.db")
+
+    @staticmethod
+    def load_or_build(stats: Path = Path("stats"), logger=None) -> "CaseDB":
+        """Load the database, or build it from `cases.txt` if it's missing or
+        out of date.
+        """
+        source = stats / "cases.txt"
+        try:
+            db = CaseDB.load(stats)
+            if db.source == stamp(source):
+                return db
+            reason = "is out of date"
+        except (OSError, ValueError, KeyError) as e:
+            reason = f"could not be read ({e})"
+        if logger:
+            logger.warning(f"The case database {reason}, reading {source}")
+        source_stamp = stamp(source)
+        db = CaseDB.build(source.read_text().splitlines(), source=source_stamp)
+        try:
+            db.write(stats / "cases.db")
+        except OSError:
+            # The next load reads the text file again
+            pass
+        return db
+
+    def __contains__(self, methodid: MethodId | str) -> bool:
+        return str(methodid) in self.index
+
+    def methodid(self, i: int) -> MethodId:
+        if (methodid := self._methodids.get(i)) is None:
+            methodid = self._methodids[i] = MethodId.parse(self.methods[i])
+        return methodid
+
+    def mask(self, methodid: MethodId | str) -> int:
+        """The bitmask of the queries that occur in the method."""
+        return self.masks[self.index[str(methodid)]]
+
+    def occurs(self, methodid: MethodId | str, query: str) -> bool:
+        """Whether the query occurs in one of the cases of the method."""
+        return bool(self.mask(methodid) & (1 << self.queries.index(query)))
+
+    def queries_of(self, methodid: MethodId | str) -> set[str]:
+        mask = self.mask(methodid)
+        return {q for i, q in enumerate(self.queries) if mask & (1 << i)}
+
+    def cases(self, methodid: MethodId | str) -> list[CaseEntry]:
+        """All the cases of the method."""
+        i = self.index[str(methodid)]
+        if (cases := self._cases.get(i)) is None:
+            entries = json.loads(self.payload[self.offsets[i] : self.offsets[i + 1]])
+            cases = [
+                (input, tuple(InputParser.parse(input)), result)
+                for input, result in entries
+            ]
+            self._cases[i] = cases
+        return cases
+
+    def all_cases(self) -> list[tuple[MethodId, list[CaseEntry]]]:
+        return [(self.methodid(i), self.cases(m)) for i, m in enumerate(self.methods)]
@@ -0,0 +1,299 @@
+""" Control flow graphs of the decompiled bytecode.
+
+Jump targets in the decompiled bytecode are indices into the list of
+instructions, so a `BasicBlock` is a range of instruction indices. Besides
+the blocks and their edges, a `ControlFlowGraph` contains the dominator and
+post-dominator trees and the natural loops of the method.
+
+The graphs of a class are computed once and cached next to the method index,
+use `MethodId.cfg()` to get the graph of a method:
+
+    >>> cfg = MethodId.parse("jpamb.cases.Loops.forever:()V").cfg()
+    >>> cfg.loops
+    (Loop(header=0, body=frozenset({0}), latches=(0,), parent=None, depth=1),)
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+# Instructions which never continue to the next instruction
+TERMINATORS = {"goto", "return", "throw", "tableswitch", "lookupswitch"}
+
+# Instructions which might jump somewhere else
+BRANCHES = {"goto", "if", "ifz", "tableswitch", "lookupswitch"}
+
+
+def jump_targets(inst: dict) -> list[int]:
+    """The instructions the instruction might jump to, excluding the next."""
+    match inst["opr"]:
+        case "goto" | "if" | "ifz":
+            return [inst["target"]]
+        case "tableswitch":
+            return [*inst["targets"], inst["default"]]
+        case "lookupswitch":
+            return [*(t["target"] for t in inst["targets"]), inst["default"]]
+        case _:
+            return []
+
+
+@dataclass(frozen=True)
+class BasicBlock:
+    index: int
+    start: int
+    end: int
+
+    def __iter__(self):
+        return iter(range(self.start, self.end))
+
+    @property
+    def last(self) -> int:
+        return self.end - 1
+
+
+@dataclass(frozen=True)
+class Handler:
+    """An exception handler, which might be jumped to from a block."""
+
+    block: int
+    catch_type: Optional[str]
+    """The class of exceptions caught, or None if it catches everything."""
+
+
+@dataclass(frozen=True)
+class Loop:
+    """A natural loop, the blocks dominated by the header that reach a latch."""
+
+    header: int
+    body: frozenset[int]
+    latches: tuple[int, ...]
+    """The blocks with a back edge to the header."""
+    parent: Optional[int]
+    """The index of the innermost loop containing this loop."""
+    depth: int
+
+
+@dataclass(frozen=True)
+class ControlFlowGraph:
+    blocks: tuple[BasicBlock, ...]
+    successors: tuple[tuple[int, ...], ...]
+    handlers: tuple[tuple[Handler, ...], ...]
+    """The exception handlers of each block, in the order they are tried."""
+    predecessors: tuple[tuple[int, ...], ...]
+    """The predecessors of each block, including the exceptional edges."""
+    block_of: tuple[int, ...]
+    order: tuple[int, ...]
+    """The blocks reachable from the entry in reverse postorder."""
+    idom: tuple[Optional[int], ...]
+    """The immediate dominator of each block, None for the entry and unreachable blocks."""
+    ipdom: tuple[Optional[int], ...]
+    """The immediate post-dominator of each block, None if it is the exit or never reaches it."""
+    loops: tuple[Loop, ...]
+    """The natural loops, outer loops before the loops they contain."""
+    loop_of: tuple[Optional[int], ...]
+    """The innermost loop of each block."""
+
+    @staticmethod
+    def build(bytecode: list[dict], exceptions: Iterable[dict] = ()) -> "ControlFlowGraph":
+        leaders = {0}
+        for i, inst in enumerate(bytecode):
+            if inst["opr"] in BRANCHES or inst["opr"] in TERMINATORS:
+                leaders.update(jump_targets(inst))
+                leaders.add(i + 1)
+        for e in exceptions:
+            leaders.update([e["start"], e["end"], e["handler"]])
+        starts = sorted(i for i in leaders if i < len(bytecode))
+
+        blocks = tuple(
+            BasicBlock(b, start, end)
+            for b, (start, end) in enumerate(zip(starts, starts[1:] + [len(bytecode)]))
+        )
+        block_of = [0] * len(bytecode)
+        for block in blocks:
+            for i in block:
+                block_of[i] = block.index
+
+        successors = []
+        for block in blocks:
+            inst = bytecode[block.last]
+            targets = jump_targets(inst)
+            if inst["opr"] not in TERMINATORS and block.end < len(bytecode):
+                targets.append(block.end)
+            successors.append(tuple(dict.fromkeys(block_of[t] for t in targets)))
+
+        handlers = [[] for _ in blocks]
+        for e in exceptions:
+            handler = Handler(block_of[e["handler"]], e.get("catchType"))
+            for b in range(block_of[e["start"]], block_of[e["end"] - 1] + 1):
+                handlers[b].append(handler)
+
+        edges = [
+            tuple(dict.fromkeys([*succs, *(h.block for h in hs)]))
+            for succs, hs in zip(successors, handlers)
+        ]
+        predecessors = [[] for _ in blocks]
+        for b, succs in enumerate(edges):
+            for succ in succs:
+                predecessors[succ].append(b)
+
+        order = reverse_postorder(edges, [0])
+        idom = dominators(order, predecessors)
+
+        # Post-dominators are the dominators of the reversed graph, where all
+        # the blocks without successors lead to a virtual exit.
+        virtual = len(blocks)
+        reverse = [list(preds) for preds in predecessors] + [
+            [b for b, succs in enumerate(edges) if not succs]
+        ]
+        reverse_preds = [list(succs) for succs in edges] + [[]]
+        for b in reverse[virtual]:
+            reverse_preds[b].append(virtual)
+        ipdom = dominators(reverse_postorder(reverse, [virtual]), reverse_preds)
+        ipdom = [None if d == virtual else d for d in ipdom[:virtual]]
+
+        loops, loop_of = natural_loops(order, idom, predecessors)
+
+        return ControlFlowGraph(
+            blocks,
+            tuple(successors),
+            tuple(map(tuple, handlers)),
+            tuple(map(tuple, predecessors)),
+            tuple(block_of),
+            tuple(order),
+            tuple(idom),
+            tuple(ipdom),
+            loops,
+            loop_of,
+        )
+
+    def reverse_postorder(self) -> list[int]:
+        """The blocks reachable from the entry in reverse postorder."""
+        return list(self.order)
+
+    def dominates(self, a: int, b: int) -> bool:
+        """Whether every path from the entry to block b goes through block a."""
+        return _dominates(self.idom, a, b)
+
+    def post_dominates(self, a: int, b: int) -> bool:
+        """Whether every path from block b to the exit goes through block a."""
+        return _dominates(self.ipdom, a, b)
+
+    def is_loop_header(self, b: int) -> bool:
+        return (loop := self.loop_of[b]) is not None and self.loops[loop].header == b
+
+
+def _dominates(idom, a: int, b: int) -> bool:
+    d: Optional[int] = b
+    while d is not None:
+        if d == a:
+            return True
+        d = idom[d]
+    return False
+
+
+def reverse_postorder(edges, roots: list[int]) -> list[int]:
+    """The nodes reachable from the roots in reverse postorder."""
+    order = []
+    visited = set(roots)
+    for root in roots:
+        stack = [(root, iter(edges[root]))]
+        while stack:
+            node, succs = stack[-1]
+            for succ in succs:
+                if succ not in visited:
+                    visited.add(succ)
+                    stack.append((succ, iter(edges[succ])))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+    order.reverse()
+    return order
+
+
+def dominators(order: list[int], predecessors) -> list[Optional[int]]:
+    """The immediate dominators of the nodes, using the algorithm from
+    "A Simple, Fast Dominance Algorithm" by Cooper, Harvey and Kennedy.
+
+    The first node in the reverse postorder is the root.
+    """
+    number = {b: i for i, b in enumerate(order)}
+    idom: list[Optional[int]] = [None] * len(predecessors)
+    root = order[0]
+    idom[root] = root
+
+    def intersect(a: int, b: int) -> int:
+        while a != b:
+            while number[a] > number[b]:
+                a = idom[a]  # type: ignore
+            while number[b] > number[a]:
+                b = idom[b]  # type: ignore
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for b in order[1:]:
+            new = None
+            for p in predecessors[b]:
+                if idom[p] is not None:
+                    new = p if new is None else intersect(p, new)
+            if idom[b] != new:
+                idom[b] = new
+                changed = True
+
+    idom[root] = None
+    return idom
+
+
+def natural_loops(order, idom, predecessors):
+    """The natural loops, merged by header and nested by their bodies."""
+    number = {b: i for i, b in enumerate(order)}
+    found = {}
+    for header in order:
+        latches = tuple(
+            p
+            for p in predecessors[header]
+            if p in number and _dominates(idom, header, p)
+        )
+        if not latches:
+            continue
+        body = {header}
+        worklist = [p for p in latches if p != header]
+        while worklist:
+            b = worklist.pop()
+            if b not in body:
+                body.add(b)
+                worklist.extend(p for p in predecessors[b] if p in number)
+        found[header] = (frozenset(body), latches)
+
+    # A loop is nested in the loops with a header dominating its header, and
+    # outer loops come first in the reverse postorder.
+    loops: list[Loop] = []
+    loop_of: list[Optional[int]] = [None] * len(predecessors)
+    for header, (body, latches) in found.items():
+        parent = loop_of[header]
+        depth = 1 if parent is None else loops[parent].depth + 1
+        for b in body:
+            loop_of[b] = len(loops)
+        loops.append(Loop(header, body, latches, parent, depth))
+
+    return tuple(loops), tuple(loop_of)
+
+
+def control_flow_graphs(classfile: Path) -> dict[str, ControlFlowGraph]:
+    """The graphs of the methods with code in a decompiled class, by their
+    full `MethodId` string.
+    """
+    from jpamb_utils import load_cached, method_index
+
+    def build(_: bytes) -> dict[str, ControlFlowGraph]:
+        return {
+            name: ControlFlowGraph.build(
+                m["code"]["bytecode"], m["code"].get("exceptions", [])
+            )
+            for name, m in method_index(classfile).items()
+            if m.get("code")
+        }
+
+    return load_cached("cfgs", classfile, build)
@@ -0,0 +1,294 @@
+""" A table of the bytecode features of each method.
+
+`bin/build.py` writes the table to `decompiled/features.db` after
+decompiling. It has a row per method id, with a histogram of the operations
+of the method, flags for the instructions syntactic analyses look for, and
+the methods it calls. Loading it is a single read of a small file, and each
+lookup is an index into a column:
+
+    >>> table = FeatureTable.load()
+    >>> table.has("jpamb.cases.Simple.assertFalse:()V", Flag.NEW_ASSERTION_ERROR)
+    True
+    >>> table.count("jpamb.cases.Simple.divideByN:(I)I", "binary")
+    1
+
+The file is a line with `MAGIC`, a line with the index as JSON, and then
+the columns, as little-endian unsigned 32 bit ints, in the order and with
+the lengths given in the index.
+
+The table records the size and modification time of each decompiled class
+it was built from. If it is missing or does not match, use
+`FeatureTable.load_or_build`, which falls back to reading the classes, and
+writes the table again.
+"""
+
+from array import array
+from dataclasses import dataclass
+from enum import IntFlag
+from pathlib import Path
+import json
+import os
+import sys
+
+from jpamb_utils import MethodId, invoke_target, method_index
+
+MAGIC = b"JPAMBFT2"
+
+COLUMNS = ("counts", "flags", "call_offsets", "calls")
+
+# The operations of jvm2json, anything else is counted as "other"
+OPERATIONS = (
+    "array_load",
+    "array_store",
+    "arraylength",
+    "binary",
+    "cast",
+    "checkcast",
+    "comparefloating",
+    "comparelongs",
+    "dup",
+    "dup_x1",
+    "dup_x2",
+    "get",
+    "goto",
+    "if",
+    "ifz",
+    "incr",
+    "instanceof",
+    "invoke",
+    "load",
+    "lookupswitch",
+    "monitor",
+    "negate",
+    "new",
+    "newarray",
+    "pop",
+    "push",
+    "put",
+    "return",
+    "store",
+    "swap",
+    "tableswitch",
+    "throw",
+    "other",
+)
+
+
+class Flag(IntFlag):
+    DIVISION = 1 << 0
+    """An integer division or remainder."""
+    ARRAY_LOAD = 1 << 1
+    ARRAY_STORE = 1 << 2
+    ARRAYLENGTH = 1 << 3
+    NEW_ASSERTION_ERROR = 1 << 4
+    THROW = 1 << 5
+    BACKWARD_JUMP = 1 << 6
+    """A jump to an earlier instruction, which all loops have."""
+    INVOKE = 1 << 7
+
+
+_OPERATION_FLAGS = {
+    "array_load": Flag.ARRAY_LOAD,
+    "array_store": Flag.ARRAY_STORE,
+    "arraylength": Flag.ARRAYLENGTH,
+    "throw": Flag.THROW,
+    "invoke": Flag.INVOKE,
+}
+
+
+def stamps(decompiled: Path) -> dict[str, tuple[int, int]]:
+    """The size and modification time of each decompiled class, by its path
+    relative to the folder.
+
+    It is checked on each `FeatureTable.load_or_build`, so it walks the
+    folder with `os.scandir` instead of globbing.
+    """
+    stamps = {}
+    folders = [""]
+    while folders:
+        folder = folders.pop()
+        with os.scandir(os.path.join(decompiled, folder)) as entries:
+            for entry in entries:
+                name = folder + entry.name
+                if entry.is_dir():
+                    folders.append(name + "/")
+                elif name.endswith(".json"):
+                    stat = entry.stat()
+                    stamps[name] = (stat.st_size, stat.st_mtime_ns)
+    return dict(sorted(stamps.items()))
+
+
+def method_features(method: dict) -> tuple[list[int], Flag, list[str]]:
+    """The histogram of the operations, the flags and the call targets of a
+    decompiled method."""
+    from jpamb_utils.cfg import jump_targets
+
+    columns = {o: i for i, o in enumerate(OPERATIONS)}
+    histogram = [0] * len(OPERATIONS)
+    flags = Flag(0)
+    calls: list[str] = []
+    code = method.get("code") or {"bytecode": []}
+    for i, inst in enumerate(code["bytecode"]):
+        opr = inst["opr"]
+        histogram[columns.get(opr, columns["other"])] += 1
+        flags |= _OPERATION_FLAGS.get(opr, 0)
+        match opr:
+            case "binary" if inst["operant"] in ("div", "rem"):
+                flags |= Flag.DIVISION
+            case "new" if inst["class"] == "java/lang/AssertionError":
+                flags |= Flag.NEW_ASSERTION_ERROR
+            case "invoke" if "ref" in inst["method"]:
+                # Dynamic invokes have no target until they are linked
+                if (target := invoke_target(inst["method"])) not in calls:
+                    calls.append(target)
+        if any(t <= i for t in jump_targets(inst)):
+            flags |= Flag.BACKWARD_JUMP
+    return histogram, flags, calls
+
+
+@dataclass
+class FeatureTable:
+    operations: tuple[str, ...]
+    methods: tuple[str, ...]
+    """The method ids, sorted."""
+    index: dict[str, int]
+    counts: array
+    """The histograms of the methods, a row of `len(operations)` counts each."""
+    flags: array
+    targets: tuple[str, ...]
+    """The methods called, each is stored once."""
+    call_offsets: array
+    calls: array
+    """The indices of the targets called by each method, from `call_offsets`."""
+    sources: dict[str, tuple[int, int]]
+    """The `stamps` of the decompiled classes the table was built from."""
+
+    @staticmethod
+    def build(decompiled: Path = Path("decompiled")) -> "FeatureTable":
+        """Build the table from the decompiled classes."""
+        rows = {}
+        sources = stamps(decompiled)
+        for name in sources:
+            for methodid, method in method_index(decompiled / name).items():
+                rows[methodid] = method_features(method)
+
+        methods = tuple(sorted(rows))
+        counts = array("I")
+        flags = array("I")
+        target_ids: dict[str, int] = {}
+        call_offsets = array("I", [0])
+        calls = array("I")
+        for name in methods:
+            histogram, method_flags, targets = rows[name]
+            counts.extend(histogram)
+            flags.append(method_flags)
+            calls.extend(target_ids.setdefault(t, len(target_ids)) for t in targets)
+            call_offsets.append(len(calls))
+        return FeatureTable(
+            OPERATIONS,
+            methods,
+            {m: i for i, m in enumerate(methods)},
+            counts,
+            flags,
+            tuple(target_ids),
+            call_offsets,
+            calls,
+            sources,
+        )
+
+    def write(self, file: Path):
+        index = {
+            "operations": self.operations,
+            "methods": self.methods,
+            "targets": self.targets,
+            "sources": self.sources,
+            "columns": [len(getattr(self, c)) for c in COLUMNS],
+        }
+        tmpfile = file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmpfile, "wb") as f:
+            f.write(MAGIC + b"\n")
+            f.write(json.dumps(index).encode() + b"\n")
+            for name in COLUMNS:
+                column = array("I", getattr(self, name))
+                if sys.byteorder == "big":
+                    column.byteswap()
+                f.write(column.tobytes())
+        os.replace(tmpfile, file)
+
+    @staticmethod
+    def read(file: Path) -> "FeatureTable":
+        magic, index, content = Path(file).read_bytes().split(b"\n", 2)
+        if magic != MAGIC:
+            raise ValueError(f"{file} is not a feature table")
+        index = json.loads(index)
+        columns = {}
+        start = 0
+        for name, length in zip(COLUMNS, index["columns"]):
+            end = start + length * 4
+            if end > len(content):
+                raise ValueError(f"{file} is truncated")
+            columns[name] = column = array("I", content[start:end])
+            if sys.byteorder == "big":
+                column.byteswap()
+            start = end
+        methods = tuple(index["methods"])
+        return FeatureTable(
+            tuple(index["operations"]),
+            methods,
+            {m: i for i, m in enumerate(methods)},
+            targets=tuple(index["targets"]),
+            sources={n: tuple(s) for n, s in index["sources"].items()},
+            **columns,
+        )
+
+    @staticmethod
+    def load(decompiled: Path = Path("decompiled")) -> "FeatureTable":
+        """Load the table from the decompiled folder."""
+        return FeatureTable.read(decompiled / "features.db")
+
+    @staticmethod
+    def load_or_build(decompiled: Path = Path("decompiled"), logger=None):
+        """Load the table, or build it from the decompiled classes if it's
+        missing or out of date.
+        """
+        try:
+            table = FeatureTable.load(decompiled)
+            if table.sources == stamps(decompiled):
+                return table
+            reason = "is out of date"
+        except (OSError, ValueError, KeyError) as e:
+            reason = f"could not be read ({e})"
+        if logger:
+            logger.warning(f"The feature table {reason}, reading {decompiled}")
+        table = FeatureTable.build(decompiled)
+        try:
+            table.write(decompiled / "features.db")
+        except OSError:
+            # The next load reads the classes again
+            pass
+        return table
+
+    def __contains__(self, methodid: MethodId | str) -> bool:
+        return str(methodid) in self.index
+
+    def histogram(self, methodid: MethodId | str) -> dict[str, int]:
+        """The number of instructions of each operation in the method."""
+        i = self.index[str(methodid)] * len(self.operations)
+        return dict(zip(self.operations, self.counts[i : i + len(self.operations)]))
+
+    def count(self, methodid: MethodId | str, operation: str) -> int:
+        i = self.index[str(methodid)] * len(self.operations)
+        return self.counts[i + self.operations.index(operation)]
+
+    def flags_of(self, methodid: MethodId | str) -> Flag:
+        return Flag(self.flags[self.index[str(methodid)]])
+
+    def has(self, methodid: MethodId | str, flag: Flag) -> bool:
+        """Whether the method has all the flags."""
+        return self.flags[self.index[str(methodid)]] & flag == flag
+
+    def calls_of(self, methodid: MethodId | str) -> tuple[str, ...]:
+        """The methods called by the method, in the order they first occur."""
+        i = self.index[str(methodid)]
+        calls = self.calls[self.call_offsets[i] : self.call_offsets[i + 1]]
+        return tuple(self.targets[t] for t in calls)
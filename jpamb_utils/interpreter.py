@@ -0,0 +1,814 @@
+""" A fast interpreter for the decompiled bytecode.
+
+The bytecode of a method is decoded once into a `Code` object, which holds
+the opcodes and the operands of the instructions in two lists. The
+`Interpreter` then dispatches on the opcodes through a table of step
+functions, which work on a stack (the end of a list) and a fixed-size list
+of locals:
+
+    >>> code = Code.load(MethodId.parse("jpamb.cases.Simple.divideByN:(I)I"))
+    >>> Interpreter().run(code, [IntValue(0)])
+    'divide by zero'
+
+Integers, booleans and chars are python ints, arrays are python lists, or
+copies of the `array`s of the inputs, and null is None. Exceptions are
+reported as the query they answer.
+
+Static methods are called by their `MethodId`. The results of calls of pure
+methods, which don't touch arrays, are kept in a `CallMemo`, so recursive
+methods like `jpamb.cases.Calls.fib` are only run once per argument.
+
+At the headers of the loops of a method, the interpreter checks whether the
+state of the frame repeats, with Brent's cycle detection. A repeated state
+means the method never terminates, so loops like `jpamb.cases.Loops.forever`
+are reported as '*' after a few steps, instead of at the step limit.
+"""
+
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+import operator
+
+from jpamb_utils import JvmValue, MethodId, invoke_target
+
+STEP_LIMIT = 1_000_000
+
+MEMO_SIZE = 100_000
+
+(
+    PUSH,
+    LOAD,
+    STORE,
+    DUP,
+    POP,
+    BINARY,
+    NEGATE,
+    INCR,
+    CAST,
+    IF,
+    IFZ,
+    GOTO,
+    TABLESWITCH,
+    LOOKUPSWITCH,
+    RETURN,
+    GET,
+    NEW,
+    THROW,
+    INVOKE,
+    NEWARRAY,
+    ARRAYLENGTH,
+    ARRAY_LOAD,
+    ARRAY_STORE,
+    UNSUPPORTED,
+) = range(24)
+
+OPCODES = {
+    "push": PUSH,
+    "load": LOAD,
+    "store": STORE,
+    "dup": DUP,
+    "pop": POP,
+    "binary": BINARY,
+    "negate": NEGATE,
+    "incr": INCR,
+    "cast": CAST,
+    "if": IF,
+    "ifz": IFZ,
+    "goto": GOTO,
+    "tableswitch": TABLESWITCH,
+    "lookupswitch": LOOKUPSWITCH,
+    "return": RETURN,
+    "get": GET,
+    "new": NEW,
+    "throw": THROW,
+    "invoke": INVOKE,
+    "newarray": NEWARRAY,
+    "arraylength": ARRAYLENGTH,
+    "array_load": ARRAY_LOAD,
+    "array_store": ARRAY_STORE,
+}
+
+CONDITIONS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "ge": operator.ge,
+    "gt": operator.gt,
+    "le": operator.le,
+    "is": operator.is_,
+    "isnot": operator.is_not,
+}
+
+EXCEPTIONS = {
+    "java/lang/AssertionError": "assertion error",
+    "java/lang/ArithmeticException": "divide by zero",
+    "java/lang/ArrayIndexOutOfBoundsException": "out of bounds",
+    "java/lang/NullPointerException": "null pointer",
+}
+
+
+class JvmException(Exception):
+    """An exception thrown by the program, `result` is the query it answers."""
+
+    def __init__(self, result: str):
+        super().__init__(result)
+        self.result = result
+
+
+class Unsupported(Exception):
+    """The interpreter can't handle an instruction."""
+
+
+class OutOfSteps(Exception):
+    """The interpreter ran out of steps."""
+
+
+class InfiniteLoop(OutOfSteps):
+    """The interpreter found a frame in a state it was in before."""
+
+
+class _Return(Exception):
+    pass
+
+
+class _Call(Exception):
+    def __init__(self, invoke: "Invoke"):
+        self.invoke = invoke
+
+
+@dataclass(frozen=True)
+class JvmObject:
+    class_name: str
+
+
+@dataclass(frozen=True)
+class Code:
+    """The pre-decoded bytecode of a method."""
+
+    methodid: str
+    ops: tuple[int, ...]
+    args: tuple
+    max_locals: int
+    max_stack: int
+    bytecode: list[dict]
+    headers: frozenset[int]
+    """The first instructions of the loop headers."""
+
+    @staticmethod
+    def load(methodid: MethodId) -> "Code":
+        """Decode the method, the result is cached for the life of the process."""
+        key = str(methodid)
+        if (code := _CODE.get(key)) is None:
+            code = _CODE[key] = Code.decode(key, methodid.load(), methodid.cfg())
+        return code
+
+    @staticmethod
+    def decode(methodid: str, method: dict, cfg=None) -> "Code":
+        """Decode the method, the loop headers are found in the control flow
+        graph, which is built if it is not given."""
+        from jpamb_utils.cfg import ControlFlowGraph
+
+        bytecode = method["code"]["bytecode"]
+        if cfg is None:
+            cfg = ControlFlowGraph.build(bytecode, method["code"].get("exceptions", []))
+        ops, args = [], []
+        for inst in bytecode:
+            op = OPCODES.get(inst["opr"], UNSUPPORTED)
+            arg = _DECODERS.get(op, _decode_inst)(inst)
+            if isinstance(arg, Unsupported):
+                # Only fail if the instruction is actually executed
+                op = UNSUPPORTED
+            ops.append(op)
+            args.append(arg)
+        return Code(
+            methodid=methodid,
+            ops=tuple(ops),
+            args=tuple(args),
+            max_locals=method["code"]["max_locals"],
+            max_stack=method["code"]["max_stack"],
+            bytecode=bytecode,
+            headers=frozenset(cfg.blocks[loop.header].start for loop in cfg.loops),
+        )
+
+
+_CODE: dict[str, Code] = {}
+
+
+@dataclass(frozen=True)
+class Invoke:
+    """A call of a static method."""
+
+    methodid: str
+    nargs: int
+    returns: bool
+
+    def load(self) -> Code:
+        try:
+            return Code.load(MethodId.parse(self.methodid))
+        except (ValueError, OSError):
+            raise Unsupported(f"can't invoke {self.methodid}")
+
+
+# The instructions which touch the heap
+HEAP_OPERATIONS = {NEWARRAY, ARRAYLENGTH, ARRAY_LOAD, ARRAY_STORE}
+
+_REACHABLE: dict[str, Optional[list[Code]]] = {}
+
+
+def reachable(code: Code) -> Optional[list[Code]]:
+    """The code and all the methods it might call, or None if one of them
+    can't be loaded."""
+    if code.methodid not in _REACHABLE:
+        seen = {code.methodid}
+        worklist = [code]
+        result: Optional[list[Code]] = []
+        while worklist and result is not None:
+            callee = worklist.pop()
+            result.append(callee)
+            for arg in callee.args:
+                if isinstance(arg, Invoke) and arg.methodid not in seen:
+                    seen.add(arg.methodid)
+                    try:
+                        worklist.append(arg.load())
+                    except Unsupported:
+                        result = None
+                        break
+        _REACHABLE[code.methodid] = result
+    return _REACHABLE[code.methodid]
+
+
+def pure(code: Code) -> bool:
+    """Whether the code does not touch the heap, and only calls methods
+    which don't either, so its result only depends on its arguments."""
+    codes = reachable(code)
+    return codes is not None and not any(
+        HEAP_OPERATIONS.intersection(c.ops) for c in codes
+    )
+
+
+def local(code: Code) -> bool:
+    """Whether the code only calls methods of its own class, so its results
+    only depend on that decompiled class."""
+    codes = reachable(code)
+    return codes is not None and all(
+        _class_of(c.methodid) == _class_of(code.methodid) for c in codes
+    )
+
+
+def _class_of(methodid: str) -> str:
+    return methodid.split(":", 1)[0].rsplit(".", 1)[0]
+
+
+class CallMemo:
+    """A bounded LRU memo of the results of calls, by the method id and the
+    arguments of the call.
+
+    A result is either `(True, return value)` or `(False, query)` if the
+    call threw an exception. If a folder is given, the results are loaded
+    from it and saved to it with `save()`, in a file per class, which is
+    only used while the decompiled class is unchanged. Only the results of
+    methods which don't call other classes are saved, as the file does not
+    depend on those.
+    """
+
+    def __init__(self, maxsize: int = MEMO_SIZE, folder: Optional[Path] = None):
+        self.maxsize = maxsize
+        self.folder = folder
+        self.results: OrderedDict[tuple, tuple] = OrderedDict()
+        self.digests: dict[str, Optional[str]] = {}
+        """The digests of the decompiled classes with loaded results."""
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[tuple]:
+        if self.folder is not None and _class_of(key[0]) not in self.digests:
+            self._load(_class_of(key[0]))
+        if (result := self.results.get(key)) is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results.move_to_end(key)
+        return result
+
+    def put(self, key: tuple, result: tuple):
+        self.results[key] = result
+        self.results.move_to_end(key)
+        if len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+
+    def _file(self, class_name: str) -> Path:
+        return self.folder / f"{class_name}.pickle"  # type: ignore
+
+    def _load(self, class_name: str):
+        import hashlib
+        import pickle
+
+        classfile = Path("decompiled", *class_name.split(".")).with_suffix(".json")
+        try:
+            digest = hashlib.sha256(classfile.read_bytes()).hexdigest()
+        except OSError:
+            digest = None
+        self.digests[class_name] = digest
+        try:
+            with open(self._file(class_name), "rb") as f:
+                (cdigest, results) = pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return
+        if digest is not None and cdigest == digest:
+            for key, result in results.items():
+                self.results.setdefault(key, result)
+            while len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+
+    def save(self):
+        """Save the results of the classes, if the memo has a folder."""
+        import os
+        import pickle
+
+        if self.folder is None:
+            return
+        by_class: dict[str, dict] = {c: {} for c in self.digests}
+        for key, result in self.results.items():
+            if (results := by_class.get(_class_of(key[0]))) is not None and (
+                (code := _CODE.get(key[0])) is not None and local(code)
+            ):
+                results[key] = result
+        for class_name, results in by_class.items():
+            if self.digests[class_name] is None or not results:
+                continue
+            try:
+                self.folder.mkdir(parents=True, exist_ok=True)
+                file = self._file(class_name)
+                tmpfile = file.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmpfile, "wb") as f:
+                    pickle.dump(
+                        (self.digests[class_name], results),
+                        f,
+                        pickle.HIGHEST_PROTOCOL,
+                    )
+                os.replace(tmpfile, file)
+            except OSError:
+                # The memo is only an optimization, a read-only checkout is fine.
+                pass
+
+
+def _decode_inst(inst):
+    return inst
+
+
+def _decode_push(inst):
+    value = inst["value"]
+    if value is None:
+        return None
+    if value["type"] in ("integer", "long", "float", "double", "string"):
+        return value["value"]
+    return Unsupported(f"can't push {value}")
+
+
+def _decode_binary(inst):
+    if inst["type"] != "int":
+        return Unsupported(f"can't handle {inst['type']} arithmetic")
+    if (fn := BINARY_OPERATIONS.get(inst["operant"])) is None:
+        return Unsupported(f"can't handle {inst['operant']!r}")
+    return fn
+
+
+def _decode_cast(inst):
+    return {
+        "byte": lambda v: ((v + 0x80) & 0xFF) - 0x80,
+        "short": lambda v: ((v + 0x8000) & 0xFFFF) - 0x8000,
+        "char": lambda v: v & 0xFFFF,
+    }.get(inst["to"], lambda v: v)
+
+
+def _decode_if(inst):
+    return (CONDITIONS[inst["condition"]], inst["target"])
+
+
+def _decode_ifz(inst):
+    cond = inst["condition"]
+    return (CONDITIONS[cond], None if cond in ("is", "isnot") else 0, inst["target"])
+
+
+def _decode_tableswitch(inst):
+    return (inst["low"], inst["targets"], inst["default"])
+
+
+def _decode_lookupswitch(inst):
+    return ({t["key"]: t["target"] for t in inst["targets"]}, inst["default"])
+
+
+def _decode_get(inst):
+    field = inst["field"]
+    if inst["static"] and field["name"] == "$assertionsDisabled":
+        # We always run with assertions enabled
+        return 0
+    return Unsupported(f"can't get {field['class']}.{field['name']}")
+
+
+def _decode_invoke(inst):
+    method = inst["method"]
+    if inst["access"] == "special" and method["name"] == "<init>":
+        return len(method["args"]) + 1
+    if inst["access"] == "static":
+        return Invoke(
+            invoke_target(method),
+            len(method["args"]),
+            method["returns"] is not None,
+        )
+    return Unsupported(f"can't invoke {method['ref']['name']}.{method['name']}")
+
+
+def _decode_newarray(inst):
+    if inst["dim"] != 1:
+        return Unsupported(f"can't create arrays of {inst['dim']} dimensions")
+    # The default value of the elements
+    return 0 if isinstance(inst["type"], str) else None
+
+
+def _decode_words(inst):
+    if inst["words"] != 1:
+        return Unsupported(f"can't handle {inst['opr']} of {inst['words']} words")
+    return 1
+
+
+_DECODERS = {
+    PUSH: _decode_push,
+    LOAD: lambda inst: inst["index"],
+    STORE: lambda inst: inst["index"],
+    DUP: _decode_words,
+    POP: _decode_words,
+    BINARY: _decode_binary,
+    INCR: lambda inst: (inst["index"], inst["amount"]),
+    CAST: _decode_cast,
+    IF: _decode_if,
+    IFZ: _decode_ifz,
+    GOTO: lambda inst: inst["target"],
+    TABLESWITCH: _decode_tableswitch,
+    LOOKUPSWITCH: _decode_lookupswitch,
+    RETURN: lambda inst: inst["type"],
+    GET: _decode_get,
+    NEW: lambda inst: inst["class"],
+    INVOKE: _decode_invoke,
+    NEWARRAY: _decode_newarray,
+    UNSUPPORTED: lambda inst: Unsupported(f"can't handle {inst['opr']!r}"),
+}
+
+
+def wrap(v: int) -> int:
+    """Wrap an integer to the range of a 32-bit java int."""
+    return ((v + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+def _div(a, b):
+    if b == 0:
+        raise JvmException("divide by zero")
+    q = abs(a) // abs(b)
+    return wrap(q if (a < 0) == (b < 0) else -q)
+
+
+def _rem(a, b):
+    if b == 0:
+        raise JvmException("divide by zero")
+    r = abs(a) % abs(b)
+    return r if a >= 0 else -r
+
+
+BINARY_OPERATIONS: dict[str, Callable[[int, int], int]] = {
+    "add": lambda a, b: wrap(a + b),
+    "sub": lambda a, b: wrap(a - b),
+    "mul": lambda a, b: wrap(a * b),
+    "div": _div,
+    "rem": _rem,
+    "and": lambda a, b: a & b,
+    "or": lambda a, b: a | b,
+    "xor": lambda a, b: a ^ b,
+    "shl": lambda a, b: wrap(a << (b & 31)),
+    "shr": lambda a, b: a >> (b & 31),
+    "ushr": lambda a, b: wrap((a & 0xFFFFFFFF) >> (b & 31)),
+}
+
+
+def to_local(value: JvmValue):
+    """Convert an input value to the value the interpreter uses."""
+    return value.tolocal()
+
+
+class _AnyArray:
+    """Equal to any array, to compare the other values of states first."""
+
+    __hash__ = None  # type: ignore
+
+    def __eq__(self, other):
+        return isinstance(other, (list, array))
+
+
+_ANY_ARRAY = _AnyArray()
+
+
+def _copy(state: tuple) -> tuple:
+    return tuple(v[:] if isinstance(v, (list, array)) else v for v in state)
+
+
+def _shape(state: tuple) -> tuple:
+    return tuple(_ANY_ARRAY if isinstance(v, (list, array)) else v for v in state)
+
+
+def _aliases(state: tuple) -> tuple:
+    """For each value of the state, the first value which is the same array."""
+    first: dict[int, int] = {}
+    return tuple(
+        first.setdefault(id(v), i) if isinstance(v, (list, array)) else -1
+        for i, v in enumerate(state)
+    )
+
+
+class CycleDetector:
+    """Brent's cycle detection on the states of a frame at its loop headers.
+
+    The state is the program counter, the locals and the stack, with the
+    contents of the arrays they refer to, and which of them are the same
+    array. Only a single state is kept, which is replaced after 1, 2, 4, ...
+    visits, so a cycle is found within twice its length, after it started.
+    """
+
+    __slots__ = ("shape", "saved", "aliases", "power", "visits")
+
+    def __init__(self):
+        self.shape: Optional[tuple] = None
+        self.saved: Optional[tuple] = None
+        self.aliases: Optional[tuple] = None
+        self.power = 1
+        self.visits = 0
+
+    def visit(self, pc: int, locals: list, stack: list):
+        state = (pc, *locals, *stack)
+        # The contents of the arrays are only compared if all else is equal
+        if (
+            state == self.shape
+            and state == self.saved
+            and _aliases(state) == self.aliases
+        ):
+            raise InfiniteLoop()
+        self.visits += 1
+        if self.visits == self.power:
+            self.shape, self.saved = _shape(state), _copy(state)
+            self.aliases = _aliases(state)
+            self.power *= 2
+            self.visits = 0
+
+
+class Interpreter:
+    """An interpreter for pre-decoded code.
+
+    Each step function takes the stack, the locals, the operand and the
+    program counter, and returns the next program counter.
+
+    The limit is on the steps of a run, including the steps of the methods
+    it calls. A call of a pure method which is in the memo takes one step.
+    If `detect_cycles` is set, a repeated state at a loop header is reported
+    as '*' right away.
+    """
+
+    def __init__(
+        self,
+        limit: int = STEP_LIMIT,
+        memo: Optional[CallMemo] = None,
+        detect_cycles: bool = True,
+    ):
+        self.limit = limit
+        self.detect_cycles = detect_cycles
+        self.steps = 0
+        self.budget = limit
+        self.memo = CallMemo() if memo is None else memo
+        dispatch: list[Callable] = [self.step_unsupported] * len(OPCODES)
+        for name, op in OPCODES.items():
+            dispatch[op] = getattr(self, "step_" + name)
+        dispatch.append(self.step_unsupported)
+        self.dispatch = tuple(dispatch)
+
+    def run(
+        self,
+        code: Code,
+        inputs: list[JvmValue],
+        trace: Optional[Callable[[int, list, list], None]] = None,
+    ) -> str:
+        """Run the code on the inputs, and return the query it answers.
+
+        If the interpreter runs out of steps we report '*', and if it can't
+        handle an instruction it raises `Unsupported`. The `trace` function
+        is called with the program counter, the stack and the locals before
+        each step.
+        """
+        args = [to_local(i) for i in inputs]
+        self.budget = self.limit
+        try:
+            self.execute(code, args, trace)
+        except JvmException as e:
+            return e.result
+        except OutOfSteps:
+            return "*"
+        return "ok"
+
+    def execute(self, code: Code, args: list, trace=None):
+        """Execute the code with the arguments, and return its return value.
+
+        The steps are taken from the `budget` of the run.
+        """
+        locals = args + [None] * (code.max_locals - len(args))
+        stack = []
+        ops, operands, dispatch = code.ops, code.args, self.dispatch
+        headers = code.headers if self.detect_cycles else None
+        visit = CycleDetector().visit if headers else None
+        pc = 0
+        # The steps of this frame, and the steps taken from the budget
+        steps = charged = 0
+        end = self.budget
+        try:
+            while True:
+                try:
+                    if trace is None and visit is None:
+                        for steps in range(charged, end):
+                            pc = dispatch[ops[pc]](stack, locals, operands[pc], pc)
+                    elif trace is None:
+                        for steps in range(charged, end):
+                            if pc in headers:
+                                visit(pc, locals, stack)
+                            pc = dispatch[ops[pc]](stack, locals, operands[pc], pc)
+                    else:
+                        for steps in range(charged, end):
+                            trace(pc, stack, locals)
+                            if visit is not None and pc in headers:
+                                visit(pc, locals, stack)
+                            pc = dispatch[ops[pc]](stack, locals, operands[pc], pc)
+                    break
+                except _Call as e:
+                    self._charge(steps + 1 - charged)
+                    charged = steps + 1
+                    self.call(e.invoke, stack)
+                    pc += 1
+                    end = charged + self.budget
+        except _Return:
+            self._charge(steps + 1 - charged)
+            return stack[-1] if operands[pc] is not None else None
+        except BaseException:
+            self._charge(max(steps + 1 - charged, 0))
+            raise
+        self._charge(end - charged)
+        raise OutOfSteps()
+
+    def _charge(self, steps: int):
+        self.steps += steps
+        self.budget -= steps
+
+    def call(self, invoke: Invoke, stack: list):
+        """Call the method with the arguments on the stack, and push its
+        return value. The results of pure methods are memoized."""
+        args = stack[len(stack) - invoke.nargs :]
+        del stack[len(stack) - invoke.nargs :]
+        code = invoke.load()
+        try:
+            if pure(code) and not any(isinstance(a, (list, array)) for a in args):
+                key = (invoke.methodid, *args)
+                if (result := self.memo.get(key)) is None:
+                    try:
+                        result = (True, self.execute(code, args))
+                    except JvmException as e:
+                        result = (False, e.result)
+                    self.memo.put(key, result)
+                (returned, value) = result
+                if not returned:
+                    raise JvmException(value)
+            else:
+                value = self.execute(code, args)
+        except RecursionError:
+            raise Unsupported("calls nested too deep")
+        if invoke.returns:
+            stack.append(value)
+
+    def step_push(self, stack, locals, value, pc):
+        stack.append(value)
+        return pc + 1
+
+    def step_load(self, stack, locals, index, pc):
+        stack.append(locals[index])
+        return pc + 1
+
+    def step_store(self, stack, locals, index, pc):
+        locals[index] = stack.pop()
+        return pc + 1
+
+    def step_dup(self, stack, locals, words, pc):
+        stack.append(stack[-1])
+        return pc + 1
+
+    def step_pop(self, stack, locals, words, pc):
+        stack.pop()
+        return pc + 1
+
+    def step_binary(self, stack, locals, fn, pc):
+        b = stack.pop()
+        stack[-1] = fn(stack[-1], b)
+        return pc + 1
+
+    def step_negate(self, stack, locals, _, pc):
+        stack[-1] = wrap(-stack[-1])
+        return pc + 1
+
+    def step_incr(self, stack, locals, arg, pc):
+        index, amount = arg
+        locals[index] = wrap(locals[index] + amount)
+        return pc + 1
+
+    def step_cast(self, stack, locals, fn, pc):
+        stack[-1] = fn(stack[-1])
+        return pc + 1
+
+    def step_if(self, stack, locals, arg, pc):
+        cond, target = arg
+        b = stack.pop()
+        return target if cond(stack.pop(), b) else pc + 1
+
+    def step_ifz(self, stack, locals, arg, pc):
+        cond, zero, target = arg
+        return target if cond(stack.pop(), zero) else pc + 1
+
+    def step_goto(self, stack, locals, target, pc):
+        return target
+
+    def step_tableswitch(self, stack, locals, arg, pc):
+        low, targets, default = arg
+        index = stack.pop() - low
+        return targets[index] if 0 <= index < len(targets) else default
+
+    def step_lookupswitch(self, stack, locals, arg, pc):
+        targets, default = arg
+        return targets.get(stack.pop(), default)
+
+    def step_return(self, stack, locals, type, pc):
+        raise _Return()
+
+    def step_get(self, stack, locals, value, pc):
+        stack.append(value)
+        return pc + 1
+
+    def step_new(self, stack, locals, class_name, pc):
+        stack.append(JvmObject(class_name))
+        return pc + 1
+
+    def step_throw(self, stack, locals, _, pc):
+        obj = stack.pop()
+        if obj is None:
+            raise JvmException("null pointer")
+        if (result := EXCEPTIONS.get(obj.class_name)) is None:
+            raise Unsupported(f"can't throw {obj.class_name}")
+        raise JvmException(result)
+
+    def step_invoke(self, stack, locals, arg, pc):
+        if isinstance(arg, Invoke):
+            raise _Call(arg)
+        # Constructors have no effect, as we do not model fields
+        del stack[-arg:]
+        return pc + 1
+
+    def step_newarray(self, stack, locals, default, pc):
+        length = stack[-1]
+        if length < 0:
+            raise Unsupported("can't create arrays of negative size")
+        if length > self.limit:
+            raise Unsupported("can't create arrays longer than the step limit")
+        stack[-1] = [default] * length
+        return pc + 1
+
+    def step_arraylength(self, stack, locals, _, pc):
+        array = stack[-1]
+        if array is None:
+            raise JvmException("null pointer")
+        stack[-1] = len(array)
+        return pc + 1
+
+    def step_array_load(self, stack, locals, _, pc):
+        index = stack.pop()
+        array = stack[-1]
+        if array is None:
+            raise JvmException("null pointer")
+        if not 0 <= index < len(array):
+            raise JvmException("out of bounds")
+        stack[-1] = array[index]
+        return pc + 1
+
+    def step_array_store(self, stack, locals, _, pc):
+        value = stack.pop()
+        index = stack.pop()
+        array = stack.pop()
+        if array is None:
+            raise JvmException("null pointer")
+        if not 0 <= index < len(array):
+            raise JvmException("out of bounds")
+        array[index] = value
+        return pc + 1
+
+    def step_unsupported(self, stack, locals, error, pc):
+        raise error
@@ -0,0 +1,570 @@
+""" A batched interpreter, which runs many inputs of a method at once.
+
+The `LaneInterpreter` runs each input in a lane. The locals and the operand
+stack are numpy arrays with a column per lane, where ints wrap around like
+java ints. The lanes at the same instruction are stepped together, with
+masks for the lanes which branch differently or throw. The lanes with the
+lowest program counter go first, so lanes which diverged meet again after
+the branch:
+
+    >>> code = Code.load(MethodId.parse("jpamb.cases.Simple.divideByN:(I)I"))
+    >>> LaneInterpreter().summary(code, [[IntValue(i)] for i in range(-5, 5)])
+    {'ok': 9, 'divide by zero': 1}
+
+References are ints as well: null is 0, arrays are positive handles into a
+flat heap, and objects are negative handles of their class. The results
+are the same as those of the `Interpreter`, except that an unsupported
+instruction only stops the lanes which reach it.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from jpamb_utils import JvmValue
+from jpamb_utils.interpreter import (
+    ARRAY_LOAD,
+    ARRAY_STORE,
+    ARRAYLENGTH,
+    BINARY,
+    CAST,
+    DUP,
+    EXCEPTIONS,
+    GET,
+    GOTO,
+    IF,
+    IFZ,
+    INCR,
+    INVOKE,
+    LOAD,
+    LOOKUPSWITCH,
+    NEGATE,
+    NEW,
+    NEWARRAY,
+    OPCODES,
+    POP,
+    PUSH,
+    RETURN,
+    STEP_LIMIT,
+    STORE,
+    TABLESWITCH,
+    THROW,
+    UNSUPPORTED,
+    Code,
+    Unsupported,
+)
+
+# The outcomes of a lane, None is an unsupported instruction
+OUTCOMES = (
+    "ok",
+    "*",
+    "assertion error",
+    "divide by zero",
+    "out of bounds",
+    "null pointer",
+    None,
+)
+OK, OUT_OF_STEPS, _, DIVIDE_BY_ZERO, OUT_OF_BOUNDS, NULL_POINTER, FAILED = range(
+    len(OUTCOMES)
+)
+RUNNING = -1
+
+# Selects all the lanes
+ALL = slice(None)
+
+BRANCHES = {IF, IFZ, TABLESWITCH, LOOKUPSWITCH}
+
+CONDITIONS = {
+    "eq": np.equal,
+    "ne": np.not_equal,
+    "lt": np.less,
+    "ge": np.greater_equal,
+    "gt": np.greater,
+    "le": np.less_equal,
+    "is": np.equal,
+    "isnot": np.not_equal,
+}
+
+CASTS = {"byte": np.int8, "short": np.int16, "char": np.uint16}
+
+INT_MIN, INT_MAX = -(2**31), 2**31 - 1
+
+
+def _wide(a):
+    return a.astype(np.int64)
+
+
+def _div(a, b):
+    q = np.abs(_wide(a)) // np.abs(_wide(b))
+    return np.where((a < 0) == (b < 0), q, -q).astype(np.int32)
+
+
+def _rem(a, b):
+    q = np.abs(_wide(a)) // np.abs(_wide(b))
+    q = np.where((a < 0) == (b < 0), q, -q)
+    return (a - q * b).astype(np.int32)
+
+
+# The operations on int32 arrays, which wrap around on overflow
+BINARY_OPERATIONS = {
+    "add": np.add,
+    "sub": np.subtract,
+    "mul": np.multiply,
+    "div": _div,
+    "rem": _rem,
+    "and": np.bitwise_and,
+    "or": np.bitwise_or,
+    "xor": np.bitwise_xor,
+    "shl": lambda a, b: (_wide(a) << (b & 31)).astype(np.int32),
+    "shr": lambda a, b: a >> (b & 31),
+    "ushr": lambda a, b: (a.astype(np.uint32) >> (b & 31).astype(np.uint32)).astype(
+        np.int32
+    ),
+}
+
+
+def _operand(op: int, inst: dict, arg, classes: dict[str, int]):
+    """The operand of an instruction for the lanes, from the operand `arg`
+    which `Code` decoded for the `Interpreter`."""
+    if op == PUSH:
+        if arg is None:
+            return 0
+        if isinstance(arg, str):
+            return -classes.setdefault("java/lang/String", len(classes)) - 1
+        if isinstance(arg, int) and INT_MIN <= arg <= INT_MAX:
+            return arg
+        return Unsupported(f"can't push {arg!r} in lanes")
+    if op == INVOKE and not isinstance(arg, int):
+        return Unsupported(f"can't call {arg.methodid} in lanes")
+    if op == BINARY:
+        operant = inst["operant"]
+        return (BINARY_OPERATIONS[operant], operant in ("div", "rem"))
+    if op == CAST:
+        return CASTS.get(inst["to"])
+    if op in (IF, IFZ):
+        return (CONDITIONS[inst["condition"]], inst["target"])
+    if op == TABLESWITCH:
+        return (inst["low"], np.array(inst["targets"]), inst["default"])
+    if op == LOOKUPSWITCH:
+        targets = sorted((t["key"], t["target"]) for t in inst["targets"])
+        keys = np.array([k for k, _ in targets], dtype=np.int64)
+        return (keys, np.array([t for _, t in targets], dtype=np.int64), inst["default"])
+    if op == NEW:
+        return -classes.setdefault(inst["class"], len(classes)) - 1
+    return arg
+
+
+def _successors(op: int, arg, pc: int) -> list[int]:
+    if op == GOTO:
+        return [arg]
+    if op in (IF, IFZ):
+        return [arg[1], pc + 1]
+    if op in (TABLESWITCH, LOOKUPSWITCH):
+        return [*map(int, arg[-2]), arg[-1]]
+    if op in (RETURN, THROW, UNSUPPORTED):
+        return []
+    return [pc + 1]
+
+
+# The change in the depth of the stack of each instruction
+_EFFECTS = {
+    PUSH: 1,
+    LOAD: 1,
+    STORE: -1,
+    DUP: 1,
+    POP: -1,
+    BINARY: -1,
+    IF: -2,
+    IFZ: -1,
+    TABLESWITCH: -1,
+    LOOKUPSWITCH: -1,
+    GET: 1,
+    NEW: 1,
+    ARRAY_LOAD: -1,
+    ARRAY_STORE: -3,
+}
+
+
+def columns(inputs: list[list[JvmValue]]) -> list:
+    """The columns of the inputs, for `LaneInterpreter.run_columns`."""
+    result = []
+    for column in zip(*inputs):
+        if isinstance(column[0].value, (bool, int, str)):
+            result.append(np.fromiter((v.tolocal() for v in column), np.int32))
+        else:
+            result.append([v.value for v in column])
+    return result
+
+
+def summarize(outcomes: np.ndarray) -> dict[str, int]:
+    """The number of inputs which answer each query, in the order they were
+    first answered.
+
+    A query which occurs can be predicted as `query;100%`, and the others
+    with a probability which is lower the more inputs there were.
+    """
+    counts = np.bincount(outcomes, minlength=len(OUTCOMES))
+    firsts = np.sort(np.unique(outcomes, return_index=True)[1])
+    return {
+        OUTCOMES[o]: int(counts[o])  # type: ignore
+        for o in outcomes[firsts]
+        if OUTCOMES[o] is not None
+    }
+
+
+class LaneCode:
+    """The code of a method, decoded for the lanes.
+
+    All the lanes at an instruction have the same stack depth, which is
+    computed up front, so the lanes need no stack pointers.
+    """
+
+    def __init__(self, code: Code):
+        self.code = code
+        self.classes: dict[str, int] = {}
+        self.args = tuple(
+            _operand(op, inst, arg, self.classes)
+            for op, inst, arg in zip(code.ops, code.bytecode, code.args)
+        )
+        self.ops = tuple(
+            UNSUPPORTED if isinstance(arg, Unsupported) else op
+            for op, arg in zip(code.ops, self.args)
+        )
+
+        self.depths: list[Optional[int]] = [None] * len(self.ops)
+        self.depths[0] = 0
+        worklist = [0]
+        while worklist:
+            pc = worklist.pop()
+            op, arg = self.ops[pc], self.args[pc]
+            depth = self.depths[pc] + _EFFECTS.get(op, 0)  # type: ignore
+            if op == INVOKE:
+                depth -= arg
+            for succ in _successors(op, arg, pc):
+                if self.depths[succ] is None:
+                    self.depths[succ] = depth
+                    worklist.append(succ)
+
+        # The outcome of throwing an object of each class
+        self.class_names = list(self.classes)
+        self.thrown = np.full(len(self.classes), FAILED, dtype=np.int8)
+        for name, i in self.classes.items():
+            if name in EXCEPTIONS:
+                self.thrown[i] = OUTCOMES.index(EXCEPTIONS[name])
+
+    @staticmethod
+    def load(code: Code) -> "LaneCode":
+        """Decode the code, the result is cached for the life of the process."""
+        if (lanes := _LANE_CODE.get(code.methodid)) is None:
+            lanes = _LANE_CODE[code.methodid] = LaneCode(code)
+        return lanes
+
+
+_LANE_CODE: dict[str, LaneCode] = {}
+
+
+class LaneInterpreter:
+    """An interpreter which runs many inputs of the same code at once.
+
+    Each step function takes the lanes it steps (a slice of all the lanes,
+    or an array of their indices), the operand and the program counter, and
+    sets the program counters of the lanes.
+    """
+
+    def __init__(self, limit: int = STEP_LIMIT):
+        self.limit = limit
+        self.steps = 0
+        self.errors: dict[int, Unsupported] = {}
+        """The unsupported instruction each failed lane stopped at."""
+        dispatch = [self.step_unsupported] * (len(OPCODES) + 1)
+        for name, op in OPCODES.items():
+            dispatch[op] = getattr(self, "step_" + name)
+        self.dispatch = tuple(dispatch)
+
+    def run(self, code: Code, inputs: list[list[JvmValue]]) -> list[Optional[str]]:
+        """Run the code on each of the inputs, and return the queries they
+        answer, like `Interpreter.run`.
+
+        Inputs which reach an unsupported instruction answer None, and the
+        error is in `errors`.
+        """
+        outcomes = self.run_columns(code, columns(inputs), len(inputs))
+        return [OUTCOMES[o] for o in outcomes]
+
+    def summary(self, code: Code, inputs: list[list[JvmValue]]) -> dict[str, int]:
+        """The number of inputs which answer each query, see `summarize`."""
+        return summarize(self.run_columns(code, columns(inputs), len(inputs)))
+
+    def run_columns(self, code: Code, columns: list, count: int) -> np.ndarray:
+        """Run the code on `count` inputs, given as a column per parameter,
+        and return the index in `OUTCOMES` of the answer of each input.
+
+        The column of an int, boolean or char parameter is a numpy array of
+        ints, and the one of an array parameter is a list of sequences of
+        ints, see `columns`.
+        """
+        lanes = LaneCode.load(code)
+        self.errors = {}
+        self.outcomes = np.full(count, RUNNING, dtype=np.int8)
+        if count:
+            self._setup(lanes, columns, count)
+            self._execute(lanes)
+        return self.outcomes
+
+    def _setup(self, lanes: LaneCode, columns: list, count: int):
+        self.ids = np.arange(count)
+        self.pc = np.zeros(count, dtype=np.int64)
+        self.lane_steps = np.zeros(count, dtype=np.int64)
+        self.together = 0
+        """The steps taken by all the lanes, which are not in `lane_steps`."""
+        self.locals = np.zeros((max(lanes.code.max_locals, 1), count), dtype=np.int32)
+        self.stack = np.zeros((max(lanes.code.max_stack, 1), count), dtype=np.int32)
+        self.done = np.zeros(count, dtype=bool)
+        self.finished = False
+
+        # Handle 0 is null, and has no elements
+        self.heap = np.zeros(1024, dtype=np.int32)
+        self.heap_size = 0
+        self.offsets = np.zeros(64, dtype=np.int64)
+        self.lengths = np.zeros(64, dtype=np.int64)
+        self.handles = 1
+
+        for i, column in enumerate(columns):
+            if isinstance(column, np.ndarray):
+                self.locals[i] = column
+                continue
+            start = self.heap_size
+            handles = self._allocate(np.array([len(a) for a in column], dtype=np.int64))
+            if self.heap_size > start:
+                self.heap[start : self.heap_size] = np.concatenate(
+                    [np.asarray(a, dtype=np.int32) for a in column]
+                )
+            self.locals[i] = handles
+
+    def _allocate(self, lengths):
+        """Allocate arrays of zeros with the lengths, and return their handles."""
+        count, size = len(lengths), int(lengths.sum())
+        handles = np.arange(self.handles, self.handles + count)
+        self.handles += count
+        while self.handles > len(self.offsets):
+            self.offsets = np.resize(self.offsets, 2 * len(self.offsets))
+            self.lengths = np.resize(self.lengths, 2 * len(self.lengths))
+        while self.heap_size + size > len(self.heap):
+            self.heap = np.resize(self.heap, 2 * len(self.heap))
+        self.offsets[handles] = self.heap_size + np.cumsum(lengths) - lengths
+        self.lengths[handles] = lengths
+        self.heap[self.heap_size : self.heap_size + size] = 0
+        self.heap_size += size
+        return handles
+
+    def _execute(self, lanes: LaneCode):
+        ops, args, dispatch = lanes.ops, lanes.args, self.dispatch
+        self.depths = lanes.depths
+        self.code = lanes
+        iterations = 0
+        # The instruction of all the lanes, while they have not diverged
+        together: Optional[int] = 0
+        while len(self.ids):
+            if together is not None:
+                pc, sel = together, ALL
+            else:
+                pc = int(self.pc.min())
+                at = self.pc == pc
+                sel = ALL if at.all() else np.flatnonzero(at)
+            op = ops[pc]
+            dispatch[op](sel, args[pc], pc)
+            if sel is ALL:
+                self.together += 1
+                together = args[pc] if op == GOTO else None if op in BRANCHES else pc + 1
+            else:
+                self.lane_steps[sel] += 1
+                together = None
+            iterations += 1
+            # No lane can have taken more steps than there were iterations
+            if iterations >= self.limit:
+                steps = self.lane_steps + self.together
+                self._finish(np.flatnonzero((steps >= self.limit) & ~self.done), OUT_OF_STEPS)
+            if self.finished:
+                self._compact()
+
+    def _lanes(self, sel):
+        return np.arange(len(self.ids)) if sel is ALL else sel
+
+    def _finish(self, lanes, outcome, error: Optional[Unsupported] = None):
+        """Stop the lanes, with the outcome."""
+        if len(lanes) == 0:
+            return
+        self.outcomes[self.ids[lanes]] = outcome
+        self.done[lanes] = True
+        self.finished = True
+        if error is not None:
+            self.errors.update(dict.fromkeys(self.ids[lanes].tolist(), error))
+
+    def _compact(self):
+        running = ~self.done
+        self.steps += int(self.lane_steps[self.done].sum()) + self.together * int(
+            self.done.sum()
+        )
+        self.ids = self.ids[running]
+        self.pc = self.pc[running]
+        self.lane_steps = self.lane_steps[running]
+        self.locals = self.locals[:, running]
+        self.stack = self.stack[:, running]
+        self.done = self.done[running]
+        self.finished = False
+
+    def _fail(self, sel, mask, outcome):
+        """Stop the lanes in the mask, and return the mask of the others."""
+        if mask.any():
+            self._finish(self._lanes(sel)[mask], outcome)
+        return ~mask
+
+    def step_push(self, sel, value, pc):
+        self.stack[self.depths[pc], sel] = value
+        self.pc[sel] = pc + 1
+
+    def step_load(self, sel, index, pc):
+        self.stack[self.depths[pc], sel] = self.locals[index, sel]
+        self.pc[sel] = pc + 1
+
+    def step_store(self, sel, index, pc):
+        self.locals[index, sel] = self.stack[self.depths[pc] - 1, sel]
+        self.pc[sel] = pc + 1
+
+    def step_dup(self, sel, words, pc):
+        d = self.depths[pc]
+        self.stack[d, sel] = self.stack[d - 1, sel]
+        self.pc[sel] = pc + 1
+
+    def step_pop(self, sel, words, pc):
+        self.pc[sel] = pc + 1
+
+    def step_binary(self, sel, arg, pc):
+        fn, divides = arg
+        d = self.depths[pc]
+        a, b = self.stack[d - 2, sel], self.stack[d - 1, sel]
+        if divides:
+            self._fail(sel, b == 0, DIVIDE_BY_ZERO)
+            b = np.where(b == 0, 1, b)
+        self.stack[d - 2, sel] = fn(a, b)
+        self.pc[sel] = pc + 1
+
+    def step_negate(self, sel, _, pc):
+        d = self.depths[pc]
+        self.stack[d - 1, sel] = -self.stack[d - 1, sel]
+        self.pc[sel] = pc + 1
+
+    def step_incr(self, sel, arg, pc):
+        index, amount = arg
+        self.locals[index, sel] += np.int32(amount)
+        self.pc[sel] = pc + 1
+
+    def step_cast(self, sel, dtype, pc):
+        if dtype is not None:
+            d = self.depths[pc]
+            self.stack[d - 1, sel] = self.stack[d - 1, sel].astype(dtype)
+        self.pc[sel] = pc + 1
+
+    def step_if(self, sel, arg, pc):
+        cond, target = arg
+        d = self.depths[pc]
+        taken = cond(self.stack[d - 2, sel], self.stack[d - 1, sel])
+        self.pc[sel] = np.where(taken, target, pc + 1)
+
+    def step_ifz(self, sel, arg, pc):
+        cond, target = arg
+        taken = cond(self.stack[self.depths[pc] - 1, sel], 0)
+        self.pc[sel] = np.where(taken, target, pc + 1)
+
+    def step_goto(self, sel, target, pc):
+        self.pc[sel] = target
+
+    def step_tableswitch(self, sel, arg, pc):
+        low, targets, default = arg
+        index = self.stack[self.depths[pc] - 1, sel] - np.int64(low)
+        inside = (0 <= index) & (index < len(targets))
+        self.pc[sel] = np.where(inside, targets[np.where(inside, index, 0)], default)
+
+    def step_lookupswitch(self, sel, arg, pc):
+        keys, targets, default = arg
+        key = self.stack[self.depths[pc] - 1, sel]
+        if len(keys) == 0:
+            self.pc[sel] = default
+            return
+        index = np.minimum(np.searchsorted(keys, key), len(keys) - 1)
+        self.pc[sel] = np.where(keys[index] == key, targets[index], default)
+
+    def step_return(self, sel, type, pc):
+        self._finish(self._lanes(sel), OK)
+
+    def step_get(self, sel, value, pc):
+        self.stack[self.depths[pc], sel] = value
+        self.pc[sel] = pc + 1
+
+    def step_new(self, sel, handle, pc):
+        self.stack[self.depths[pc], sel] = handle
+        self.pc[sel] = pc + 1
+
+    def step_throw(self, sel, _, pc):
+        handles = self.stack[self.depths[pc] - 1, sel]
+        lanes = self._lanes(sel)
+        self._finish(lanes[handles == 0], NULL_POINTER)
+        lanes, classes = lanes[handles < 0], -handles[handles < 0] - 1
+        outcomes = self.code.thrown[classes]
+        for outcome in np.unique(outcomes[outcomes != FAILED]):
+            self._finish(lanes[outcomes == outcome], outcome)
+        for i in np.unique(classes[outcomes == FAILED]):
+            error = Unsupported(f"can't throw {self.code.class_names[i]}")
+            self._finish(lanes[classes == i], FAILED, error)
+
+    def step_invoke(self, sel, arg, pc):
+        # Constructors have no effect, and the stack depths are known
+        self.pc[sel] = pc + 1
+
+    def step_newarray(self, sel, default, pc):
+        d = self.depths[pc]
+        lengths = self.stack[d - 1, sel].astype(np.int64)
+        lanes = self._lanes(sel)
+        if (negative := lengths < 0).any():
+            error = Unsupported("can't create arrays of negative size")
+            self._finish(lanes[negative], FAILED, error)
+            lengths = np.where(negative, 0, lengths)
+        if (too_long := lengths > self.limit).any():
+            error = Unsupported("can't create arrays longer than the step limit")
+            self._finish(lanes[too_long], FAILED, error)
+            lengths = np.where(too_long, 0, lengths)
+        self.stack[d - 1, sel] = self._allocate(lengths)
+        self.pc[sel] = pc + 1
+
+    def step_arraylength(self, sel, _, pc):
+        d = self.depths[pc]
+        handles = self.stack[d - 1, sel]
+        self._fail(sel, handles == 0, NULL_POINTER)
+        self.stack[d - 1, sel] = self.lengths[handles]
+        self.pc[sel] = pc + 1
+
+    def _element(self, sel, handles, index):
+        """The heap index of the elements, for the lanes which don't fail."""
+        ok = self._fail(sel, handles == 0, NULL_POINTER)
+        outside = ok & ((index < 0) | (index >= self.lengths[handles]))
+        ok &= self._fail(sel, outside, OUT_OF_BOUNDS)
+        return ok, self.offsets[handles] + np.where(ok, index, 0)
+
+    def step_array_load(self, sel, _, pc):
+        d = self.depths[pc]
+        ok, element = self._element(
+            sel, self.stack[d - 2, sel], self.stack[d - 1, sel]
+        )
+        self.stack[d - 2, sel] = np.where(ok, self.heap[element], 0)
+        self.pc[sel] = pc + 1
+
+    def step_array_store(self, sel, _, pc):
+        d = self.depths[pc]
+        ok, element = self._element(
+            sel, self.stack[d - 3, sel], self.stack[d - 2, sel]
+        )
+        self.heap[element[ok]] = self.stack[d - 1, sel][ok]
+        self.pc[sel] = pc + 1
+
+    def step_unsupported(self, sel, error, pc):
+        self._finish(self._lanes(sel), FAILED, error)
@@ -0,0 +1,179 @@
+""" An index of the method declarations in the java sources.
+
+Each source file under `src/main/java` is parsed once with tree-sitter, into
+a compact `SourceMethod` per method, which holds the byte ranges of the
+declaration and its body, the parameter types, and how many assertions,
+throws, divisions and array accesses it contains.
+
+The index of a file is cached by its content hash next to the method index,
+so later invocations don't even import tree-sitter. Use `MethodId.source()`
+to get the declaration of a method:
+
+    >>> MethodId.parse("jpamb.cases.Simple.assertFalse:()V").source()
+    SourceMethod(start=..., params=(), asserts=1, throws=0, divisions=0, ...)
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+# The nodes which declare a class, and whose methods we index
+CLASS_DECLARATIONS = {
+    "class_declaration",
+    "interface_declaration",
+    "enum_declaration",
+    "record_declaration",
+}
+
+METHOD_DECLARATIONS = {"method_declaration", "constructor_declaration"}
+
+DIVISIONS = {"/", "%", "/=", "%="}
+
+
+@dataclass(frozen=True)
+class SourceMethod:
+    """A method declaration, the byte ranges are into the source file."""
+
+    start: int
+    end: int
+    body_start: int
+    body_end: int
+    line: int
+    """The line the declaration starts on, counting from 1."""
+    params: tuple[str, ...]
+    """The types of the parameters, as written in the source."""
+    asserts: int
+    throws: int
+    divisions: int
+    """The `/` and `%` operations, including the compound assignments."""
+    array_accesses: int
+
+    def text(self, content: bytes) -> bytes:
+        return content[self.start : self.end]
+
+    def body(self, content: bytes) -> bytes:
+        return content[self.body_start : self.body_end]
+
+
+def _type_name(node, dimensions=None) -> Optional[str]:
+    """The type of a declaration, without spaces, or None for void."""
+    if node is None or node.type == "void_type":
+        return None
+    name = "".join(node.text.decode().split())
+    if dimensions is not None:
+        name += "".join(dimensions.text.decode().split())
+    return name
+
+
+def _parameters(node) -> tuple[str, ...]:
+    params = []
+    if (parameters := node.child_by_field_name("parameters")) is not None:
+        for p in parameters.named_children:
+            if p.type == "formal_parameter":
+                params.append(
+                    _type_name(
+                        p.child_by_field_name("type"),
+                        p.child_by_field_name("dimensions"),
+                    )
+                )
+            elif p.type == "spread_parameter":
+                params.append(_type_name(p.named_children[0]) + "[]")
+    return tuple(params)
+
+
+def _count(body) -> dict[str, int]:
+    """Count the interesting nodes of a method body."""
+    counts = {"asserts": 0, "throws": 0, "divisions": 0, "array_accesses": 0}
+    if body is None:
+        return counts
+    nodes = [body]
+    while nodes:
+        node = nodes.pop()
+        match node.type:
+            case "assert_statement":
+                counts["asserts"] += 1
+            case "throw_statement":
+                counts["throws"] += 1
+            case "array_access":
+                counts["array_accesses"] += 1
+            case "binary_expression" | "assignment_expression":
+                operator = node.child_by_field_name("operator")
+                if operator is not None and operator.type in DIVISIONS:
+                    counts["divisions"] += 1
+        nodes.extend(node.named_children)
+    return counts
+
+
+def index_source(content: bytes) -> dict[str, SourceMethod]:
+    """Index the methods of a java source file by their full `MethodId` string.
+
+    Methods with types that a `MethodId` can't express are left out.
+    """
+    import tree_sitter
+    import tree_sitter_java
+
+    from jpamb_utils import MethodId
+
+    language = tree_sitter.Language(tree_sitter_java.language())
+    tree = tree_sitter.Parser(language).parse(content)
+
+    package = ""
+    for node in tree.root_node.named_children:
+        if node.type == "package_declaration":
+            package = "".join(node.named_children[0].text.decode().split()) + "."
+
+    index = {}
+    # The declarations to visit, with the name of the enclosing class
+    worklist = [(node, None) for node in reversed(tree.root_node.named_children)]
+    while worklist:
+        node, class_name = worklist.pop()
+        if node.type in CLASS_DECLARATIONS:
+            name = node.child_by_field_name("name").text.decode()
+            name = f"{class_name}${name}" if class_name else package + name
+            if (body := node.child_by_field_name("body")) is not None:
+                members = body.named_children
+                # The members of an enum are after its constants
+                for member in body.named_children:
+                    if member.type == "enum_body_declarations":
+                        members = member.named_children
+                worklist.extend((m, name) for m in reversed(members))
+        elif class_name and node.type in METHOD_DECLARATIONS:
+            is_method = node.type == "method_declaration"
+            params = _parameters(node)
+            returns = (
+                _type_name(
+                    node.child_by_field_name("type"),
+                    node.child_by_field_name("dimensions"),
+                )
+                if is_method
+                else None
+            )
+            method_name = node.child_by_field_name("name").text.decode()
+            try:
+                methodid = MethodId(
+                    class_name=class_name,
+                    method_name=method_name if is_method else "<init>",
+                    params=params,  # type: ignore
+                    return_type=returns,  # type: ignore
+                )
+                key = str(methodid)
+            except KeyError:
+                continue
+            body = node.child_by_field_name("body")
+            index[key] = SourceMethod(
+                start=node.start_byte,
+                end=node.end_byte,
+                body_start=node.start_byte if body is None else body.start_byte,
+                body_end=node.end_byte if body is None else body.end_byte,
+                line=node.start_point[0] + 1,
+                params=params,
+                **_count(body),
+            )
+    return index
+
+
+def source_index(sourcefile: Path) -> dict[str, SourceMethod]:
+    """The index of the methods of a source file, see `index_source`."""
+    from jpamb_utils import load_cached
+
+    return load_cached("sources", sourcefile, index_source)
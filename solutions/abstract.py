@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+""" A static analysis, using the interval analysis in `jpamb_utils.abstract`.
+
+Queries that the analysis proves can't happen are given a low probability,
+the rest are left to chance.
+"""
+
+import sys, logging
+
+from jpamb_utils import MethodId
+from jpamb_utils.abstract import verdicts
+
+l = logging
+l.basicConfig(level=logging.DEBUG)
+
+(name,) = sys.argv[1:]
+
+for query, possible in verdicts(MethodId.parse(name)).items():
+    l.debug(f"{query}: {'possible' if possible else 'impossible'}")
+    print(f"{query};{'50%' if possible else '5%'}")
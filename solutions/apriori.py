@@ -2,17 +2,30 @@
 """ The cheating solution. 
 
 This solution uses apriori knowledge about the distribution of the test-cases
-to gain an advantage.
+to gain an advantage, it reads the frequency of each query from the case
+database in `stats/cases.db`.
+
+When started without arguments it answers batch requests: it reads a method
+id per line from stdin, and ends each answer with a `---` line.
 """
 
-import sys, csv
+import sys
+
+from jpamb_utils.cases import CaseDB
+
+distribution = CaseDB.load_or_build().frequencies
+
+
+def predict(methodid):
+    print(f"Got {methodid}", file=sys.stderr)
 
-with open("stats/distribution.csv") as f:
-    distribution = list(csv.DictReader(f))[-1]
+    for k, v in distribution.items():
+        print(f"{k};{v:0.4%}")
 
-print(f"Got {sys.argv[1:]}", file=sys.stderr)
 
-for k, v in distribution.items():
-    if k == "method":
-        continue
-    print(f"{k};{v}")
+if sys.argv[1:]:
+    predict(sys.argv[1])
+else:
+    for line in sys.stdin:
+        predict(line.strip())
+        print("---", flush=True)
@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 """ A very stupid syntatic bytecode analysis, that only checks for assertion errors.
+
+It only reads the feature table of `jpamb_utils.features`, which `bin/build.py`
+writes next to the decompiled classes.
 """
 
 import sys, logging
 from jpamb_utils import MethodId
+from jpamb_utils.features import FeatureTable, Flag
 
 l = logging
 l.basicConfig(level=logging.DEBUG)
@@ -14,17 +18,11 @@ l.debug("check assertion")
 l.debug("read the method name")
 method = MethodId.parse(name)
 
-l.debug("looking up method")
-m = method.load()
+l.debug("looking up the features of the method")
+table = FeatureTable.load_or_build(logger=l)
 
 l.debug("trying to find an assertion error being created")
-for inst in m["code"]["bytecode"]:
-    if (
-        inst["opr"] == "invoke"
-        and inst["method"]["ref"]["name"] == "java/lang/AssertionError"
-    ):
-        break
-else:
+if not (method in table and table.has(method, Flag.NEW_ASSERTION_ERROR)):
     # I'm pretty sure the answer is no
     l.debug("did not find it")
     print("assertion error;20%")
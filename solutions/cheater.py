@@ -1,25 +1,20 @@
 # /usr/bin/env python
-""" This solution cheats by loading the `stats/cases.txt` file.
+""" This solution cheats by loading the case database in `stats/cases.db`.
 """
 
 import sys
 
+from jpamb_utils.cases import CaseDB
 
 methodid = sys.argv[1]
 
-queries = set()
+db = CaseDB.load_or_build()
 
-queries_in_method = set()
+queries_in_method = db.queries_of(methodid) if methodid in db else set()
+print(f"{methodid!r}, {sorted(queries_in_method)!r}", file=sys.stderr)
 
-with open("stats/cases.txt", "r") as f:
-    for line in f.readlines():
-        methodid_, case = line.split(" ", 1)
-        query = case.rsplit("->", 1)[1].strip()
-        print(f"{methodid_!r}, {query!r}", file=sys.stderr)
-        queries.add(query)
-        if methodid_ == methodid:
-            queries_in_method.add(query)
-
-for q in queries:
+for i, q in enumerate(db.queries):
+    if not any(mask & (1 << i) for mask in db.masks):
+        continue
     score = "100%" if q in queries_in_method else "0%"
     print(f"{q};{score}")
@@ -1,69 +1,38 @@
 #!/usr/bin/env python3
-""" The skeleton for writing an interpreter given the bytecode.
+""" An interpreter for the bytecode, using the engine in `jpamb_utils.interpreter`.
+
+Set the environment variable `LOGLEVEL=DEBUG` to trace each step. The results
+of calls of pure methods are saved in the cache folder, and reused by the
+next runs.
 """
 
-from dataclasses import dataclass
-import sys, logging
-from typing import Optional
+import sys, logging, os
 
-from jpamb_utils import InputParser, IntValue, MethodId
+from jpamb_utils import CACHE_FOLDER, InputParser, MethodId
+from jpamb_utils.interpreter import CallMemo, Code, Interpreter, Unsupported
 
 l = logging
-l.basicConfig(level=logging.DEBUG, format="%(message)s")
-
-
-@dataclass
-class SimpleInterpreter:
-    bytecode: list
-    locals: list
-    stack: list
-    pc: int = 0
-    done: Optional[str] = None
-
-    def interpet(self, limit=10):
-        for i in range(limit):
-            next = self.bytecode[self.pc]
-            l.debug(f"STEP {i}:")
-            l.debug(f"  PC: {self.pc} {next}")
-            l.debug(f"  LOCALS: {self.locals}")
-            l.debug(f"  STACK: {self.stack}")
-
-            if fn := getattr(self, "step_" + next["opr"], None):
-                fn(next)
-            else:
-                return f"can't handle {next['opr']!r}"
-
-            if self.done:
-                break
-        else:
-            self.done = "out of time"
-
-        l.debug(f"DONE {self.done}")
-        l.debug(f"  LOCALS: {self.locals}")
-        l.debug(f"  STACK: {self.stack}")
-
-        return self.done
-
-    def step_push(self, bc):
-        val = bc["value"]
-        if val is not None:
-            if val["type"] == "integer":
-                val = IntValue(val["value"])
-            else:
-                raise ValueError(f"Currently unknown value {bc}")
+l.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"), format="%(message)s")
 
-        self.stack.insert(0, val)
-        self.pc += 1
 
-    def step_return(self, bc):
-        if bc["type"] is not None:
-            self.stack.pop(0)
-        self.done = "ok"
+def trace(pc, stack, locals):
+    l.debug(f"  PC: {pc} {code.bytecode[pc]}")
+    l.debug(f"  LOCALS: {locals}")
+    l.debug(f"  STACK: {stack}")
 
 
 if __name__ == "__main__":
     methodid = MethodId.parse(sys.argv[1])
     inputs = InputParser.parse(sys.argv[2])
-    m = methodid.load()
-    i = SimpleInterpreter(m["code"]["bytecode"], [i.tolocal() for i in inputs], [])
-    print(i.interpet())
+    code = Code.load(methodid)
+    memo = CallMemo(folder=CACHE_FOLDER / "calls")
+    interpreter = Interpreter(memo=memo)
+    try:
+        result = interpreter.run(
+            code, inputs, trace=trace if l.getLogger().isEnabledFor(l.DEBUG) else None
+        )
+    except Unsupported as e:
+        result = str(e)
+    memo.save()
+    l.debug(f"DONE {result} in {interpreter.steps} steps")
+    print(result)
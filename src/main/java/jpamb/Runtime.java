@@ -1,5 +1,8 @@
 package jpamb;
 
+import java.io.BufferedReader;
+import java.io.IOException;
+import java.io.InputStreamReader;
 import java.lang.reflect.*;
 import java.util.ArrayList;
 import java.util.Arrays;
@@ -14,6 +17,12 @@ import jpamb.cases.*;
 /**
  * The runtime method runs a single test-case and print the result or the
  * exeception.
+ *
+ * Without arguments it prints all the test-cases, and with the --cases option
+ * only the test-cases of the given classes.
+ *
+ * With the --batch option, it instead reads test-cases from stdin, one per
+ * line, and prints the result of each.
  */
 public class Runtime {
   static List<Class<?>> caseclasses = List.of(
@@ -109,10 +118,86 @@ public class Runtime {
     return rparams;
   }
 
+  public static Method findMethod(String id) throws ClassNotFoundException, NoSuchMethodException {
+    Pattern pattern = Pattern.compile("(.*)\\.([^.(]*):\\((.*)\\)(.*)");
+    Matcher matcher = pattern.matcher(id);
+    if (!matcher.find()) {
+      throw new RuntimeException("Invalid method id: " + id);
+    }
+    String cls = matcher.group(1);
+    String mth = matcher.group(2);
+    String prams = matcher.group(3);
+    Method m = Class.forName(cls).getMethod(mth, parseMethodSignature(prams));
+    if (!Modifier.isStatic(m.getModifiers())) {
+      throw new RuntimeException("Expected " + id + " to be static");
+    }
+    return m;
+  }
+
+  public static ResultType run(Method m, Object[] params) throws IllegalAccessException {
+    try {
+      m.invoke(null, params);
+    } catch (InvocationTargetException e) {
+      return ResultType.fromThrowable(e.getCause());
+    }
+    return ResultType.SUCCESS;
+  }
+
+  /**
+   * Run the test-cases from stdin, each line is a method id and the input
+   * separated by a space. Each case is run on its own thread, and if it does
+   * not finish within the timeout we print '*' and exit, because there is no
+   * safe way to stop the thread. The caller should then restart the runtime
+   * with the remaining cases.
+   */
+  public static void batch(long timeout)
+      throws IOException, InterruptedException, ClassNotFoundException, NoSuchMethodException {
+    BufferedReader reader = new BufferedReader(new InputStreamReader(System.in));
+    String line;
+    while ((line = reader.readLine()) != null) {
+      String[] parts = line.split(" ", 2);
+      Method m = findMethod(parts[0]);
+      Object[] params = InputParser.parse(parts[1]);
+      System.err.printf("Running %s with %s%n", m, Arrays.toString(params));
+
+      String[] result = new String[] { "error" };
+      Thread worker = new Thread(() -> {
+        try {
+          result[0] = run(m, params).toString();
+        } catch (Throwable e) {
+          e.printStackTrace();
+        }
+      });
+      worker.setDaemon(true);
+      worker.start();
+      worker.join(timeout);
+
+      if (worker.isAlive()) {
+        System.out.println(ResultType.NON_TERMINATION);
+        System.out.flush();
+        System.exit(0);
+      }
+      System.out.println(result[0]);
+      System.out.flush();
+    }
+  }
+
   public static void main(String[] args)
-      throws ClassNotFoundException, NoSuchMethodException, IllegalAccessException {
-    if (args.length == 0) {
-      var mths = caseclasses.stream().flatMap(c -> Stream.of(c.getMethods())).toList();
+      throws ClassNotFoundException, NoSuchMethodException, IllegalAccessException,
+      IOException, InterruptedException {
+    if (args.length > 0 && args[0].equals("--batch")) {
+      batch(args.length > 1 ? Long.parseLong(args[1]) : 500);
+      return;
+    }
+    if (args.length == 0 || args[0].equals("--cases")) {
+      List<Class<?>> classes = caseclasses;
+      if (args.length > 0) {
+        classes = new ArrayList<>();
+        for (int i = 1; i < args.length; i++) {
+          classes.add(Class.forName(args[i]));
+        }
+      }
+      var mths = classes.stream().flatMap(c -> Stream.of(c.getMethods())).toList();
       for (Method m : mths) {
         for (Case c : cases(m)) {
           CaseContent content = CaseContent.parse(c.value());
@@ -126,28 +211,16 @@ public class Runtime {
       }
       return;
     }
-    String thecase = args[0];
-    Pattern pattern = Pattern.compile("(.*)\\.([^.(]*):\\((.*)\\)(.*)");
-    Matcher matcher = pattern.matcher(thecase);
-    if (matcher.find()) {
-      String cls = matcher.group(1);
-      String mth = matcher.group(2);
-      String prams = matcher.group(3);
-      Method m = Class.forName(cls).getMethod(mth, parseMethodSignature(prams));
-      if (!Modifier.isStatic(m.getModifiers())) {
-        throw new RuntimeException("Expected " + pattern + " to be static");
-      }
-      for (int i = 1; i < args.length; i++) {
-        Object[] params = InputParser.parse(args[i]);
-        System.err.printf("Running %s with %s%n", m, Arrays.toString(params));
-        try {
-          m.invoke(null, params);
-        } catch (InvocationTargetException e) {
-          System.out.println(ResultType.fromThrowable(e.getCause()));
-          return;
-        }
+    Method m = findMethod(args[0]);
+    for (int i = 1; i < args.length; i++) {
+      Object[] params = InputParser.parse(args[i]);
+      System.err.printf("Running %s with %s%n", m, Arrays.toString(params));
+      ResultType result = run(m, params);
+      if (result != ResultType.SUCCESS) {
+        System.out.println(result);
+        return;
       }
-      System.out.println(ResultType.SUCCESS);
     }
+    System.out.println(ResultType.SUCCESS);
   }
 }
@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+
+# The scripts in bin import their utils as a top-level module
+sys.path.insert(0, str(ROOT / "bin"))
+
+
+@pytest.fixture(autouse=True)
+def in_repository(monkeypatch):
+    """Run in the repository, where the cases and decompiled classes are."""
+    monkeypatch.chdir(ROOT)
@@ -0,0 +1,65 @@
+import pytest
+
+from jpamb_utils import MethodId
+from jpamb_utils.abstract import QUERIES, IntervalAnalysis, fixpoint
+from jpamb_utils.cfg import ControlFlowGraph
+
+INIT_ASSERTION_ERROR = {
+    "opr": "invoke",
+    "access": "special",
+    "method": {
+        "args": [],
+        "name": "<init>",
+        "ref": {"kind": "class", "name": "java/lang/AssertionError"},
+        "returns": None,
+    },
+}
+
+# try { return 1 / n; } catch (<catch type> e) { <handler> }
+DIVIDE = [
+    {"opr": "push", "value": {"type": "integer", "value": 1}},
+    {"opr": "load", "index": 0, "type": "int"},
+    {"opr": "binary", "operant": "div", "type": "int"},
+    {"opr": "return", "type": "int"},
+]
+
+RETURN_ZERO = [
+    {"opr": "store", "index": 1, "type": "ref"},
+    {"opr": "push", "value": {"type": "integer", "value": 0}},
+    {"opr": "return", "type": "int"},
+]
+
+ASSERT_FALSE = [
+    {"opr": "pop"},
+    {"opr": "new", "class": "java/lang/AssertionError"},
+    {"opr": "dup", "words": 1},
+    INIT_ASSERTION_ERROR,
+    {"opr": "throw"},
+]
+
+RETHROW = [{"opr": "throw"}]
+
+
+def verdicts(bytecode, catch_type):
+    methodid = MethodId.parse("jpamb.cases.Test.test:(I)I")
+    exceptions = [{"start": 0, "end": 4, "handler": 4, "catchType": catch_type}]
+    method = {"code": {"bytecode": bytecode, "max_locals": 2}}
+    cfg = ControlFlowGraph.build(bytecode, exceptions)
+    analysis = IntervalAnalysis(methodid, method, cfg)
+    fixpoint(cfg, analysis)
+    return {q for q in QUERIES if q in analysis.queries}
+
+
+@pytest.mark.parametrize(
+    "handler, catch_type, queries",
+    [
+        (RETURN_ZERO, "java/lang/ArithmeticException", {"ok"}),
+        (RETURN_ZERO, "java/lang/RuntimeException", {"ok"}),
+        (RETURN_ZERO, None, {"ok"}),
+        (RETURN_ZERO, "java/lang/NullPointerException", {"ok", "divide by zero"}),
+        (ASSERT_FALSE, "java/lang/ArithmeticException", {"ok", "assertion error"}),
+        (RETHROW, "java/lang/ArithmeticException", {"ok", "divide by zero"}),
+    ],
+)
+def test_handlers(handler, catch_type, queries):
+    assert verdicts(DIVIDE + handler, catch_type) == queries
@@ -0,0 +1,99 @@
+import pytest
+
+from jpamb_utils import (
+    BoolValue,
+    CharListValue,
+    InputParser,
+    IntListValue,
+    IntValue,
+)
+from jpamb_utils.cases import CaseDB, stamp
+
+
+@pytest.mark.parametrize(
+    "input, values",
+    [
+        ("()", []),
+        ("(0)", [IntValue(0)]),
+        ("(-2147483648, 2147483647)", [IntValue(-(2**31)), IntValue(2**31 - 1)]),
+        ("( 1 ,\t2 )", [IntValue(1), IntValue(2)]),
+        ("(true, false)", [BoolValue(True), BoolValue(False)]),
+        ("([I:])", [IntListValue([])]),
+        ("([I: ])", [IntListValue([])]),
+        ("([I:1, -2 ,3])", [IntListValue([1, -2, 3])]),
+        ("([C:])", [CharListValue([])]),
+        ("([C:'h', 'i'])", [CharListValue([ord("h"), ord("i")])]),
+        ("([C:',', ' '])", [CharListValue([ord(","), ord(" ")])]),
+        ("([I:1], [C:'a'], 3)", [IntListValue([1]), CharListValue([97]), IntValue(3)]),
+    ],
+)
+def test_parse_input(input, values):
+    assert InputParser.parse(input) == values
+
+
+@pytest.mark.parametrize(
+    "input",
+    [
+        "",
+        "(",
+        "(1",
+        "(1,)",
+        "(,)",
+        "(1) 2",
+        "(x)",
+        "('a')",
+        "([I:1,])",
+        "([I:1)",
+        "([I:'a'])",
+        "([C:1])",
+        "([X:1])",
+        "([I:2147483648])",
+    ],
+)
+def test_parse_malformed_input(input):
+    with pytest.raises(ValueError):
+        InputParser.parse(input)
+
+
+LINES = [
+    "jpamb.cases.Simple.divideByN:(I)I (0) -> divide by zero",
+    "jpamb.cases.Simple.divideByN:(I)I (1) -> ok",
+    "jpamb.cases.Arrays.arraySpellsHello:([C)V ([C:'h', 'i']) -> assertion error",
+    "jpamb.cases.Loops.forever:()V () -> *",
+]
+
+
+def test_case_db_round_trip(tmp_path):
+    db = CaseDB.build(LINES, source=(1, 2))
+    db.write(tmp_path / "cases.db")
+    read = CaseDB.read(tmp_path / "cases.db")
+
+    assert read.methods == db.methods
+    assert read.source == (1, 2)
+    assert read.frequencies == db.frequencies
+    assert list(read.masks) == list(db.masks)
+    for method in db.methods:
+        assert read.cases(method) == db.cases(method)
+        assert read.queries_of(method) == db.queries_of(method)
+    assert read.cases("jpamb.cases.Arrays.arraySpellsHello:([C)V") == [
+        ("([C:'h', 'i'])", (CharListValue([104, 105]),), "assertion error")
+    ]
+    assert read.frequencies["ok"] == 1 / 3
+
+
+def test_case_db_load_or_build(tmp_path):
+    source = tmp_path / "cases.txt"
+    source.write_text("\n".join(LINES[:2]) + "\n")
+
+    db = CaseDB.load_or_build(tmp_path)
+    assert db.source == stamp(source)
+    assert CaseDB.load(tmp_path).source == db.source
+
+    # A changed cases.txt is read again, and the database written again
+    source.write_text("\n".join(LINES) + "\n")
+    db = CaseDB.load_or_build(tmp_path)
+    assert "jpamb.cases.Loops.forever:()V" in db
+    assert "jpamb.cases.Loops.forever:()V" in CaseDB.load(tmp_path)
+
+    (tmp_path / "cases.db").write_bytes(b"garbage")
+    assert len(CaseDB.load_or_build(tmp_path).methods) == 3
@@ -0,0 +1,26 @@
+import doctest
+import importlib
+
+import pytest
+
+import jpamb_utils
+
+MODULES = [
+    "jpamb_utils.abstract",
+    "jpamb_utils.cases",
+    "jpamb_utils.cfg",
+    "jpamb_utils.features",
+    "jpamb_utils.interpreter",
+    "jpamb_utils.lanes",
+    "jpamb_utils.source",
+]
+
+
+@pytest.mark.parametrize("name", MODULES)
+def test_doctests(name):
+    # The examples use the names of `jpamb_utils`
+    module = importlib.import_module(name)
+    names = {n: v for n, v in vars(jpamb_utils).items() if not n.startswith("_")}
+    result = doctest.testmod(module, extraglobs=names, optionflags=doctest.ELLIPSIS)
+    assert result.attempted > 0
+    assert result.failed == 0
@@ -0,0 +1,41 @@
+import os
+import shutil
+
+from jpamb_utils.features import FeatureTable, Flag
+
+ASSERT_FALSE = "jpamb.cases.Simple.assertFalse:()V"
+
+
+def test_feature_table_round_trip(tmp_path):
+    table = FeatureTable.build()
+    table.write(tmp_path / "features.db")
+    read = FeatureTable.read(tmp_path / "features.db")
+
+    assert read == table
+    assert read.has(ASSERT_FALSE, Flag.NEW_ASSERTION_ERROR)
+    assert read.count("jpamb.cases.Simple.divideByN:(I)I", "binary") == 1
+    for method in table.methods:
+        assert read.histogram(method) == table.histogram(method)
+        assert read.calls_of(method) == table.calls_of(method)
+
+
+def test_feature_table_load_or_build(tmp_path):
+    decompiled = tmp_path / "decompiled"
+    shutil.copytree("decompiled", decompiled, ignore=shutil.ignore_patterns("*.db"))
+
+    table = FeatureTable.load_or_build(decompiled)
+    assert FeatureTable.load(decompiled) == table
+
+    # A changed class is read again, and the table written again
+    simple = decompiled / "jpamb" / "cases" / "Simple.json"
+    os.utime(simple, ns=(0, 0))
+    assert FeatureTable.load_or_build(decompiled).sources != table.sources
+    assert FeatureTable.load(decompiled).sources["jpamb/cases/Simple.json"][1] == 0
+
+    # A removed class is no longer in the table
+    simple.unlink()
+    assert ASSERT_FALSE not in FeatureTable.load_or_build(decompiled)
+    assert ASSERT_FALSE not in FeatureTable.load(decompiled)
+
+    (decompiled / "features.db").write_bytes(b"garbage")
+    assert len(FeatureTable.load_or_build(decompiled).methods) > 0
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pytest
+
+from jpamb_utils.cases import CaseDB
+from jpamb_utils.interpreter import Code, Interpreter
+from jpamb_utils.lanes import LaneInterpreter
+
+# Enough steps for all the cases, but the lanes only find infinite loops
+# at the limit
+LIMIT = 100_000
+
+STATS = Path(__file__).parent.parent / "stats"
+
+METHODS = CaseDB.load_or_build(STATS).all_cases()
+
+
+@pytest.mark.parametrize("methodid, cases", METHODS, ids=[str(m) for m, _ in METHODS])
+def test_interpreter(methodid, cases):
+    code = Code.load(methodid)
+    for input, values, result in cases:
+        assert Interpreter(limit=LIMIT).run(code, list(values)) == result, input
+
+
+@pytest.mark.parametrize("methodid, cases", METHODS, ids=[str(m) for m, _ in METHODS])
+def test_lanes(methodid, cases):
+    code = Code.load(methodid)
+    lanes = LaneInterpreter(limit=LIMIT)
+    results = lanes.run(code, [list(values) for _, values, _ in cases])
+    for i, (input, _, result) in enumerate(cases):
+        if results[i] is None:
+            # The lanes don't call methods
+            assert "can't call" in str(lanes.errors[i]), input
+        else:
+            assert results[i] == result, input
@@ -0,0 +1,12 @@
+from jpamb_utils import IntValue, MethodId
+from jpamb_utils.interpreter import Code
+from jpamb_utils.lanes import LaneInterpreter
+
+
+def test_array_length_limit_per_lane():
+    code = Code.load(MethodId.parse("jpamb.cases.Calls.generatePrimeArray:(I)[I"))
+    lanes = LaneInterpreter(limit=1000)
+    inputs = [[IntValue(0)], [IntValue(1_000_000)], [IntValue(-1)]]
+    assert lanes.run(code, inputs) == ["out of bounds", None, "assertion error"]
+    assert lanes.errors.keys() == {1}
+    assert "longer than the step limit" in str(lanes.errors[1])
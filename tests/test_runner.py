@@ -0,0 +1,166 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from utils import run_cmd, setup_logger
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="posix only")
+
+logger = setup_logger(0)
+
+
+def usage_of(cmd, **kwargs):
+    usage = []
+    run_cmd(cmd, timeout=10, logger=logger, log_usage=usage.append, **kwargs)
+    return usage[0]
+
+
+def test_output():
+    stdout, elapsed = run_cmd(
+        ["sh", "-c", "echo out; echo err >&2; pwd"],
+        timeout=10,
+        logger=logger,
+        cwd="/",
+    )
+    assert stdout == "out\n/"
+    assert elapsed > 0
+
+
+def test_env():
+    stdout, _ = run_cmd(
+        ["sh", "-c", "echo $JPAMB"], timeout=10, logger=logger, env={"JPAMB": "x"}
+    )
+    assert stdout == "x"
+
+
+def test_failure():
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        run_cmd(["sh", "-c", "echo oops >&2; exit 3"], timeout=10, logger=logger)
+    assert e.value.returncode == 3
+    assert "oops" in e.value.stderr
+
+
+def test_missing_executable():
+    with pytest.raises(FileNotFoundError):
+        run_cmd(["jpamb-does-not-exist"], timeout=10, logger=logger)
+
+
+def test_timeout_kills_the_process_group():
+    with pytest.raises(subprocess.TimeoutExpired):
+        # The child of the shell keeps the pipes open, unless it is killed too
+        run_cmd(["sh", "-c", "sleep 10; echo done"], timeout=0.2, logger=logger)
+
+
+def test_max_rss_does_not_include_the_harness():
+    before = usage_of(["true"]).max_rss
+    ballast = bytearray(200_000_000)
+    after = usage_of(["true"]).max_rss
+    del ballast
+    assert after < before + 10_000_000
+    assert after < 50_000_000
+
+
+def test_max_rss_of_the_tool():
+    code = "b = bytearray(100_000_000); b[::4096] = b'x' * len(b[::4096])"
+    assert usage_of([sys.executable, "-c", code]).max_rss > 100_000_000
+
+
+ECHO = r"""
+import sys
+for line in sys.stdin:
+    if line.strip() == "crash":
+        print("partial", flush=True)
+        sys.exit(4)
+    if line.strip() == "hang":
+        input()
+    print("echo", line.strip())
+    print("---", flush=True)
+"""
+
+
+def test_batch_tool():
+    from utils import BatchTool
+
+    with BatchTool([sys.executable, "-c", ECHO], logger=logger) as tool:
+        assert tool.request("a", timeout=10)[0] == "echo a"
+        assert tool.request("b", timeout=10)[0] == "echo b"
+
+        with pytest.raises(subprocess.TimeoutExpired):
+            tool.request("hang", timeout=0.2)
+        assert tool.request("c", timeout=10)[0] == "echo c"
+
+        with pytest.raises(subprocess.CalledProcessError) as e:
+            tool.request("crash", timeout=10)
+        assert e.value.returncode == 4
+        assert e.value.output == "partial"
+        assert tool.request("d", timeout=10)[0] == "echo d"
+
+
+def test_limits_apply_before_the_exec():
+    from utils import Limits
+
+    limits = Limits.parse({"files": 64})
+    stdout, _ = run_cmd(
+        ["sh", "-c", "ulimit -n"], timeout=10, logger=logger, limits=limits
+    )
+    assert stdout == "64"
+
+
+@pytest.mark.parametrize(
+    "limit, code",
+    [
+        ("cpu", "while True: pass"),
+        ("memory", "b = bytearray(1_000_000_000)"),
+    ],
+)
+def test_limit_exceeded(limit, code):
+    from utils import Limits, ResourceLimitExceeded
+
+    limits = Limits.parse({"cpu": 1, "memory": "500M"})
+    with pytest.raises(ResourceLimitExceeded) as e:
+        run_cmd([sys.executable, "-c", code], timeout=10, logger=logger, limits=limits)
+    assert e.value.limit == limit
+
+
+FAKE_JAVA = """#!/usr/bin/env python3
+import sys
+for line in sys.stdin:
+    method = line.split()[0]
+    if "crash" in method:
+        print("Exception in thread main: boom", file=sys.stderr)
+        sys.exit(1)
+    print("*" if "hang" in method else "ok", flush=True)
+    if "hang" in method:
+        sys.exit(0)
+"""
+
+
+def test_run_cases_batch(tmp_path, monkeypatch):
+    from pathlib import Path
+    from utils import QUERIES, Case, Input, MethodId, Suite
+
+    java = tmp_path / "java"
+    java.write_text(FAKE_JAVA.replace("python3", sys.executable, 1))
+    java.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+
+    def case(name):
+        return Case(MethodId.parse(f"jpamb.cases.Simple.{name}:()V"), Input(()), "ok")
+
+    suite = Suite(Path(__file__).parent.parent, QUERIES, logger)
+    cases = [case("a"), case("crash"), case("b"), case("hang"), case("c")]
+    warnings = []
+    sink = logger.add(warnings.append, level="WARNING")
+    try:
+        results = [r for _, r in suite.run_cases_batch(cases, 0.5)]
+    finally:
+        logger.remove(sink)
+    assert results == ["ok", None, "ok", "*", "ok"]
+    assert any("boom" in w for w in warnings)
+
+    # An abandoned runtime is killed
+    results = suite.run_cases_batch([case("a")] * 1000, 0.5)
+    next(results)
+    results.close()
@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+
+import pytest
+
+from utils import QUERIES, Suite, setup_logger
+
+logger = setup_logger(0)
+
+FAKE_JVM2JSON = """#!/usr/bin/env python3
+import json, sys
+name = sys.argv[1].split("classes/")[1].removesuffix(".class")
+print(json.dumps({"name": name, "methods": []}))
+"""
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="posix only")
+def test_decompile_prunes_deleted_classfiles(tmp_path, monkeypatch):
+    jvm2json = tmp_path / "bin" / "jvm2json"
+    jvm2json.parent.mkdir()
+    jvm2json.write_text(FAKE_JVM2JSON.replace("python3", sys.executable, 1))
+    jvm2json.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{jvm2json.parent}:{os.environ['PATH']}")
+
+    suite = Suite(tmp_path, QUERIES, logger)
+    for name in ["jpamb/cases/A", "jpamb/cases/B"]:
+        clazz = (suite.classfiles / name).with_suffix(".class")
+        clazz.parent.mkdir(parents=True, exist_ok=True)
+        clazz.write_bytes(name.encode())
+    suite.decompile()
+
+    decompiled = tmp_path / "decompiled" / "jpamb" / "cases"
+    assert json.loads((decompiled / "A.json").read_text())["name"] == "jpamb/cases/A"
+    assert (decompiled / "A.json").read_text().startswith("{\n  ")
+
+    (suite.classfiles / "jpamb/cases/B.class").unlink()
+    suite.decompile()
+    assert not (decompiled / "B.json").exists()
+    manifest = json.loads((tmp_path / "target" / "decompiled.json").read_text())
+    assert manifest.keys() == {"jpamb/cases/A.class"}
+
+
+def test_incremental_update_matches_full_update(tmp_path, monkeypatch):
+    import utils
+
+    stats = utils.Path(__file__).parent.parent / "stats"
+    cases = (stats / "cases.txt").read_text()
+    lines = cases.splitlines(keepends=True)
+
+    def class_of(line):
+        return line.split(" ", 1)[0].rsplit(".", 1)[0]
+
+    # Before the change Simple had fewer cases with other results, and there
+    # was a class Gone, which is deleted.
+    simple = [line for line in lines if class_of(line) == "jpamb.cases.Simple"]
+    old = [line for line in lines if line not in simple]
+    old += [line.replace("-> ok", "-> divide by zero") for line in simple[::2]]
+    old += ["jpamb.cases.Gone.gone:()V () -> ok\n"]
+    output = old
+
+    def runtime(*args, **kwargs):
+        if args[:1] == ("--cases",):
+            return "".join(line for line in output if class_of(line) in args[1:])
+        return "".join(reversed(output))
+
+    monkeypatch.setattr(utils, "runtime", runtime)
+
+    def suite_with(folder, classes):
+        suite = Suite(folder, QUERIES, logger)
+        for name, content in classes.items():
+            clazz = suite.classfiles / f"jpamb/cases/{name}.class"
+            clazz.parent.mkdir(parents=True, exist_ok=True)
+            clazz.write_text(content)
+        return suite
+
+    names = {class_of(line).rsplit(".", 1)[1] for line in old}
+    incremental = suite_with(tmp_path / "incremental", {n: "old" for n in names})
+    assert incremental.update_cases() is None
+
+    output = lines
+    (incremental.classfiles / "jpamb/cases/Gone.class").unlink()
+    (incremental.classfiles / "jpamb/cases/Simple.class").write_text("new")
+    updated = incremental.update_cases()
+    assert {c.methodid.class_name for c in updated} == {"jpamb.cases.Simple"}
+
+    full = suite_with(tmp_path / "full", {n: "new" for n in names - {"Gone"}})
+    assert full.update_cases(incremental=False) is None
+
+    for file in ["cases.txt", "distribution.csv"]:
+        expected = (full.stats_folder() / file).read_bytes()
+        assert (incremental.stats_folder() / file).read_bytes() == expected
+    for file in ["cases.txt", "distribution.csv"]:
+        expected = (stats / file).read_bytes()
+        assert (incremental.stats_folder() / file).read_bytes() == expected